@@ -0,0 +1,171 @@
+import asyncio, hashlib, os, time, traceback
+from contextlib import suppress
+from urllib.parse import urlparse
+
+import aiohttp
+
+MANIFEST_SUFFIXES = (".m3u8", ".m3u", ".mpd") # HLS / DASH playlists, which would be stored instead of the audio
+
+class NotCacheable(RuntimeError):
+    pass
+
+class AudioTooLarge(NotCacheable):
+    pass
+
+def is_direct_media_url(url: str | None) -> bool:
+    parsed = urlparse(url or "")
+    return parsed.scheme in ("http", "https") and not parsed.path.lower().endswith(MANIFEST_SUFFIXES)
+
+class AudioCache:
+    def __init__(self, directory: str, max_bytes: int, max_file_bytes: int, chunk_bytes: int = 8 * 1024 * 1024, downloads: int = 2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.chunk_bytes = chunk_bytes
+        self._downloads = asyncio.Semaphore(downloads)
+        self.stats = {"hits": 0, "downloads": 0, "download_bytes": 0, "evictions": 0, "skipped": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, webpage_url: str) -> str:
+        name = hashlib.sha1(webpage_url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".audio")
+
+    def get(self, webpage_url: str | None) -> str | None:
+        if not webpage_url:
+            return None
+        path = self.path_for(webpage_url)
+        try:
+            # The mtime is the LRU clock, so it survives restarts and is shared by every process using the directory.
+            os.utime(path)
+        except OSError:
+            return None
+        self.stats["hits"] += 1
+        return path
+
+    def has(self, webpage_url: str | None) -> bool:
+        return bool(webpage_url) and os.path.exists(self.path_for(webpage_url))
+
+    async def _fetch_range(self, session: aiohttp.ClientSession, url: str, headers: dict, start: int) -> tuple[bytes, int | None]:
+        req_headers = {**headers, "Range": f"bytes={start}-{start + self.chunk_bytes - 1}"}
+        async with session.get(url, headers=req_headers, timeout=aiohttp.ClientTimeout(total=120)) as resp:
+            resp.raise_for_status()
+            total = None
+            if resp.status == 206:
+                content_range = resp.headers.get("Content-Range", "")
+                size = content_range.rsplit("/", 1)[-1]
+                if size.isdigit():
+                    total = int(size)
+            elif resp.content_length is not None:
+                total = resp.content_length
+            if total is not None and total > self.max_file_bytes:
+                raise AudioTooLarge(f"{total} bytes is over the audio cache file limit")
+            if resp.status != 206 and start:
+                raise RuntimeError("Server stopped honouring range requests mid-download")
+            data = await resp.read()
+            if resp.status != 206:
+                total = len(data)
+            return data, total
+
+    async def _check_head(self, session: aiohttp.ClientSession, url: str, headers: dict):
+        try:
+            async with session.head(url, headers=headers, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                if resp.status >= 400:
+                    # Some CDNs refuse HEAD; the range responses are size-checked as well.
+                    return
+                if "mpegurl" in resp.headers.get("Content-Type", "").lower():
+                    raise NotCacheable("HLS playlist, not a media file")
+                if resp.content_length is not None and resp.content_length > self.max_file_bytes:
+                    raise AudioTooLarge(f"{resp.content_length} bytes is over the audio cache file limit")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return
+
+    async def download(self, session: aiohttp.ClientSession, webpage_url: str, url: str, headers: dict | None = None) -> str | None:
+        path = self.path_for(webpage_url)
+        if os.path.exists(path):
+            return path
+        if not is_direct_media_url(url):
+            self.stats["skipped"] += 1
+            return None
+
+        async with self._downloads:
+            try:
+                await self._check_head(session, url, headers or {})
+            except NotCacheable:
+                self.stats["skipped"] += 1
+                return None
+            part = f"{path}.{os.getpid()}.part"
+            try:
+                with open(part, "wb") as f:
+                    # Bounded range requests keep googlevideo from throttling one long response down to playback speed.
+                    start, total = 0, None
+                    while total is None or start < total:
+                        data, total = await self._fetch_range(session, url, headers or {}, start)
+                        if not data:
+                            break
+                        await asyncio.to_thread(f.write, data)
+                        start += len(data)
+                        if start > self.max_file_bytes:
+                            raise AudioTooLarge(f"{start} bytes is over the audio cache file limit")
+                os.replace(part, path)
+            except AudioTooLarge:
+                with suppress(OSError):
+                    os.remove(part)
+                self.stats["skipped"] += 1
+                return None
+            except BaseException:
+                with suppress(OSError):
+                    os.remove(part)
+                raise
+
+        self.stats["downloads"] += 1
+        self.stats["download_bytes"] += start
+        return path
+
+    def usage(self) -> tuple[int, int]:
+        files = total = 0
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.name.endswith(".audio"):
+                    files += 1
+                    total += item.stat().st_size
+        return files, total
+
+    def evict(self) -> int:
+        cached = []
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if not item.name.endswith(".audio"):
+                    continue
+                with suppress(OSError):
+                    st = item.stat()
+                    cached.append((st.st_mtime, st.st_size, item.path))
+
+        total = sum(size for _, size, _ in cached)
+        removed = 0
+        for _, size, path in sorted(cached):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Still open for playback on Windows; it becomes the oldest candidate again next pass.
+                traceback.print_exc()
+                continue
+            total -= size
+            removed += 1
+        self.stats["evictions"] += removed
+        return removed
+
+    def clear_partials(self, older_than: float = 3600) -> int:
+        removed = 0
+        cutoff = time.time() - older_than
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.name.endswith(".part"):
+                    with suppress(OSError):
+                        if item.stat().st_mtime < cutoff:
+                            os.remove(item.path)
+                            removed += 1
+        return removed
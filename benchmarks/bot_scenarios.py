@@ -0,0 +1,531 @@
+import argparse, asyncio, gc, hashlib, json, os, random, sys, tempfile, threading, time, tracemalloc
+from itertools import islice
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web
+import discord
+
+from metrics import Histogram, summaries
+
+SCENARIOS = ("cache_load", "playlist_import", "youtube_playlist", "concurrent_play", "skip_storm", "memory")
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def current_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+def video_id(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:11]
+
+class StubYDL:
+    # Stands in for YoutubeDL.extract_info: same result shapes, a fixed delay, no network.
+    def __init__(self, media_base: str, latency: float, jitter: float = 0.25, flat: bool = False, playlist_size: int = 0, stats: dict | None = None):
+        self.media_base = media_base
+        self.latency = latency
+        self.jitter = jitter
+        self.flat = flat
+        self.playlist_size = playlist_size
+        self.stats = stats if stats is not None else {}
+        self.params = {}
+
+    def _info(self, vid: str, title: str) -> dict:
+        return {
+            "id": vid,
+            "url": f"{self.media_base}/media/{vid}?expire={int(time.time()) + 6 * 3600}",
+            "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+            "title": title,
+            "duration": 180,
+            "uploader": "Benchmark",
+            "acodec": "opus",
+            "abr": 128,
+        }
+
+    def extract_info(self, query: str, download: bool = False) -> dict:
+        rng = random.Random(query)
+        time.sleep(max(0.0, self.latency * (1 + rng.uniform(-self.jitter, self.jitter))))
+        self.stats["extractions"] = self.stats.get("extractions", 0) + 1
+        if "list=" in query:
+            start, _, end = (self.params.get("playlist_items") or f"1-{self.playlist_size}").partition("-")
+            vids = [video_id(f"{query} {i}") for i in range(int(start), min(int(end), self.playlist_size) + 1)]
+            return {"title": "Benchmark playlist", "entries": [
+                {"id": vid, "url": f"https://www.youtube.com/watch?v={vid}", "title": f"Track {vid}", "duration": 180} for vid in vids
+            ]}
+        if query.startswith("ytsearch"):
+            terms = query.split(":", 1)[1]
+            vid = video_id(terms.lower())
+            if self.flat:
+                return {"entries": [{"id": vid, "url": f"https://www.youtube.com/watch?v={vid}", "title": terms}]}
+            return {"entries": [self._info(vid, terms)]}
+        vid = (parse_qs(urlparse(query).query).get("v") or [video_id(query)])[0]
+        return self._info(vid, f"Track {vid}")
+
+class StubSource(discord.AudioSource):
+    FRAME = b"\xf8\xff\xfe"
+
+    def __init__(self, frames: int):
+        self.remaining = frames
+
+    def read(self) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        self.remaining -= 1
+        return self.FRAME
+
+    def is_opus(self) -> bool:
+        return True
+
+class FakeVoiceClient:
+    # Consumes frames on its own thread like discord.py's AudioPlayer and calls `after` the same way.
+    def __init__(self, frame_interval: float):
+        self.frame_interval = frame_interval
+        self.channel = None
+        self.frames = 0
+        self.source = None
+        self._end = threading.Event()
+        self._end.set()
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return not self._end.is_set() and self._resumed.is_set()
+
+    def is_paused(self) -> bool:
+        return not self._end.is_set() and not self._resumed.is_set()
+
+    def play(self, source: discord.AudioSource, *, after=None, **_kwargs):
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._end = end = threading.Event()
+        self._resumed.set()
+
+        def run():
+            while not end.is_set():
+                self._resumed.wait()
+                if not source.read():
+                    break
+                self.frames += 1
+                if self.frame_interval:
+                    time.sleep(self.frame_interval)
+            # Like AudioPlayer: the player counts as stopped before `after` runs, so it can start the next track.
+            end.set()
+            source.cleanup()
+            if after is not None:
+                after(None)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        self._end.set()
+        self._resumed.set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    async def disconnect(self, force: bool = False):
+        self.stop()
+
+class FakeAvatar:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeUser:
+    bot = False
+    display_avatar = FakeAvatar()
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+class FakeMessage:
+    async def edit(self, **_kwargs):
+        return self
+
+    async def reply(self, *_args, **_kwargs):
+        return FakeMessage()
+
+    async def delete(self):
+        pass
+
+class FakeFollowup:
+    async def send(self, *_args, **_kwargs):
+        return FakeMessage()
+
+class FakeInteraction:
+    def __init__(self, guild_id: int, user_id: int = 1):
+        self.guild_id = guild_id
+        self.user = FakeUser(user_id)
+        self.channel = None
+        self.followup = FakeFollowup()
+
+class FakeAttachment:
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self.url = f"https://cdn.invalid/{filename}"
+        self._data = data
+
+    async def read(self) -> bytes:
+        return self._data
+
+def percentiles(samples: list[float]) -> dict:
+    hist = Histogram(window=max(1, len(samples)))
+    for s in samples:
+        hist.observe(s)
+    summary = hist.summary()
+    return {k: round(v * 1000, 2) for k, v in summary.items() if k in ("p50", "p95", "p99", "max")}
+
+async def start_media_server() -> tuple[web.AppRunner, str]:
+    async def media(_request: web.Request) -> web.Response:
+        return web.Response(status=200, content_type="audio/webm")
+
+    app = web.Application()
+    app.router.add_route("*", "/media/{vid}", media)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+extractor_stats: dict[str, int] = {}
+
+def install_stubs(bot, media_base: str, args):
+    stream = StubYDL(media_base, args.latency, stats=extractor_stats)
+    flat = StubYDL(media_base, args.latency, flat=True, stats=extractor_stats)
+    bot.extraction_service = None
+    bot.stream_ydl, bot.search_ydl = stream, flat
+    bot._ydl_pools.clear()
+    for profile, stub in (("stream", stream), ("flat", flat), ("soundcloud", stream)):
+        pool = asyncio.Queue()
+        for _ in range(max(1, bot.EXTRACTOR_POOL_SIZE)):
+            pool.put_nowait(stub)
+        bot._ydl_pools[profile] = pool
+    # Playlist paging sets per-call params, so each pooled slot needs its own instance.
+    pool = bot._ydl_pools["playlist"] = asyncio.Queue()
+    for _ in range(max(1, bot.EXTRACTOR_POOL_SIZE)):
+        pool.put_nowait(StubYDL(media_base, args.latency, flat=True, playlist_size=args.youtube_playlist, stats=extractor_stats))
+    bot._make_audio_source = lambda item, source, local=False: StubSource(args.frames)
+    bot.PREWARM_SECONDS = 0
+
+async def wait_for(predicate, timeout: float = 30.0, interval: float = 0.001):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Benchmark condition not reached")
+        await asyncio.sleep(interval)
+
+def reset_bot(bot):
+    for player in list(bot.players.values()):
+        if player.voice_client:
+            player.voice_client.stop()
+    bot.players.clear()
+    bot.cache_store.clear()
+    bot._inflight.clear()
+
+async def scenario_cache_load(bot, media_base: str, args) -> dict:
+    stub = StubYDL(media_base, 0)
+    entries = []
+    for i in range(args.cache_entries):
+        info = stub._info(video_id(f"cached {i}"), f"Cached track {i}")
+        info.pop("id")
+        info["keys"] = [f"cached track {i}", info["webpage_url"]]
+        info["hits"] = i % 17
+        entries.append(info)
+    with open(bot.CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+
+    load_times = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        bot.load_cache()
+        load_times.append(time.perf_counter() - t0)
+
+    store_times = []
+    t0 = time.perf_counter()
+    for i in range(args.cache_entries // 10):
+        info = stub._info(video_id(f"stored {i}"), f"Stored track {i}")
+        s0 = time.perf_counter()
+        bot._store_cache_entry(info, f"stored track {i}")
+        store_times.append(time.perf_counter() - s0)
+    store_total = time.perf_counter() - t0
+    await bot._flush_cache()
+
+    return {
+        "entries": len(bot.cache_store),
+        "load_s": round(min(load_times), 3),
+        "load_entries_per_s": round(args.cache_entries / min(load_times)),
+        "store_entries_per_s": round(len(store_times) / store_total),
+        "store_ms": percentiles(store_times),
+    }
+
+async def scenario_playlist_import(bot, media_base: str, args) -> dict:
+    reset_bot(bot)
+    player = bot.get_player(1)
+    player.voice_client = FakeVoiceClient(args.frame_interval)
+    lines = [f"https://www.youtube.com/watch?v={video_id(f'playlist {i}')}" for i in range(args.playlist_lines)]
+    attachment = FakeAttachment("bench.txt", "\n".join(lines).encode("utf-8"))
+
+    extractions = extractor_stats.get("extractions", 0)
+    t0 = time.perf_counter()
+    await bot._handle_playlist_add(FakeInteraction(1), attachment, False)
+    elapsed = time.perf_counter() - t0
+    queued = len(player.queue) + (1 if player.history else 0)
+    player.voice_client.stop()
+    return {
+        "lines": args.playlist_lines,
+        "queued": queued,
+        "total_s": round(elapsed, 3),
+        "lines_per_s": round(args.playlist_lines / elapsed, 1),
+        "extractions": extractor_stats.get("extractions", 0) - extractions,
+    }
+
+async def scenario_youtube_playlist(bot, media_base: str, args) -> dict:
+    reset_bot(bot)
+    player = bot.get_player(1)
+    player.voice_client = FakeVoiceClient(args.frame_interval)
+    url = "https://www.youtube.com/playlist?list=PLbenchmark"
+
+    extractions = extractor_stats.get("extractions", 0)
+    t0 = time.perf_counter()
+    task = asyncio.create_task(bot._handle_add(FakeInteraction(1), url, False))
+    await wait_for(lambda: player.voice_client.is_playing())
+    first_play = time.perf_counter() - t0
+    await task
+    elapsed = time.perf_counter() - t0
+    queued = len(player.queue) + (1 if player.history else 0)
+    player.voice_client.stop()
+    return {
+        "tracks": args.youtube_playlist,
+        "queued": queued,
+        "first_play_s": round(first_play, 3),
+        "total_s": round(elapsed, 3),
+        "extractions": extractor_stats.get("extractions", 0) - extractions,
+    }
+
+async def scenario_concurrent_play(bot, media_base: str, args) -> dict:
+    reset_bot(bot)
+    guilds = max(1, args.guilds)
+    for gid in range(1, guilds + 1):
+        bot.get_player(gid).voice_client = FakeVoiceClient(args.frame_interval)
+
+    # Every query is asked twice, so half the calls exercise single-flight or cache hits.
+    queries = [f"benchmark song {i % (args.plays // 2 or 1)}" for i in range(args.plays)]
+    latencies = []
+
+    async def one(i: int, query: str):
+        t0 = time.perf_counter()
+        await bot._handle_add(FakeInteraction(1 + i % guilds, user_id=i), query, False, t0)
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i, q) for i, q in enumerate(queries)))
+    elapsed = time.perf_counter() - t0
+    playing = sum(1 for p in bot.players.values() if p.voice_client and p.voice_client.is_playing())
+    for p in bot.players.values():
+        p.voice_client.stop()
+    return {
+        "plays": args.plays,
+        "guilds": guilds,
+        "total_s": round(elapsed, 3),
+        "plays_per_s": round(args.plays / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+        "guilds_playing": playing,
+    }
+
+async def scenario_skip_storm(bot, media_base: str, args) -> dict:
+    reset_bot(bot)
+    player = bot.get_player(1)
+    vc = player.voice_client = FakeVoiceClient(args.frame_interval)
+    user = FakeUser(1)
+    for i in range(args.skips + 1):
+        info = StubYDL(media_base, 0)._info(video_id(f"skip {i}"), f"Skip track {i}")
+        entry = bot._store_cache_entry(info, f"skip track {i}")
+        player.queue.append(bot._make_queue_item(entry, user))
+
+    await bot._play_next(player)
+    transitions = []
+    t0 = time.perf_counter()
+    for _ in range(args.skips):
+        current = player.history[0]
+        s0 = time.perf_counter()
+        vc.stop()
+        await wait_for(lambda: player.history and player.history[0] is not current and vc.is_playing())
+        transitions.append(time.perf_counter() - s0)
+    elapsed = time.perf_counter() - t0
+    vc.stop()
+    return {
+        "skips": args.skips,
+        "total_s": round(elapsed, 3),
+        "skips_per_s": round(args.skips / elapsed, 1),
+        "transition_ms": percentiles(transitions),
+    }
+
+def signed_stream_url(vid: str) -> str:
+    # Shaped like a signed googlevideo URL, which is most of the size of a real cache entry.
+    sig = hashlib.sha256(vid.encode("utf-8")).hexdigest()
+    return (
+        f"https://rr{int(sig[:2], 16) % 20}---sn-{sig[2:10]}.googlevideo.com/videoplayback?expire=1714021600&ei={sig[10:32]}"
+        f"&ip=203.0.113.7&id=o-{sig[:43]}&itag=251&source=youtube&requiressl=yes&mh=Zy&mm=31%2C29&mn=sn-4g5e6nsz"
+        "&ms=au%2Crdu&mv=m&mvi=1&pl=24&initcwndbps=1520000&vprv=1&svpuc=1&mime=audio%2Fwebm&gir=yes&clen=3581412"
+        "&dur=215.201&lmt=1714000000000000&mt=1714000000&fvip=4&keepalive=yes&c=ANDROID&txp=4532434"
+        "&sparams=expire%2Cei%2Cip%2Cid%2Citag%2Csource%2Crequiressl%2Cvprv%2Csvpuc%2Cmime%2Cgir%2Cclen%2Cdur%2Clmt"
+        f"&sig={sig}{sig}&lsparams=mh%2Cmm%2Cmn%2Cms%2Cmv%2Cmvi%2Cpl%2Cinitcwndbps&lsig={sig}"
+    )
+
+async def scenario_memory(bot, media_base: str, args) -> dict:
+    reset_bot(bot)
+    now = time.time()
+    entries = []
+    for i in range(args.memory_entries):
+        vid = video_id(f"memory {i}")
+        entries.append({
+            "url": signed_stream_url(vid),
+            "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+            "title": f"Memory track {i}",
+            "duration": 120 + i % 300,
+            "uploader": f"Artist {i % 2000}",
+            "expires_at": now + 6 * 3600,
+            "acodec": "opus",
+            "abr": 128.0,
+            "keys": [f"artist {i % 2000} memory track {i}", f"https://www.youtube.com/watch?v={vid}"],
+            "hits": i % 17,
+            "last_used": now,
+        })
+    with open(bot.CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    del entries
+
+    gc.collect()
+    rss_before = current_rss_mb()
+    bot.load_cache()
+    rss_cache = current_rss_mb()
+    # As bot.py does after its startup load.
+    gc.collect()
+    gc.freeze()
+    t0 = time.perf_counter()
+    gc.collect()
+    full_gc = time.perf_counter() - t0
+
+    # Freed JSON parsing memory gets reused by the queue, so its size is traced rather than read from RSS.
+    user = FakeUser(1)
+    tracemalloc.start()
+    for i, entry in enumerate(islice(bot.cache_store, args.memory_queue)):
+        bot.get_player(1 + i % 10).queue.append(bot._make_queue_item(entry, user))
+    queue_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    result = {
+        "entries": len(bot.cache_store),
+        "queue_items": min(args.memory_queue, len(bot.cache_store)),
+        "queue_heap_mb": round(queue_bytes / 1024 / 1024, 1),
+        "gc_unfrozen_objects": len(gc.get_objects()),
+        "gc_frozen_objects": gc.get_freeze_count(),
+        "full_gc_ms": round(full_gc * 1000, 1),
+    }
+    if rss_before is not None:
+        result["cache_rss_mb"] = round(rss_cache - rss_before, 1)
+    gc.unfreeze()
+    reset_bot(bot)
+    return result
+
+async def run(args) -> dict:
+    os.environ["BOT_SKIP_YTDLP_UPDATE"] = "1"
+    import bot
+
+    runner, media_base = await start_media_server()
+    results = {}
+    try:
+        async with bot.bot:
+            install_stubs(bot, media_base, args)
+            bot.start_cache_writer()
+            try:
+                for name in args.scenarios:
+                    rss_before = peak_rss_mb()
+                    result = await globals()[f"scenario_{name}"](bot, media_base, args)
+                    rss_after = peak_rss_mb()
+                    if rss_after is not None:
+                        result["peak_rss_mb"] = round(rss_after, 1)
+                        result["peak_rss_growth_mb"] = round(rss_after - rss_before, 1)
+                    results[name] = result
+                    print(f"{name}: {json.dumps(result)}", flush=True)
+            finally:
+                # Fake voice threads finishing a track then return from _after_playback instead of using a closed loop.
+                bot.shutting_down = True
+                for player in bot.players.values():
+                    if player.voice_client:
+                        player.voice_client.stop()
+                await bot.stop_cache_writer()
+            results["stages_ms"] = {
+                name: {k: round(v * 1000, 2) for k, v in s.items() if k in ("p50", "p95", "p99")} | {"n": s["count"]}
+                for name, s in summaries().items() if "p50" in s
+            }
+    finally:
+        await bot.close_session()
+        await runner.cleanup()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for bot.py with a stub extractor and fake voice clients")
+    parser.add_argument("scenarios", nargs="*", help=f"Any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub extraction latency in seconds")
+    parser.add_argument("--cache-entries", type=int, default=10000)
+    parser.add_argument("--playlist-lines", type=int, default=500)
+    parser.add_argument("--youtube-playlist", type=int, default=1000, help="Tracks in the stub YouTube playlist")
+    parser.add_argument("--plays", type=int, default=50, help="Concurrent /play calls")
+    parser.add_argument("--guilds", type=int, default=10, help="Guilds the concurrent /play calls are spread over")
+    parser.add_argument("--skips", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=500, help="Frames per fake track")
+    parser.add_argument("--frame-interval", type=float, default=0.02, help="Seconds the fake voice client waits per frame (0 drains tracks instantly)")
+    parser.add_argument("--repeat", type=int, default=3, help="Cache load repetitions (best is reported)")
+    parser.add_argument("--memory-entries", type=int, default=50000, help="Cache entries loaded by the memory scenario")
+    parser.add_argument("--memory-queue", type=int, default=20000, help="Queue items (across 10 guilds) built by the memory scenario")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenario: {', '.join(sorted(unknown))}")
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    with tempfile.TemporaryDirectory() as tmp:
+        # bot.py keeps its cache files relative to the working directory.
+        os.chdir(tmp)
+        results = asyncio.run(run(args))
+        os.chdir(ROOT)
+
+    print(json.dumps(results.get("stages_ms", {}), indent=2))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
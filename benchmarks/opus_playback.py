@@ -0,0 +1,88 @@
+import argparse, ctypes.util, os, subprocess, tempfile, threading, time
+import discord
+
+SAMPLE_CODECS = {"opus": ("libopus", ".webm"), "aac": ("aac", ".m4a"), "mp3": ("libmp3lame", ".mp3")}
+
+def make_sample(directory: str, seconds: int, source: str) -> str:
+    codec, ext = SAMPLE_CODECS[source]
+    path = os.path.join(directory, "sample" + ext)
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate=48000",
+            "-f", "lavfi", "-i", f"anoisesrc=duration={seconds}:sample_rate=48000:amplitude=0.05",
+            "-filter_complex", "amix=inputs=2", "-ac", "2", "-c:a", codec, "-b:a", "128k", path,
+        ],
+        check=True,
+    )
+    return path
+
+def drain_pcm(path: str) -> int:
+    # The same work the voice player thread does for FFmpegPCMAudio: read a 20 ms frame, Opus-encode it in Python.
+    src = discord.FFmpegPCMAudio(path)
+    encoder = discord.opus.Encoder()
+    frames = 0
+    try:
+        while data := src.read():
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+            frames += 1
+    finally:
+        src.cleanup()
+    return frames
+
+def drain_opus(path: str, codec: str | None) -> int:
+    src = discord.FFmpegOpusAudio(path, codec=codec)
+    frames = 0
+    try:
+        while src.read():
+            frames += 1
+    finally:
+        src.cleanup()
+    return frames
+
+PATHS = {
+    "pcm": drain_pcm,
+    "opus-encode": lambda path: drain_opus(path, None),
+    "opus-copy": lambda path: drain_opus(path, "copy"),
+}
+
+def run_path(name: str, path: str, streams: int) -> dict:
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(PATHS[name](path))) for _ in range(streams)]
+    t0, cpu0 = time.perf_counter(), os.times()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall, cpu1 = time.perf_counter() - t0, os.times()
+    own = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    children = (cpu1.children_user - cpu0.children_user) + (cpu1.children_system - cpu0.children_system)
+    return {"frames": sum(results), "wall": wall, "python_cpu": own, "ffmpeg_cpu": children}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU per stream of the PCM and Opus playback paths")
+    parser.add_argument("--streams", type=int, default=8, help="Concurrent streams per path")
+    parser.add_argument("--seconds", type=int, default=60, help="Length of the generated sample")
+    parser.add_argument("--source", choices=sorted(SAMPLE_CODECS), default="opus", help="Codec of the generated sample")
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=list(PATHS))
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus.load_opus(ctypes.util.find_library("opus") or "libopus.so.0")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = make_sample(tmp, args.seconds, args.source)
+        audio_seconds = args.seconds * args.streams
+        print(f"{args.streams} streams x {args.seconds}s of {args.source} audio")
+        print(f"{'path':<12} {'wall s':>8} {'python cpu s':>13} {'ffmpeg cpu s':>13} {'core % / stream':>16}")
+        for name in args.paths:
+            if name == "opus-copy" and args.source != "opus":
+                continue
+            r = run_path(name, sample, args.streams)
+            cpu = r["python_cpu"] + r["ffmpeg_cpu"]
+            # Share of one core a single real-time stream needs on this path.
+            per_stream = 100 * cpu / audio_seconds
+            print(f"{name:<12} {r['wall']:>8.2f} {r['python_cpu']:>13.2f} {r['ffmpeg_cpu']:>13.2f} {per_stream:>15.2f}%")
+
+if __name__ == "__main__":
+    main()
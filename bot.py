@@ -1,16 +1,31 @@
-import importlib.metadata, requests, aiohttp, asyncio, discord, random, json, re, os, traceback, tempfile, io
+import importlib.metadata, requests, aiohttp, asyncio, discord, random, json, re, os, traceback, io, time, heapq, weakref, gc, signal
 from contextlib import suppress
+from collections import deque
 from discord.ui import View, Button, button
 from urllib.parse import urlparse, parse_qs
 from discord import app_commands
 from discord.ext import commands
-from mutagen import File as MutagenFile
+from cache_backend import CacheBackend, CacheStore, copy_entries, open_cache_backend
+from extractor import ExtractionService, ExtractorUnavailable, extract_info
+from audio_cache import AudioCache, is_direct_media_url
+from media_probe import MediaProbeService
+from track_queue import TrackQueue
+from records import CacheEntry, QueueItem
+from metrics import describe, format_summaries, inc, observe, register_collector, span, start_http_server
 
 TOKEN = "bot token"
 LEAVE_SOUND = "_leave.mp3"  # short, quiet chime bot exit chime (set to None to disable)
 CACHE_FILE = "cache.json" # Json file to store cache
+CACHE_BACKEND = "json" # "json" stores the cache in CACHE_FILE, "sqlite" in SQLITE_CACHE_FILE (migrate with: python cache_backend.py migrate)
+SQLITE_CACHE_FILE = "cache.db"
 OWNER_ONLY = True # Restrict some commands to bot owner only (cache management commands)
 USE_CACHE = True # Disabling bypasses cache entirely
+CACHE_JOURNAL = True # Append changed entries to a journal instead of rewriting the whole cache file on every change
+CACHE_COMPACT_BYTES = 4 * 1024 * 1024 # Fold the journal into the cache file once it grows past this size
+CACHE_COMPACT_INTERVAL = 600 # ...or once its oldest unfolded line is this many seconds old
+CACHE_FLUSH_INTERVAL = 2.0 # Seconds to coalesce cache changes before writing them out in a worker thread
+CACHE_COUNTER_INTERVAL = 600 # Hit and play counters are kept in memory and written at most this often (other changes still go out after CACHE_FLUSH_INTERVAL)
+SEARCH_MATCH_THRESHOLD = 0.85 # Token overlap (0-1) a search needs with a cached search, after folding case, punctuation, word order and words like "lyrics", to reuse its track (1 = same tokens only, None = exact text only)
 LOW_BANDWIDTH_MODE = False # Restart the bot after changing. Reduces source bitrate and Discord voice bitrate.
 
 NORMAL_SOURCE_ABR_LIMIT = 64
@@ -19,6 +34,44 @@ LOW_BANDWIDTH_MIN_SOURCE_ABR = 48
 LOW_BANDWIDTH_DISCORD_BITRATE = 96
 LOW_BANDWIDTH_DISCORD_BANDWIDTH = "full"
 FFMPEG_INPUT_THREAD_QUEUE_SIZE = 256 # ffmpeg input buffer
+OPUS_PLAYBACK = True # ffmpeg outputs Opus directly instead of PCM that discord.py re-encodes in Python (False restores the PCM path)
+OPUS_PASSTHROUGH_MAX_ABR = 160 # Opus sources up to this bitrate (kbps) are copied without re-encoding
+PREWARM_SECONDS = 5 # Start the next track's ffmpeg this long before the current track ends (0 disables)
+PREWARM_FRAMES = 25 # 20 ms frames of the next track buffered before the handover
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9187 # Local HTTP endpoint with /metrics (Prometheus) and /latency (None disables); shard processes add their first shard id
+EXTRACTOR_PROCESSES = 2 # yt-dlp worker processes; 0 extracts in threads inside the bot process
+EXTRACTOR_JOB_TIMEOUT = 60 # Seconds before a stuck extraction is abandoned and its worker replaced
+EXTRACTOR_MAX_JOBS_PER_WORKER = 250 # Worker processes are recycled after this many extractions
+EXTRACTOR_POOL_SIZE = 4 # yt-dlp instances per profile for in-process (thread) extractions
+STREAM_URL_TTL = 3 * 3600 # Assumed lifetime of extracted stream URLs that carry no expire= parameter
+STREAM_URL_REFRESH_MARGIN = 300 # Stream URLs this close to expiring are re-extracted instead of played
+CACHE_REFRESH_TOP_N = 50 # Most-played cache entries whose stream URLs are kept warm in the background (0 disables)
+CACHE_REFRESH_INTERVAL = 300 # Seconds between background refresh passes
+CACHE_REFRESH_AHEAD = 1800 # Popular entries expiring within this many seconds get re-extracted
+CACHE_REFRESH_RATE = 0.2 # Max background re-extractions per second across the whole bot (0 disables)
+PLAYLIST_RESOLVE_CONCURRENCY = 4 # Playlist lines resolved at the same time during /playlist imports
+PLAYLIST_STREAMING = True # Queue /playlist tracks as soon as they resolve instead of after the whole file
+PLAYLIST_PROGRESS_INTERVAL = 3.0 # Minimum seconds between "Processing Playlist" progress edits
+PLAYLIST_SKIP_DUPLICATES = False # Leave out /playlist tracks that are already queued (or appear twice in the file)
+PLAYLIST_LAZY = False # Queue /playlist lines without extracting them; each track is resolved once it nears the front of the queue, bad lines only show up as skips when they'd play (False resolves every line up front and reports bad lines right away)
+PLAYLIST_PAGE_SIZE = 100 # YouTube playlist entries read per flat extraction
+PLAYLIST_MAX_TRACKS = 1000 # Tracks imported from one YouTube playlist URL
+LAZY_RESOLVE_MAX_FAILURES = 3 # Playlist tracks in a row that can fail to resolve before playback stops (the rest stay queued)
+HISTORY_DEPTH = 200 # Played tracks remembered per server for /previous, older ones are forgotten
+AUDIO_CACHE_DIR = None # Folder to keep often played tracks in as local files, e.g. "audio_cache" (None disables)
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024 # Least recently played files are deleted once the folder grows past this
+AUDIO_CACHE_MAX_FILE_BYTES = 64 * 1024 * 1024 # Tracks bigger than this are always streamed
+AUDIO_CACHE_MIN_PLAYS = 3 # Plays after which a track is downloaded into AUDIO_CACHE_DIR
+AUDIO_CACHE_TOP_N = 50 # Most-hit cache entries downloaded in the background (0 disables)
+MEDIA_PROBE_WORKERS = 2 # Threads reading tags and length of uploaded files and direct media URLs (ffprobe is used when Mutagen can't)
+
+SHARD_IDS = [int(s) for s in os.environ.get("BOT_SHARD_IDS", "").split(",") if s.strip()] # Set by launcher.py, see readme
+SHARD_COUNT = int(os.environ.get("BOT_SHARD_COUNT") or 0) or None
+SHARED_CACHE = bool(SHARD_IDS) # Shard processes share SQLITE_CACHE_FILE so a track resolved in one is a hit in all of them
+SQLITE_CACHE_FILE = os.environ.get("BOT_CACHE_DB") or SQLITE_CACHE_FILE # launcher.py --cache-db
+if SHARED_CACHE:
+    CACHE_BACKEND = "sqlite"
 
 def ytdlp_updated() -> bool:
     try:
@@ -33,12 +86,13 @@ def ytdlp_updated() -> bool:
     return local == latest, local, latest
 
 try:
-    updated, localver, latestver = ytdlp_updated()
-    if not updated:
-        print(f"Updating yt-dlp from {localver} to {latestver}...")
-        os.system("python -m pip install -U yt-dlp")
-    else:
-        print(f"yt-dlp runnning {localver} (up to date)")
+    if not os.environ.get("BOT_SKIP_YTDLP_UPDATE"):
+        updated, localver, latestver = ytdlp_updated()
+        if not updated:
+            print(f"Updating yt-dlp from {localver} to {latestver}...")
+            os.system("python -m pip install -U yt-dlp")
+        else:
+            print(f"yt-dlp runnning {localver} (up to date)")
 
     from yt_dlp import YoutubeDL
 
@@ -46,45 +100,218 @@ except Exception as e:
     traceback.print_exc()
     print(f"Failed to check/update yt-dlp: {e}")
 
-cache_entries: list[dict] = []
-key_map: dict[str, dict] = {}
+def _open_cache_backend() -> CacheBackend:
+    if CACHE_BACKEND == "sqlite":
+        return open_cache_backend(SQLITE_CACHE_FILE, "sqlite", create=True, shared=SHARED_CACHE)
+    return open_cache_backend(
+        CACHE_FILE,
+        "json",
+        create=True,
+        journal=CACHE_JOURNAL,
+        compact_bytes=CACHE_COMPACT_BYTES,
+        compact_interval=CACHE_COMPACT_INTERVAL,
+    )
+
+cache_store = CacheStore(record=CacheEntry)
+cache_backend = _open_cache_backend()
+_dirty_entries: dict[int, dict] = {}
+_cache_full_save = False
+_counter_entries: dict[int, list] = {} # id(entry) -> [entry, hits, plays] not written yet
+_counters_saved_at = time.monotonic()
+_cache_dirty: asyncio.Event | None = None
+_cache_writer_task: asyncio.Task | None = None
+_cache_flush_lock: asyncio.Lock | None = None
+
+def _cache_journaled() -> bool:
+    return CACHE_BACKEND == "sqlite" or CACHE_JOURNAL
+
+def _counters_due() -> bool:
+    return bool(_counter_entries) and time.monotonic() - _counters_saved_at >= CACHE_COUNTER_INTERVAL
+
+def _shared_rows(entries: list[dict], taken: dict[int, list]) -> list[dict]:
+    # Rows go out without this process's unwritten increments, those are added in SQL by add_counters().
+    rows = copy_entries(entries)
+    for entry, row in zip(entries, rows):
+        _, hits, plays = taken.get(id(entry)) or _counter_entries.get(id(entry)) or (None, 0, 0)
+        if hits:
+            row["hits"] -= hits
+        if plays:
+            row["plays"] -= plays
+    return rows
+
+def _take_dirty_entries(all_counters: bool = False) -> tuple[bool, list[dict], list[tuple]]:
+    global _cache_full_save, _counters_saved_at
+    taken = {}
+    counters = []
+    if _counter_entries and (all_counters or _counters_due()):
+        # Counters only ride along this often, on their own they'd cost a write for every cache hit.
+        taken = dict(_counter_entries)
+        _counter_entries.clear()
+        _counters_saved_at = time.monotonic()
+        if SHARED_CACHE:
+            counters = [(e["webpage_url"], hits, plays, e.get("last_used") or 0) for e, hits, plays in taken.values() if e.get("webpage_url")]
+        else:
+            for key, (entry, _, _) in taken.items():
+                _dirty_entries.setdefault(key, entry)
+    full = _cache_full_save or (not _cache_journaled() and bool(_dirty_entries))
+    if SHARED_CACHE:
+        # Other shards write the same database, write_all() would delete what they added since we loaded.
+        changed = _shared_rows(list(cache_store) if full else list(_dirty_entries.values()), taken)
+        full = False
+    else:
+        changed = [] if full else copy_entries(_dirty_entries.values())
+    _dirty_entries.clear()
+    _cache_full_save = False
+    return full, changed, counters
+
+def _apply_counter_totals(totals: dict[str, tuple[int, int, float]]):
+    for url, (hits, plays, last_used) in totals.items():
+        entry = cache_store.find_url(url)
+        if entry is None:
+            continue
+        # Totals across all shard processes, plus whatever this one counted while the write ran.
+        _, pending_hits, pending_plays = _counter_entries.get(id(entry)) or (None, 0, 0)
+        entry["hits"] = (hits or 0) + pending_hits
+        entry["plays"] = (plays or 0) + pending_plays
+        entry["last_used"] = max(last_used or 0, entry.get("last_used") or 0)
+
+def _flush_cache_sync(all_counters: bool = False):
+    full, changed, counters = _take_dirty_entries(all_counters)
+    try:
+        with span("cache.flush"):
+            if full:
+                cache_backend.write_all(copy_entries(cache_store))
+            elif changed:
+                cache_backend.write(changed)
+                if cache_backend.compaction_due():
+                    cache_backend.start_compaction()(copy_entries(cache_store))
+            if counters:
+                _apply_counter_totals(cache_backend.add_counters(counters))
+        inc("cache_flushes_total", mode="full" if full else "changed")
+    except Exception:
+        inc("cache_flush_errors_total")
+        traceback.print_exc()
+
+async def _write_pending_cache(all_counters: bool = False):
+    # Callers hold _cache_flush_lock, so only one write is ever in flight.
+    _cache_dirty.clear()
+    full, changed, counters = _take_dirty_entries(all_counters)
+    if not full and not changed and not counters:
+        return
+    try:
+        # Entries are copied on the loop; only serialization and disk I/O happen in the worker thread.
+        with span("cache.flush"):
+            if full:
+                await asyncio.to_thread(cache_backend.write_all, copy_entries(cache_store))
+            elif changed:
+                await asyncio.to_thread(cache_backend.write, changed)
+                if cache_backend.compaction_due():
+                    compact = await asyncio.to_thread(cache_backend.start_compaction)
+                    await asyncio.to_thread(compact, copy_entries(cache_store))
+            if counters:
+                _apply_counter_totals(await asyncio.to_thread(cache_backend.add_counters, counters))
+        inc("cache_flushes_total", mode="full" if full else "changed")
+    except Exception:
+        inc("cache_flush_errors_total")
+        traceback.print_exc()
+
+async def _flush_cache():
+    async with _cache_flush_lock:
+        await _write_pending_cache()
+
+async def _cache_writer():
+    while True:
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(_cache_dirty.wait(), CACHE_COUNTER_INTERVAL)
+        if _cache_dirty.is_set():
+            await asyncio.sleep(CACHE_FLUSH_INTERVAL)
+        elif not _counters_due():
+            continue
+        await _flush_cache()
+
+def start_cache_writer():
+    global _cache_dirty, _cache_writer_task, _cache_flush_lock
+    if _cache_writer_task is not None and not _cache_writer_task.done():
+        return
+    _cache_dirty = asyncio.Event()
+    _cache_flush_lock = asyncio.Lock()
+    if _dirty_entries or _cache_full_save:
+        _cache_dirty.set()
+    _cache_writer_task = asyncio.create_task(_cache_writer())
+
+async def stop_cache_writer():
+    global _cache_writer_task
+    task = _cache_writer_task
+    _cache_writer_task = None
+    if task is not None:
+        async with _cache_flush_lock:
+            # With the lock held the writer can't be mid-write, so cancelling it never cuts off a thread's append.
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+            await _write_pending_cache(all_counters=True)
+    elif _dirty_entries or _cache_full_save or _counter_entries:
+        _flush_cache_sync(all_counters=True)
 
 def load_cache():
-    global cache_entries, key_map
-    cache_entries, key_map = [], {}
-    if USE_CACHE and os.path.exists(CACHE_FILE):
+    if _dirty_entries or _cache_full_save or _counter_entries:
+        # Reloading replaces every entry object, so unsaved changes must reach the backend first.
+        _flush_cache_sync(all_counters=True)
+
+    entries = []
+    if USE_CACHE:
         try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if isinstance(data, list):
-                cache_entries = data
-            else:
-                for k, v in data.items():
-                    cache_entries.append({"keys": [k], **v})
-            for entry in cache_entries:
-                for k in entry.get("keys", []):
-                    key_map[k] = entry
+            entries = cache_backend.load()
         except Exception as e:
             traceback.print_exc()
-            cache_entries, key_map = [], {}
+            entries = []
+    cache_store.load(entries)
+    del entries
+    if USE_CACHE and cache_backend.needs_fold():
+        # Fold the journal straight away so new appends never follow a torn line.
+        try:
+            cache_backend.write_all(copy_entries(cache_store))
+        except Exception:
+            traceback.print_exc()
 
-def save_cache():
+async def reload_cache():
+    if _cache_flush_lock is None:
+        load_cache()
+        return
+    async with _cache_flush_lock:
+        # Pending changes are written from the current store, before load_cache() replaces it.
+        await _write_pending_cache(all_counters=True)
+        load_cache()
+
+def save_cache(*changed: dict):
+    global _cache_full_save
     if not USE_CACHE:
         return
-    tmp = CACHE_FILE + ".tmp"
-    try:
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(cache_entries, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, CACHE_FILE)
-    except Exception as e:
-        traceback.print_exc()
-        try:
-            if os.path.exists(tmp):
-                os.remove(tmp)
-        except Exception as e2:
-            traceback.print_exc()
+    if changed:
+        for entry in changed:
+            _dirty_entries[id(entry)] = entry
+    else:
+        _cache_full_save = True
+
+    if _cache_writer_task is None:
+        _flush_cache_sync()
+    else:
+        _cache_dirty.set()
+
+def save_counters(entry: dict, hits: int = 0, plays: int = 0):
+    if not USE_CACHE:
+        return
+    pending = _counter_entries.setdefault(id(entry), [entry, 0, 0])
+    pending[1] += hits
+    pending[2] += plays
+    if _cache_writer_task is None and _counters_due():
+        _flush_cache_sync()
 
 load_cache()
+# Only once, at startup: the cache loaded here lives as long as the process, so full GC passes can skip it.
+# Reloads don't freeze again, that would also pin whatever the running bot holds by then.
+gc.collect()
+gc.freeze()
 
 cookiefile = "cookies.txt"
 def _stream_source_abr_limit() -> int:
@@ -143,12 +370,100 @@ def _voice_playback_kwargs() -> dict:
         "bandwidth": LOW_BANDWIDTH_DISCORD_BANDWIDTH,
     }
 
-def _ffmpeg_before_options() -> str:
+def _ffmpeg_before_options(local: bool = False) -> str:
+    if local:
+        return f"-thread_queue_size {FFMPEG_INPUT_THREAD_QUEUE_SIZE}"
     return (
         f"-thread_queue_size {FFMPEG_INPUT_THREAD_QUEUE_SIZE} "
         "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
     )
 
+def _opus_passthrough(item: dict) -> bool:
+    if item.get("acodec") != "opus":
+        return False
+    limit = LOW_BANDWIDTH_DISCORD_BITRATE if LOW_BANDWIDTH_MODE else OPUS_PASSTHROUGH_MAX_ABR
+    return float(item.get("abr") or 0) <= limit
+
+_ffmpeg_sources = weakref.WeakSet()
+
+def _make_audio_source(item: dict, source: str, local: bool = False) -> discord.AudioSource:
+    before_options = _ffmpeg_before_options(local=local)
+    audio = None
+    if OPUS_PLAYBACK:
+        try:
+            # codec="copy" remuxes the Opus packets as they are; None has ffmpeg encode with libopus.
+            audio = discord.FFmpegOpusAudio(
+                source,
+                bitrate=LOW_BANDWIDTH_DISCORD_BITRATE if LOW_BANDWIDTH_MODE else 128,
+                codec="copy" if _opus_passthrough(item) else None,
+                before_options=before_options,
+            )
+            inc("audio_sources_total", kind="opus_copy" if _opus_passthrough(item) else "opus_encode")
+        except Exception:
+            traceback.print_exc()
+    if audio is None:
+        audio = discord.FFmpegPCMAudio(source, before_options=before_options)
+        inc("audio_sources_total", kind="pcm")
+    _ffmpeg_sources.add(audio)
+    return audio
+
+def _ffmpeg_process_count() -> int:
+    count = 0
+    for audio in list(_ffmpeg_sources):
+        proc = getattr(audio, "_process", None)
+        if hasattr(proc, "poll") and proc.poll() is None:
+            count += 1
+    return count
+
+class PrewarmedSource(discord.AudioSource):
+    def __init__(self, source: discord.AudioSource, frames: list[bytes]):
+        self.source = source
+        self.frames = deque(frames)
+
+    def read(self) -> bytes:
+        if self.frames:
+            return self.frames.popleft()
+        return self.source.read()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+class FirstFrameTimer(discord.AudioSource):
+    def __init__(self, source: discord.AudioSource, requested_at: float | None = None):
+        self.source = source
+        self.requested_at = requested_at
+        self.started = time.perf_counter()
+        self.timed = False
+
+    def read(self) -> bytes:
+        data = self.source.read()
+        if not self.timed:
+            # Runs on the voice player thread, right before the first packet is sent.
+            self.timed = True
+            now = time.perf_counter()
+            observe("play.first_frame", now - self.started)
+            if self.requested_at is not None:
+                observe("play.request_to_first_frame", now - self.requested_at)
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+def _read_frames(source: discord.AudioSource, count: int) -> list[bytes]:
+    frames = []
+    while len(frames) < count:
+        data = source.read()
+        if not data:
+            break
+        frames.append(data)
+    return frames
+
 def _playlist_export_url(item: dict) -> str:
     return item.get("webpage_url") or item.get("url") or ""
 
@@ -163,43 +478,144 @@ def _playlist_export_duration(item: dict) -> int:
         duration = 0
     return duration if duration > 0 else -1
 
-def _build_queue_export_m3u8() -> str:
-    entries = []
-    if music_history:
-        current = music_history[0]
-        if _playlist_export_url(current):
-            entries.append(current)
+ydl_opts = _build_ydl_opts()
 
-    for item in music_queue:
-        if _playlist_export_url(item):
-            entries.append(item)
+def _build_soundcloud_ydl_opts() -> dict:
+    soundcloud_opts = _build_ydl_opts()
+    soundcloud_opts["geo_bypass"] = True
+    soundcloud_opts["geo_bypass_country"] = "US"
+    return soundcloud_opts
 
-    lines = ["#EXTM3U"]
-    for item in entries:
-        lines.append(f"#EXTINF:{_playlist_export_duration(item)},{_playlist_export_title(item)}")
-        lines.append(_playlist_export_url(item))
-    return "\n".join(lines) + "\n"
+def _build_playlist_ydl_opts() -> dict:
+    playlist_opts = _build_ydl_opts(extract_flat=True)
+    playlist_opts["noplaylist"] = False
+    playlist_opts["lazy_playlist"] = True
+    return playlist_opts
 
-ydl_opts = _build_ydl_opts()
+def _ydl_profiles() -> dict[str, dict]:
+    return {
+        "stream": ydl_opts,
+        "flat": _build_ydl_opts(extract_flat=True),
+        "soundcloud": _build_soundcloud_ydl_opts(),
+        "playlist": _build_playlist_ydl_opts(),
+    }
 
 stream_ydl = YoutubeDL(ydl_opts)
 search_ydl = YoutubeDL(_build_ydl_opts(extract_flat=True))
+extraction_service = ExtractionService(
+    _ydl_profiles(),
+    processes=EXTRACTOR_PROCESSES,
+    timeout=EXTRACTOR_JOB_TIMEOUT,
+    max_jobs_per_worker=EXTRACTOR_MAX_JOBS_PER_WORKER,
+) if EXTRACTOR_PROCESSES > 0 else None
+_ydl_pools: dict[str, asyncio.Queue] = {}
+
+def _ydl_pool(profile: str) -> asyncio.Queue:
+    pool = _ydl_pools.get(profile)
+    if pool is None:
+        # YoutubeDL instances are not safe to share between threads, so each concurrent extraction checks one out.
+        pool = asyncio.Queue()
+        shared = {"stream": stream_ydl, "flat": search_ydl}.get(profile)
+        if shared is not None:
+            pool.put_nowait(shared)
+        while pool.qsize() < max(1, EXTRACTOR_POOL_SIZE):
+            pool.put_nowait(YoutubeDL(_ydl_profiles()[profile]))
+        _ydl_pools[profile] = pool
+    return pool
+
+async def _extract_info_in_thread(query: str, profile: str, params: dict | None = None) -> dict:
+    pool = _ydl_pool(profile)
+    ydl = await pool.get()
+    try:
+        return await asyncio.to_thread(extract_info, ydl, query, params)
+    finally:
+        pool.put_nowait(ydl)
+
+async def _run_extraction(query: str, profile: str, params: dict | None = None) -> dict:
+    if extraction_service is not None and not extraction_service.unavailable:
+        try:
+            return await extraction_service.extract(profile, query, params)
+        except ExtractorUnavailable:
+            traceback.print_exc()
+    return await _extract_info_in_thread(query, profile, params)
+
+async def _extract_info(query: str, *, profile: str = "stream", params: dict | None = None) -> dict:
+    try:
+        with span(f"ytdlp.{profile}"):
+            info = await _run_extraction(query, profile, params)
+    except Exception:
+        inc("ytdlp_extractions_total", profile=profile, result="error")
+        raise
+    inc("ytdlp_extractions_total", profile=profile, result="ok")
+    return info
+
 url_re = re.compile(r"(https?://)?(www\.)?(youtube\.com|youtu\.be)/", re.IGNORECASE)
 soundcloud_re = re.compile(r"(https?://)?(www\.)?(m\.)?(soundcloud\.com|on\.soundcloud\.com)/", re.IGNORECASE)
 generic_http_re = re.compile(r"^https?://", re.IGNORECASE)
 
 intents = discord.Intents.all()
 intents.voice_states = True
-bot = commands.Bot(command_prefix="/", intents=intents)
-
-music_queue: list[dict] = []
-music_history: list[dict] = []
-voice_client: discord.VoiceClient | None = None
-text_channel: discord.TextChannel | None = None
-now_playing_msg: discord.Message | None = None
-disconnect_task: asyncio.Task | None = None
+if SHARD_IDS:
+    bot = commands.AutoShardedBot(command_prefix="/", intents=intents, shard_ids=SHARD_IDS, shard_count=SHARD_COUNT)
+else:
+    bot = commands.Bot(command_prefix="/", intents=intents)
+
+def _primary_process() -> bool:
+    # Work that only needs doing once per deployment (command sync, background refreshes) runs in the shard 0 process.
+    return not SHARD_IDS or 0 in SHARD_IDS
+
+class GuildPlayer:
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.queue = TrackQueue()
+        self.history: deque[dict] = deque(maxlen=HISTORY_DEPTH)
+        self.voice_client: discord.VoiceClient | None = None
+        self.text_channel: discord.TextChannel | None = None
+        self.now_playing_msg: discord.Message | None = None
+        self.disconnect_task: asyncio.Task | None = None
+        self.prewarm_task: asyncio.Task | None = None
+        self.prewarmed: tuple[dict, PrewarmedSource] | None = None
+
+players: dict[int, GuildPlayer] = {}
 shutting_down = False
 
+def get_player(guild_id: int) -> GuildPlayer:
+    player = players.get(guild_id)
+    if player is None:
+        player = players[guild_id] = GuildPlayer(guild_id)
+    return player
+
+def _drop_player(player: GuildPlayer):
+    _discard_prewarmed(player)
+    if players.get(player.guild_id) is player:
+        del players[player.guild_id]
+
+def _discard_prewarmed(player: GuildPlayer, stale_only: bool = False):
+    if stale_only and player.prewarmed and player.queue and player.queue[0] is player.prewarmed[0]:
+        return
+    if player.prewarm_task and not stale_only:
+        player.prewarm_task.cancel()
+        player.prewarm_task = None
+    prewarmed, player.prewarmed = player.prewarmed, None
+    if prewarmed:
+        try:
+            prewarmed[1].cleanup()
+        except Exception:
+            traceback.print_exc()
+
+def _take_prewarmed(player: GuildPlayer, item: dict) -> PrewarmedSource | None:
+    if player.prewarmed and player.prewarmed[0] is item:
+        source = player.prewarmed[1]
+        player.prewarmed = None
+        return source
+    _discard_prewarmed(player)
+    return None
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_MAX_FILE_BYTES) if AUDIO_CACHE_DIR else None
+media_probe_service = MediaProbeService(MEDIA_PROBE_WORKERS)
+stream_url_stats = {"probes": 0, "probes_saved": 0, "refreshes": 0, "expiry_refreshes": 0, "background_refreshes": 0}
+_cache_refresher_task: asyncio.Task | None = None
+_metrics_runner = None
+
 _http_session: aiohttp.ClientSession | None = None
 
 def get_session() -> aiohttp.ClientSession:
@@ -214,10 +630,9 @@ async def close_session():
         await _http_session.close()
         _http_session = None
 
-async def _cancel_disconnect_task():
-    global disconnect_task
-    task = disconnect_task
-    disconnect_task = None
+async def _cancel_disconnect_task(player: GuildPlayer):
+    task = player.disconnect_task
+    player.disconnect_task = None
     if task is None:
         return
     if task is asyncio.current_task():
@@ -253,30 +668,39 @@ def canonical_url(raw_url: str) -> str | None:
         return None
     return f"https://www.youtube.com/watch?v={vid}" if vid else None
 
+def youtube_playlist_url(raw_url: str) -> str | None:
+    # Only /playlist links are imported whole; a watch link with &list= still plays just that video.
+    o = urlparse(raw_url if "://" in raw_url else f"https://{raw_url}")
+    if "youtube.com" not in o.netloc.lower() or o.path != "/playlist":
+        return None
+    list_id = parse_qs(o.query).get("list", [None])[0]
+    return f"https://www.youtube.com/playlist?list={list_id}" if list_id else None
+
 async def ensure_voice(inter: discord.Interaction) -> bool:
-    global voice_client, text_channel
     vc = getattr(inter.user.voice, "channel", None)
+    player = get_player(inter.guild_id)
     if vc is None:
         await inter.followup.send("🚫 You must be in a voice channel first.", ephemeral=True)
         return False
-    if voice_client is None or not voice_client.is_connected():
-        voice_client = await vc.connect()
-    elif voice_client.channel != vc:
+    if player.voice_client is None or not player.voice_client.is_connected():
+        player.voice_client = await vc.connect()
+    elif player.voice_client.channel != vc:
         await inter.followup.send("🚫 You must be in the **same** voice channel as me.", ephemeral=True)
         return False
-    text_channel = inter.channel
+    player.text_channel = inter.channel
     return True
 
-async def clear_all(play_leave_sound: bool = True, force_disconnect: bool = False, cleanup_message: bool = True):
-    global music_queue, music_history, voice_client, now_playing_msg, text_channel
-    vc = voice_client
-    msg = now_playing_msg
-    await _cancel_disconnect_task()
-    music_queue.clear()
-    music_history.clear()
-    voice_client = None
-    now_playing_msg = None
-    text_channel = None
+async def clear_all(player: GuildPlayer, play_leave_sound: bool = True, force_disconnect: bool = False, cleanup_message: bool = True):
+    vc = player.voice_client
+    msg = player.now_playing_msg
+    await _cancel_disconnect_task(player)
+    _discard_prewarmed(player)
+    player.queue.clear()
+    player.history.clear()
+    player.voice_client = None
+    player.now_playing_msg = None
+    player.text_channel = None
+    _drop_player(player)
     if vc and vc.is_connected():
         try:
             try:
@@ -314,24 +738,23 @@ async def clear_all(play_leave_sound: bool = True, force_disconnect: bool = Fals
             if not shutting_down:
                 print(f"Failed to delete now playing message: {e}")
 
-async def auto_disconnect():
-    global voice_client, disconnect_task
+async def auto_disconnect(player: GuildPlayer):
     await asyncio.sleep(300)
 
-    if not voice_client or not voice_client.is_connected():
+    if not player.voice_client or not player.voice_client.is_connected():
         return
 
-    channel = voice_client.channel
+    channel = player.voice_client.channel
     non_bot_members = []
     if channel:
         non_bot_members = [m for m in channel.members if not m.bot]
 
-    if not non_bot_members and voice_client.is_paused():
-        await clear_all()
+    if not non_bot_members and player.voice_client.is_paused():
+        await clear_all(player)
         return
 
-    if not voice_client.is_playing() and not voice_client.is_paused() and not music_queue:
-        await clear_all()
+    if not player.voice_client.is_playing() and not player.voice_client.is_paused() and not player.queue:
+        await clear_all(player)
 
 async def shutdown_cleanup():
     global shutting_down
@@ -341,7 +764,13 @@ async def shutdown_cleanup():
 
     shutting_down = True
     try:
-        await clear_all(play_leave_sound=False, force_disconnect=True, cleanup_message=False)
+        results = await asyncio.gather(
+            *(clear_all(p, play_leave_sound=False, force_disconnect=True, cleanup_message=False) for p in list(players.values())),
+            return_exceptions=True,
+        )
+        for r in results:
+            if isinstance(r, Exception):
+                traceback.print_exception(type(r), r, r.__traceback__)
     except Exception:
         traceback.print_exc()
     finally:
@@ -350,25 +779,31 @@ async def shutdown_cleanup():
                 await bot.close()
         except Exception:
             traceback.print_exc()
+        if _cache_refresher_task is not None:
+            _cache_refresher_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await _cache_refresher_task
+        await stop_cache_writer()
+        if extraction_service is not None:
+            await extraction_service.close()
+        media_probe_service.close()
+        if _metrics_runner is not None:
+            await _metrics_runner.cleanup()
         await close_session()
         
-def _arm_idle_timer():
-    global disconnect_task
-    if disconnect_task:
-        disconnect_task.cancel()
-    disconnect_task = bot.loop.create_task(auto_disconnect())
+def _arm_idle_timer(player: GuildPlayer):
+    if player.disconnect_task:
+        player.disconnect_task.cancel()
+    player.disconnect_task = bot.loop.create_task(auto_disconnect(player))
 
 @bot.tree.error
 async def on_app_command_error(inter: discord.Interaction, error):
     if isinstance(error, TypeError) and "NoneType" in str(error):
-        global cache_entries, key_map
-        global music_queue, music_history, voice_client
-        global text_channel, now_playing_msg, disconnect_task
-        cache_entries, key_map = [], {}
-        music_queue, music_history = [], []
-        voice_client = text_channel = now_playing_msg = None
-        disconnect_task = None
-        load_cache()
+        player = players.get(inter.guild_id)
+        if player is not None:
+            # Same teardown as /leave, a popped player would keep its voice client and prewarm ffmpeg alive.
+            await clear_all(player, play_leave_sound=False, force_disconnect=True)
+        await reload_cache()
         await inter.followup.send("🔄 Internal state reset – try again!", ephemeral=True)
         return
     raise error
@@ -376,22 +811,85 @@ async def on_app_command_error(inter: discord.Interaction, error):
 async def _url_is_valid(u: str) -> bool:
     try:
         sess = get_session()
-        async with sess.head(u, allow_redirects=True) as resp:
-            return 200 <= resp.status < 400
+        with span("http.head"):
+            async with sess.head(u, allow_redirects=True) as resp:
+                valid = 200 <= resp.status < 400
+        inc("head_probes_total", result="valid" if valid else "invalid")
+        return valid
     except Exception as e:
+        inc("head_probes_total", result="error")
         traceback.print_exc()
         return False
 
+_inflight: dict[str, asyncio.Future] = {}
+
+def _forget_inflight(key: str, fut: asyncio.Future):
+    if _inflight.get(key) is fut:
+        del _inflight[key]
+    if not fut.cancelled():
+        fut.exception()
+
+async def _single_flight(key: str, factory):
+    # Concurrent callers with the same key share one in-flight call; shield keeps one caller's cancel from killing it for the rest.
+    fut = _inflight.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(factory())
+        _inflight[key] = fut
+        fut.add_done_callback(lambda f: _forget_inflight(key, f))
+    return await asyncio.shield(fut)
+
+def _stream_url_expires_at(url: str | None, extracted: bool = False) -> float | None:
+    parsed = urlparse(url or "")
+    query = parse_qs(parsed.query)
+    try:
+        if query.get("expire"):
+            return float(int(query["expire"][0]))
+        if query.get("ex") and "discord" in parsed.netloc.lower():
+            return float(int(query["ex"][0], 16))
+    except ValueError:
+        pass
+    match = re.search(r"/expire/(\d+)", parsed.path)
+    if match:
+        return float(match.group(1))
+    return time.time() + STREAM_URL_TTL if extracted else None
+
+def _stream_url_state(item: dict) -> str:
+    expires_at = item.get("expires_at") or _stream_url_expires_at(item.get("url"))
+    if expires_at is None:
+        return "unknown"
+    return "fresh" if expires_at - time.time() > STREAM_URL_REFRESH_MARGIN else "stale"
+
+async def _stream_url_needs_refresh(item: dict) -> bool:
+    state = _stream_url_state(item)
+    if state == "fresh":
+        stream_url_stats["probes_saved"] += 1
+        return False
+    if state == "stale":
+        stream_url_stats["expiry_refreshes"] += 1
+        return True
+    stream_url_stats["probes"] += 1
+    return not await _url_is_valid(item["url"])
+
 async def _refresh_entry_in_place(entry: dict) -> dict:
-    raw = await asyncio.to_thread(lambda: stream_ydl.extract_info(entry["webpage_url"], download=False))
+    refreshed = await _single_flight(f"refresh:{entry['webpage_url']}", lambda: _refresh_entry(entry))
+    if refreshed is not entry:
+        # Joined a refresh started for another object with the same URL (e.g. a queue item copy).
+        for k in ("url", "duration", "title", "uploader", "expires_at", "acodec", "abr"):
+            entry[k] = refreshed.get(k)
+    return entry
+
+async def _refresh_entry(entry: dict) -> dict:
+    raw = await _extract_info(entry["webpage_url"])
     if "entries" in raw:
         entries = raw.get("entries") or []
         if not entries:
             raise RuntimeError("No entries returned while refreshing cache entry")
         raw = entries[0]
-    for k in ("url", "duration", "title", "uploader"):
+    for k in ("url", "duration", "title", "uploader", "acodec", "abr"):
         entry[k] = raw.get(k)
-    save_cache()
+    entry["expires_at"] = _stream_url_expires_at(entry["url"], extracted=True)
+    stream_url_stats["refreshes"] += 1
+    save_cache(entry)
     return entry
 
 class TrackResolveError(RuntimeError):
@@ -400,28 +898,13 @@ class TrackResolveError(RuntimeError):
 class PlaylistFormatError(RuntimeError):
     pass
 
-def _rebuild_key_map():
-    key_map.clear()
-    for entry in cache_entries:
-        for key in entry.get("keys", []):
-            key_map[key] = entry
-
 def _store_cache_entry(info: dict, *keys: str) -> dict:
-    entry = next((e for e in cache_entries if e["webpage_url"] == info["webpage_url"]), None)
-    if entry:
-        entry.update(info)
-    else:
-        entry = {"keys": [], **info}
-        cache_entries.append(entry)
-
-    if USE_CACHE:
-        canon = canonical_url(info.get("webpage_url") or "")
-        for key in (*keys, canon):
-            if key and key not in entry["keys"]:
-                entry["keys"].append(key)
-        _rebuild_key_map()
-        save_cache()
+    if not USE_CACHE:
+        return {"keys": [], **info}
 
+    canon = canonical_url(info.get("webpage_url") or "")
+    entry = cache_store.upsert(info, *keys, canon)
+    save_cache(entry)
     return entry
 
 def _content_type_to_suffix(content_type: str | None) -> str:
@@ -439,43 +922,29 @@ def _content_type_to_suffix(content_type: str | None) -> str:
     }
     return ct_map.get((content_type or "").lower(), "")
 
-def _extract_media_tags(path: str, fallback_title: str, fallback_uploader: str) -> tuple[str, str, int]:
-    title = fallback_title or "Unknown title"
-    uploader = fallback_uploader or "Unknown"
-    duration = 0
-
-    try:
-        audio = MutagenFile(path, easy=True)
-        if audio is not None:
-            if audio.tags:
-                if "title" in audio.tags and audio.tags["title"]:
-                    title = str(audio.tags["title"][0])
-                if "artist" in audio.tags and audio.tags["artist"]:
-                    uploader = str(audio.tags["artist"][0])
-            if hasattr(audio, "info") and getattr(audio.info, "length", None) is not None:
-                duration = int(audio.info.length)
-    except Exception:
-        traceback.print_exc()
-
-    return title, uploader, duration
-
-def _make_queue_item(entry: dict, requester: discord.abc.User) -> dict:
-    return {
-        "url": entry["url"],
-        "webpage_url": entry["webpage_url"],
-        "title": entry["title"],
-        "duration": entry["duration"],
-        "uploader": entry["uploader"],
-        "requester": requester,
-    }
+def _make_queue_item(entry: dict, requester: discord.abc.User) -> QueueItem:
+    # Only the requester's id and avatar are kept, so queued tracks don't pin Member objects in memory.
+    return QueueItem(
+        url=entry["url"],
+        webpage_url=entry["webpage_url"],
+        title=entry["title"],
+        duration=entry["duration"],
+        uploader=entry["uploader"],
+        expires_at=entry.get("expires_at"),
+        acodec=entry.get("acodec"),
+        abr=entry.get("abr"),
+        requester_id=requester.id,
+        requester_avatar=requester.display_avatar.url,
+    )
 
-def _enqueue_item(item: dict, front: bool) -> int:
+def _enqueue_item(player: GuildPlayer, item: dict, front: bool) -> int:
     if front:
-        music_queue.insert(0, item)
+        player.queue.appendleft(item)
+        _discard_prewarmed(player, stale_only=True)
         return 1
 
-    music_queue.append(item)
-    return len(music_queue)
+    player.queue.append(item)
+    return len(player.queue)
 
 def _normalize_query(query: str) -> str:
     raw_query = query.strip()
@@ -519,17 +988,52 @@ def _apply_playlist_metadata(entry: dict, metadata: dict | None) -> dict:
 
     return merged
 
-async def _prefetch_next(n: int = 2):
+def _make_lazy_entry(url: str, metadata: dict | None = None) -> dict:
+    # Queued without a stream URL (url is None) until _resolve_lazy_item runs near the front of the queue.
+    webpage_url = canonical_url(url) or url
+    cached = cache_store.get(webpage_url) if USE_CACHE else None
+    if cached is not None and cached.get("url"):
+        return _apply_playlist_metadata(cached, metadata)
+    metadata = metadata or {}
+    return {
+        "url": None,
+        "webpage_url": webpage_url,
+        "title": metadata.get("title") or webpage_url,
+        "duration": int(metadata.get("duration") or 0),
+        "uploader": metadata.get("uploader") or "Unknown",
+    }
+
+async def _resolve_lazy_item(item: dict) -> dict:
+    if item["url"] is not None:
+        return item
+    try:
+        entry = await _single_flight(f"lazy:{item['webpage_url']}", lambda: _resolve_track_entry(item["webpage_url"]))
+    except Exception:
+        inc("lazy_resolves_total", result="error")
+        raise
+    inc("lazy_resolves_total", result="ok")
+    # Titles from the playlist stay when the extracted one is just a file name; webpage_url is left alone (TrackQueue indexes it).
+    placeholder = item["title"] == item["webpage_url"]
+    entry = _apply_playlist_metadata(entry, {"title": None if placeholder else item["title"], "duration": item["duration"]})
+    for k in ("url", "title", "duration", "uploader", "expires_at", "acodec", "abr"):
+        item[k] = entry.get(k)
+    return item
+
+async def _prefetch_next(player: GuildPlayer, n: int = 2):
     tasks = []
-    for item in music_queue[:max(0, n)]:
+    for item in player.queue[:max(0, n)]:
         async def ensure_item(i=item):
-            ok = await _url_is_valid(i["url"])
-            if not ok:
-                entry = key_map.get(i["webpage_url"])
+            if i["url"] is None:
+                await _resolve_lazy_item(i)
+                return
+            if audio_cache and audio_cache.has(i.get("webpage_url")):
+                return
+            if await _stream_url_needs_refresh(i):
+                entry = cache_store.find_url(i["webpage_url"])
                 if entry:
                     await _refresh_entry_in_place(entry)
-                    for k in ("url", "duration", "title", "uploader"):
-                        i[k] = entry[k]
+                    for k in ("url", "duration", "title", "uploader", "expires_at", "acodec", "abr"):
+                        i[k] = entry.get(k)
         tasks.append(asyncio.create_task(ensure_item()))
     if tasks:
         results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -538,63 +1042,184 @@ async def _prefetch_next(n: int = 2):
                 traceback.print_exception(type(r), r, r.__traceback__)
 
 async def _extract_direct_media_info(url: str, content_type: str | None = None) -> dict:
-    tmp_path = None
+    path = urlparse(url).path or ""
+    name = os.path.basename(path)
+    if not os.path.splitext(name)[1]:
+        name += _content_type_to_suffix(content_type)
+
+    title = os.path.basename(path) or "Unknown title"
+    if "." in title:
+        title = ".".join(title.split(".")[:-1]) or title
+
     try:
-        sess = get_session()
-        async with sess.get(url) as resp:
-            resp.raise_for_status()
-            path = urlparse(url).path or ""
-            ext = os.path.splitext(path)[1]
-            resp_ct = resp.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
-            ext = ext or _content_type_to_suffix(content_type or resp_ct)
-
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext if ext else None)
-            tmp_path = tmp.name
-            try:
-                async for chunk in resp.content.iter_chunked(1024 * 64):
-                    if chunk:
-                        tmp.write(chunk)
-            finally:
-                tmp.close()
-
-        title = os.path.basename(path) or "Unknown title"
-        if "." in title:
-            title = ".".join(title.split(".")[:-1]) or title
-
-        title, uploader, duration = _extract_media_tags(tmp_path, title, "Remote File")
-        return {
-            "url": url,
-            "webpage_url": url,
-            "title": title or "Unknown title",
-            "duration": duration or 0,
-            "uploader": uploader or "Remote File",
-        }
+        # Only the header / trailer ranges the tag parser reads are fetched; ffmpeg streams the file itself.
+        with span("http.probe"):
+            tags = await media_probe_service.probe(get_session(), url, name or "remote")
     except Exception:
         traceback.print_exc()
         raise
-    finally:
-        if tmp_path:
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                traceback.print_exc()
+
+    return {
+        "url": url,
+        "webpage_url": url,
+        "title": tags["title"] or title or "Unknown title",
+        "duration": tags["duration"] or 0,
+        "uploader": tags["artist"] or "Remote File",
+    }
+
+def _note_cache_hit(entry: dict) -> dict:
+    entry["hits"] = entry.get("hits", 0) + 1
+    entry["last_used"] = time.time()
+    save_counters(entry, hits=1)
+    return entry
+
+def _popular_entries_due() -> list[dict]:
+    popular = heapq.nlargest(
+        CACHE_REFRESH_TOP_N,
+        (e for e in cache_store if e.get("hits") and e.get("webpage_url")),
+        key=lambda e: (e["hits"], e.get("last_used", 0)),
+    )
+    now = time.time()
+    due = []
+    for entry in popular:
+        expires_at = entry.get("expires_at") or _stream_url_expires_at(entry.get("url"))
+        if expires_at is None or expires_at - now < CACHE_REFRESH_AHEAD:
+            due.append(entry)
+    return due
+
+async def _refresh_popular_entries():
+    for entry in _popular_entries_due():
+        # Background refreshes only run while no user-facing extraction is waiting for a worker.
+        while extraction_service is not None and extraction_service.pending:
+            await asyncio.sleep(1)
+        if shutting_down:
+            return
+        try:
+            await _refresh_entry_in_place(entry)
+            stream_url_stats["background_refreshes"] += 1
+        except Exception:
+            traceback.print_exc()
+        await asyncio.sleep(1 / CACHE_REFRESH_RATE)
+
+async def _download_audio(entry: dict):
+    if not is_direct_media_url(entry.get("url")):
+        # HLS formats (SoundCloud m3u8) keep streaming; no extraction is spent on a refresh for them.
+        audio_cache.stats["skipped"] += 1
+        return
+    if await _stream_url_needs_refresh(entry):
+        await _refresh_entry_in_place(entry)
+    path = await audio_cache.download(get_session(), entry["webpage_url"], entry["url"], entry.get("http_headers"))
+    if path:
+        await asyncio.to_thread(audio_cache.evict)
+
+async def _cache_audio(entry: dict):
+    try:
+        await _single_flight(f"audio:{entry['webpage_url']}", lambda: _download_audio(entry))
+    except Exception:
+        traceback.print_exc()
+
+def _note_play(item: dict):
+    if not item["url"].startswith("http"):
+        return
+    entry = cache_store.find_url(item.get("webpage_url"))
+    if entry is None:
+        return
+    entry["plays"] = entry.get("plays", 0) + 1
+    save_counters(entry, plays=1)
+    if audio_cache and entry["plays"] >= AUDIO_CACHE_MIN_PLAYS and not audio_cache.has(entry["webpage_url"]):
+        asyncio.create_task(_cache_audio(entry))
+
+async def _cache_popular_audio():
+    popular = heapq.nlargest(
+        AUDIO_CACHE_TOP_N,
+        (e for e in cache_store if e.get("hits") and e.get("webpage_url")),
+        key=lambda e: (e["hits"], e.get("plays", 0)),
+    )
+    for entry in popular:
+        if shutting_down:
+            return
+        if audio_cache.has(entry["webpage_url"]):
+            continue
+        while extraction_service is not None and extraction_service.pending:
+            await asyncio.sleep(1)
+        await _cache_audio(entry)
+
+def _popular_refresh_enabled() -> bool:
+    return CACHE_REFRESH_TOP_N > 0 and CACHE_REFRESH_RATE > 0
+
+async def _cache_refresher():
+    if audio_cache:
+        await asyncio.to_thread(audio_cache.clear_partials)
+    while True:
+        await asyncio.sleep(CACHE_REFRESH_INTERVAL)
+        try:
+            if _popular_refresh_enabled():
+                await _refresh_popular_entries()
+            if audio_cache and AUDIO_CACHE_TOP_N > 0:
+                await _cache_popular_audio()
+        except Exception:
+            traceback.print_exc()
+
+async def _lookup_cache_entry(key: str) -> dict | None:
+    entry = cache_store.get(key)
+    if entry is not None or not SHARED_CACHE:
+        return entry
+    try:
+        found = await asyncio.to_thread(cache_backend.lookup, key)
+    except Exception:
+        traceback.print_exc()
+        return None
+    if found is None:
+        return None
+    # Resolved by another shard process since this one loaded the cache.
+    return cache_store.upsert(found, *found["keys"])
 
 async def _extract_cached_or_raw_entry(search_str: str, *cache_keys: str) -> dict:
+    started = time.perf_counter()
+    kind = "search" if search_str.startswith("ytsearch") else "url"
     for key in cache_keys:
-        if USE_CACHE and key in key_map:
-            return key_map[key]
+        if USE_CACHE and key:
+            entry = await _lookup_cache_entry(key)
+            if entry is not None:
+                observe("cache.hit", time.perf_counter() - started)
+                inc("cache_lookups_total", kind=kind, result="hit")
+                return _note_cache_hit(entry)
+    if USE_CACHE and kind == "search" and SEARCH_MATCH_THRESHOLD is not None:
+        for key in cache_keys:
+            found = cache_store.match(key, SEARCH_MATCH_THRESHOLD) if key else None
+            if found is not None:
+                entry = found[0]
+                # Remember this spelling so the next lookup is an exact hit, also for other shard processes.
+                cache_store.add_keys(entry, key)
+                save_cache(entry)
+                observe("cache.hit", time.perf_counter() - started)
+                inc("cache_lookups_total", kind=kind, result="normalized_hit")
+                return _note_cache_hit(entry)
+    observe("cache.miss_lookup", time.perf_counter() - started)
+    inc("cache_lookups_total", kind=kind, result="miss")
+
+    flight_key = canonical_url(search_str) or search_str.strip().lower()
+    entry = await _single_flight(f"resolve:{flight_key}", lambda: _extract_raw_entry(search_str, *cache_keys))
+    if USE_CACHE and any(key and key not in entry["keys"] for key in cache_keys):
+        # Callers that joined another caller's extraction still get their own spelling cached.
+        cache_store.add_keys(entry, *cache_keys)
+        save_cache(entry)
+    return entry
 
-    raw = await asyncio.to_thread(lambda: stream_ydl.extract_info(search_str, download=False))
+async def _extract_raw_entry(search_str: str, *cache_keys: str) -> dict:
+    raw = await _extract_info(search_str)
     if "entries" in raw:
         entries = raw.get("entries") or []
         if not entries:
             raise RuntimeError("No entries returned while resolving track")
         raw = entries[0]
 
-    info = {k: raw.get(k) for k in ("url", "webpage_url", "title", "duration", "uploader")}
+    info = {k: raw.get(k) for k in ("url", "webpage_url", "title", "duration", "uploader", "acodec", "abr")}
     if not info.get("url"):
         raise RuntimeError("No playable URL returned while resolving track")
+    info["expires_at"] = _stream_url_expires_at(info["url"], extracted=True)
 
+    info["last_used"] = time.time()
     return _store_cache_entry(info, *cache_keys)
 
 async def _resolve_http_entry(raw_query: str) -> dict:
@@ -602,10 +1227,11 @@ async def _resolve_http_entry(raw_query: str) -> dict:
     sess = get_session()
 
     try:
-        async with sess.head(raw_query, allow_redirects=True) as resp:
-            ct = resp.headers.get("Content-Type", "").lower()
-            if ct.startswith("audio/") or ct.startswith("video/"):
-                content_type = ct.split(";", 1)[0]
+        with span("http.head"):
+            async with sess.head(raw_query, allow_redirects=True) as resp:
+                ct = resp.headers.get("Content-Type", "").lower()
+                if ct.startswith("audio/") or ct.startswith("video/"):
+                    content_type = ct.split(";", 1)[0]
     except Exception:
         traceback.print_exc()
 
@@ -616,7 +1242,7 @@ async def _resolve_http_entry(raw_query: str) -> dict:
             raise TrackResolveError("Invalid media file or unsupported codec.") from exc
 
     try:
-        raw = await asyncio.to_thread(lambda: stream_ydl.extract_info(raw_query, download=False))
+        raw = await _extract_info(raw_query)
         if "entries" in raw:
             entries = raw.get("entries") or []
             if not entries:
@@ -628,6 +1254,9 @@ async def _resolve_http_entry(raw_query: str) -> dict:
             "title": raw.get("title"),
             "duration": raw.get("duration"),
             "uploader": raw.get("uploader"),
+            "expires_at": _stream_url_expires_at(raw.get("url"), extracted=True),
+            "acodec": raw.get("acodec"),
+            "abr": raw.get("abr"),
         }
     except Exception as exc:
         traceback.print_exc()
@@ -645,13 +1274,17 @@ async def _resolve_track_entry(query: str) -> dict:
 
     try:
         if soundcloud_re.match(raw_query):
-            entry = await _extract_soundcloud_info(raw_query)
+            with span("resolve.soundcloud"):
+                entry = await _extract_soundcloud_info(raw_query)
         elif url_re.match(raw_query):
-            entry = await _extract_cached_or_raw_entry(raw_query, raw_query, canonical_url(raw_query))
+            with span("resolve.youtube_url"):
+                entry = await _extract_cached_or_raw_entry(raw_query, raw_query, canonical_url(raw_query))
         elif generic_http_re.match(raw_query):
-            entry = await _resolve_http_entry(raw_query)
+            with span("resolve.http"):
+                entry = await _resolve_http_entry(raw_query)
         else:
-            entry = await _extract_cached_or_raw_entry(f"ytsearch1:{raw_query}", raw_query.lower())
+            with span("resolve.search"):
+                entry = await _extract_cached_or_raw_entry(f"ytsearch1:{raw_query}", raw_query.lower())
     except TrackResolveError:
         raise
     except Exception as exc:
@@ -667,73 +1300,125 @@ async def _resolve_track_entry(query: str) -> dict:
         "title": entry.get("title") or "Unknown title",
         "duration": entry.get("duration") or 0,
         "uploader": entry.get("uploader") or "Unknown",
+        "expires_at": entry.get("expires_at"),
+        "acodec": entry.get("acodec"),
+        "abr": entry.get("abr"),
     }
 
-async def _play_next():
-    global now_playing_msg
+async def _resolve_queued_item(item: dict) -> bool:
+    try:
+        with span("play.resolve_lazy"):
+            await _resolve_lazy_item(item)
+        return True
+    except TrackResolveError:
+        pass
+    except Exception:
+        traceback.print_exc()
+    return False
+
+async def _send_skipped_tracks(player: GuildPlayer, skipped: list[dict], stopped: bool):
+    if not player.text_channel:
+        return
+    lines = [f"[{item['title']}]({item['webpage_url']})" for item in skipped[:5]]
+    if len(skipped) > 5:
+        lines.append(f"...and {len(skipped) - 5} more")
+    if stopped:
+        # Usually an extractor or network outage rather than bad tracks, so the rest of the queue is kept.
+        lines.append(f"\nStopped after {len(skipped)} tracks in a row failed, {len(player.queue)} still queued. Use `/pauseplay` to continue.")
+    try:
+        await player.text_channel.send(
+            embed=discord.Embed(
+                title=f"Skipped {len(skipped)} Track{'s' if len(skipped) != 1 else ''}",
+                description="\n".join(lines),
+                color=discord.Color.orange(),
+            ),
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+    except discord.HTTPException as e:
+        print(f"Failed to send skipped tracks message: {e}")
+
+async def _play_next(player: GuildPlayer):
     if shutting_down:
         return
 
-    vc = voice_client
+    vc = player.voice_client
     if vc is None or not vc.is_connected():
         return
 
-    if not music_queue:
-        if text_channel:
-            await text_channel.send(
+    if not player.queue:
+        if player.text_channel:
+            await player.text_channel.send(
                 embed=discord.Embed(
                     title="Queue Ended!",
                     description="No more songs. Add some with `/play` or `/next`.",
                     color=discord.Color.blue(),
                 )
             )
-        _arm_idle_timer()
+        _arm_idle_timer(player)
         return
 
-    item = music_queue.pop(0)
-    music_history.insert(0, item)
-
+    item = player.queue.popleft()
+    skipped = []
+    while item["url"] is None and not await _resolve_queued_item(item):
+        skipped.append(item)
+        if not player.queue or len(skipped) >= LAZY_RESOLVE_MAX_FAILURES:
+            await _send_skipped_tracks(player, skipped, stopped=bool(player.queue))
+            _arm_idle_timer(player)
+            return
+        item = player.queue.popleft()
+    if skipped:
+        await _send_skipped_tracks(player, skipped, stopped=False)
+    player.history.appendleft(item)
+    prewarmed = _take_prewarmed(player, item)
+    local_path = None
+    if prewarmed is None and audio_cache and item["url"].startswith("http"):
+        local_path = audio_cache.get(item.get("webpage_url"))
+
+    prepare_started = time.perf_counter()
     try:
-        if item["url"].startswith("http"):
-            if not await _url_is_valid(item["url"]):
-                entry = key_map.get(item["webpage_url"])
+        if prewarmed is None and local_path is None and item["url"].startswith("http"):
+            if await _stream_url_needs_refresh(item):
+                entry = cache_store.find_url(item["webpage_url"])
                 if entry:
                     try:
                         await _refresh_entry_in_place(entry)
-                        for k in ("url", "duration", "title", "uploader"):
-                            item[k] = entry[k]
+                        for k in ("url", "duration", "title", "uploader", "expires_at", "acodec", "abr"):
+                            item[k] = entry.get(k)
+                        inc("play_recoveries_total", step="refresh", result="ok")
                     except Exception:
+                        inc("play_recoveries_total", step="refresh", result="error")
                         traceback.print_exc()
                         try:
-                            flat = await asyncio.to_thread(
-                                lambda: search_ydl.extract_info(f"ytsearch1:{entry['title']}", download=False)
-                            )
+                            flat = await _extract_info(f"ytsearch1:{entry['title']}", profile="flat")
                             entries = flat.get("entries") or []
                             if not entries:
                                 raise RuntimeError("No entries returned while trying to recover track")
                             vid = entries[0]["id"]
-                            raw = await asyncio.to_thread(
-                                lambda: stream_ydl.extract_info(f"https://www.youtube.com/watch?v={vid}", download=False)
-                            )
+                            raw = await _extract_info(f"https://www.youtube.com/watch?v={vid}")
                             if "entries" in raw:
                                 raw_entries = raw.get("entries") or []
                                 if not raw_entries:
                                     raise RuntimeError("No entries returned for recovered video")
                                 raw = raw_entries[0]
-                            for k in ("url", "duration", "title", "uploader"):
+                            for k in ("url", "duration", "title", "uploader", "acodec", "abr"):
                                 entry[k] = raw.get(k)
                                 item[k] = raw.get(k)
-                            save_cache()
+                            entry["expires_at"] = item["expires_at"] = _stream_url_expires_at(raw.get("url"), extracted=True)
+                            stream_url_stats["refreshes"] += 1
+                            save_cache(entry)
+                            inc("play_recoveries_total", step="search", result="ok")
                         except Exception:
+                            inc("play_recoveries_total", step="search", result="error")
                             traceback.print_exc()
     except Exception:
         traceback.print_exc()
+    observe("play.prepare", time.perf_counter() - prepare_started)
 
     def _after_playback(_):
         if shutting_down:
             return
         try:
-            fut = asyncio.run_coroutine_threadsafe(_play_next(), bot.loop)
+            fut = asyncio.run_coroutine_threadsafe(_play_next(player), bot.loop)
             fut.result()
         except Exception:
             if not shutting_down:
@@ -741,26 +1426,30 @@ async def _play_next():
 
     play_kwargs = {"after": _after_playback, **_voice_playback_kwargs()}
     try:
-        vc.play(
-            discord.FFmpegPCMAudio(
-                item["url"],
-                before_options=_ffmpeg_before_options(),
-            ),
-            **play_kwargs,
-        )
+        if prewarmed is not None:
+            source = prewarmed
+        else:
+            with span("ffmpeg.spawn"):
+                source = _make_audio_source(item, local_path or item["url"], local=local_path is not None)
+        vc.play(FirstFrameTimer(source, item.pop("requested_at", None)), **play_kwargs)
     except discord.ClientException:
-        if music_history and music_history[0] is item:
-            music_history.pop(0)
-        music_queue.insert(0, item)
+        if prewarmed:
+            prewarmed.cleanup()
+        if player.history and player.history[0] is item:
+            player.history.popleft()
+        player.queue.appendleft(item)
         if not shutting_down:
             traceback.print_exc()
         return
 
-    asyncio.create_task(_prefetch_next(2))
+    _note_play(item)
+    asyncio.create_task(_prefetch_next(player, 2))
+    if PREWARM_SECONDS > 0:
+        player.prewarm_task = asyncio.create_task(_prewarm_next(player, item))
 
-    if now_playing_msg:
+    if player.now_playing_msg:
         try:
-            await now_playing_msg.delete()
+            await player.now_playing_msg.delete()
         except discord.HTTPException as e:
             print(f"Failed to delete now playing message: {e}")
 
@@ -770,31 +1459,100 @@ async def _play_next():
             description=f"[{item['title']}]({item['webpage_url']}) ",
             color=discord.Color.blue(),
         )
-        .set_author(name="Now Playing", icon_url=item["requester"].display_avatar.url)
-        .add_field(name="Requested By", value=item["requester"].mention, inline=True)
+        .set_author(name="Now Playing", icon_url=item["requester_avatar"])
+        .add_field(name="Requested By", value=f"<@{item['requester_id']}>", inline=True)
         .add_field(name="Duration", value=f"`{format_duration(item['duration'])}`", inline=True)
         .add_field(name="Author", value=f"`{item['uploader']}`", inline=True)
     )
 
-    if text_channel:
-        now_playing_msg = await text_channel.send(
-            embed=embed,
-            view=NowPlayingView(),
-            allowed_mentions=discord.AllowedMentions.none(),
-        )
+    if player.text_channel:
+        with span("discord.now_playing"):
+            player.now_playing_msg = await player.text_channel.send(
+                embed=embed,
+                view=NowPlayingView(),
+                allowed_mentions=discord.AllowedMentions.none(),
+            )
 
-def make_queue_embed(page: int = 0) -> discord.Embed:
-    total = len(music_queue)
+async def _prewarm_next(player: GuildPlayer, current: dict):
+    vc = player.voice_client
+    duration = current.get("duration") or 0
+    if not duration:
+        return
+
+    # Paused time doesn't count, so this tracks playback position rather than wall time.
+    played = 0
+    while played < duration - PREWARM_SECONDS:
+        await asyncio.sleep(1)
+        if shutting_down or vc is not player.voice_client or not vc.is_connected():
+            return
+        if not player.history or player.history[0] is not current:
+            return
+        if vc.is_playing():
+            played += 1
+
+    if not player.queue or player.prewarmed:
+        return
+    nxt = player.queue[0]
+    if nxt["url"] is None:
+        # Not resolved yet (the prefetch failed or is still running); _play_next resolves it.
+        return
+    local_path = audio_cache.get(nxt.get("webpage_url")) if audio_cache and nxt["url"].startswith("http") else None
+    if local_path is None and nxt["url"].startswith("http") and _stream_url_state(nxt) == "stale":
+        # _play_next refreshes it; a prewarmed ffmpeg would only be reading a dead URL.
+        return
+
+    source = None
+    try:
+        source = _make_audio_source(nxt, local_path or nxt["url"], local=local_path is not None)
+        frames = await asyncio.to_thread(_read_frames, source, PREWARM_FRAMES)
+    except asyncio.CancelledError:
+        # Killing ffmpeg also ends a read still blocked in the worker thread.
+        if source is not None:
+            source.cleanup()
+        raise
+    except Exception:
+        traceback.print_exc()
+        if source is not None:
+            source.cleanup()
+        return
+    if not frames:
+        source.cleanup()
+        return
+
+    if shutting_down or player.prewarmed or not player.queue or player.queue[0] is not nxt or not player.history or player.history[0] is not current:
+        source.cleanup()
+        return
+    player.prewarmed = (nxt, PrewarmedSource(source, frames))
+
+def _build_queue_export_m3u8(player: GuildPlayer) -> str:
+    entries = []
+    if player.history:
+        current = player.history[0]
+        if _playlist_export_url(current):
+            entries.append(current)
+
+    for item in player.queue:
+        if _playlist_export_url(item):
+            entries.append(item)
+
+    lines = ["#EXTM3U"]
+    for item in entries:
+        lines.append(f"#EXTINF:{_playlist_export_duration(item)},{_playlist_export_title(item)}")
+        lines.append(_playlist_export_url(item))
+    return "\n".join(lines) + "\n"
+
+def make_queue_embed(player: GuildPlayer, page: int = 0) -> discord.Embed:
+    total = len(player.queue)
     e = discord.Embed(
         title=f"Queue - [{total} Tracks]",
         color=discord.Color.blue(),
     )
-    if text_channel and text_channel.guild and text_channel.guild.icon:
-        e.set_thumbnail(url=text_channel.guild.icon.url)
+    if player.text_channel and player.text_channel.guild and player.text_channel.guild.icon:
+        e.set_thumbnail(url=player.text_channel.guild.icon.url)
 
     start = page * 10
     lines = []
-    for idx, item in enumerate(music_queue[start:start + 10], start=start + 1):
+    for idx, item in enumerate(player.queue[start:start + 10], start=start + 1):
         title = (item["title"][:61] + "…") if len(item["title"]) > 61 else item["title"]
         lines.append(f"**{idx}.** [{title}]({item['webpage_url']}) `{format_duration(item['duration'])}`")
 
@@ -807,9 +1565,11 @@ class NowPlayingView(View):
 
     @button(label="🔀 Shuffle", style=discord.ButtonStyle.primary, custom_id="shuffle")
     async def shuffle(self, inter: discord.Interaction, _btn: Button):
+        player = players.get(inter.guild_id)
         try:
-            if music_queue:
-                random.shuffle(music_queue)
+            if player is not None and player.queue:
+                player.queue.shuffle()
+                _discard_prewarmed(player, stale_only=True)
                 desc = f"{inter.user.mention} shuffled the queue"
             else:
                 desc = f"{inter.user.mention} tried to shuffle but queue empty"
@@ -824,11 +1584,13 @@ class NowPlayingView(View):
 
     @button(label="⏮️ Back", style=discord.ButtonStyle.primary, custom_id="previous")
     async def previous(self, inter: discord.Interaction, _btn: Button):
+        player = players.get(inter.guild_id)
         try:
-            if music_history and voice_client and voice_client.is_connected():
-                prev = music_history.pop(0)
-                music_queue.insert(0, prev)
-                voice_client.stop()
+            if player is not None and player.history and player.voice_client and player.voice_client.is_connected():
+                prev = player.history.popleft()
+                player.queue.appendleft(prev)
+                _discard_prewarmed(player, stale_only=True)
+                player.voice_client.stop()
                 await inter.response.send_message(
                     embed=discord.Embed(
                         title="⏮ Playing Previous Track",
@@ -851,14 +1613,15 @@ class NowPlayingView(View):
 
     @button(label="⏸ Pause", style=discord.ButtonStyle.primary, custom_id="pauseplay")
     async def pauseplay(self, inter: discord.Interaction, btn: Button):
+        player = players.get(inter.guild_id)
         try:
-            if not voice_client or not voice_client.is_connected():
+            if player is None or not player.voice_client or not player.voice_client.is_connected():
                 return await inter.response.send_message("🚫 I'm not in a voice channel.", ephemeral=True)
 
-            if voice_client.is_playing():
-                voice_client.pause()
+            if player.voice_client.is_playing():
+                player.voice_client.pause()
                 btn.label = "▶️ Play"
-                _arm_idle_timer()
+                _arm_idle_timer(player)
                 await inter.response.edit_message(view=self)
                 return await inter.followup.send(
                     embed=discord.Embed(description=f"{inter.user.mention} paused playback", color=discord.Color.blue()),
@@ -866,8 +1629,8 @@ class NowPlayingView(View):
                     ephemeral=False
                 )
 
-            if voice_client.is_paused():
-                voice_client.resume()
+            if player.voice_client.is_paused():
+                player.voice_client.resume()
                 btn.label = "⏸ Pause"
                 await inter.response.edit_message(view=self)
                 return await inter.followup.send(
@@ -876,8 +1639,8 @@ class NowPlayingView(View):
                     ephemeral=False
                 )
 
-            if music_queue:
-                await _play_next()
+            if player.queue:
+                await _play_next(player)
                 return await inter.response.send_message(
                     embed=discord.Embed(description=f"{inter.user.mention} started playback", color=discord.Color.blue()),
                     allowed_mentions=discord.AllowedMentions.none(),
@@ -905,10 +1668,11 @@ class NowPlayingView(View):
 
     @button(label="⏭ Next", style=discord.ButtonStyle.primary, custom_id="skip")
     async def skip(self, inter: discord.Interaction, _btn: Button):
+        player = players.get(inter.guild_id)
         try:
-            if voice_client and voice_client.is_connected() and (voice_client.is_playing() or voice_client.is_paused()):
-                current = music_history[0] if music_history else None
-                voice_client.stop()
+            if player is not None and player.voice_client and player.voice_client.is_connected() and (player.voice_client.is_playing() or player.voice_client.is_paused()):
+                current = player.history[0] if player.history else None
+                player.voice_client.stop()
                 if current:
                     await inter.response.send_message(
                         embed=discord.Embed(
@@ -943,8 +1707,10 @@ class NowPlayingView(View):
 
     @button(label="⏹ Stop", style=discord.ButtonStyle.danger, custom_id="stop")
     async def stop(self, inter: discord.Interaction, _btn: Button):
+        player = players.get(inter.guild_id)
         try:
-            await clear_all()
+            if player is not None:
+                await clear_all(player)
             await inter.response.send_message(
                 embed=discord.Embed(
                     description=f"{inter.user.mention} stopped playback and cleared the queue",
@@ -959,29 +1725,38 @@ class NowPlayingView(View):
 
 
 class QueueView(View):
-    def __init__(self, page: int = 0):
+    def __init__(self, player: GuildPlayer, page: int = 0):
         super().__init__(timeout=None)
         self.page = page
         self.prev_page.disabled = self.page == 0
-        self.next_page.disabled = (self.page + 1) * 10 >= len(music_queue)
+        self.next_page.disabled = (self.page + 1) * 10 >= len(player.queue)
 
     @button(label="⬅ Prev", style=discord.ButtonStyle.secondary, custom_id="prev_page")
     async def prev_page(self, inter: discord.Interaction, btn: Button):
+        player = players.get(inter.guild_id)
+        if player is None:
+            return await inter.response.send_message("📭 Queue is empty.", ephemeral=True)
         self.page -= 1
         self.prev_page.disabled = self.page == 0
-        self.next_page.disabled = (self.page + 1) * 10 >= len(music_queue)
-        await inter.response.edit_message(embed=make_queue_embed(self.page), view=self)
+        self.next_page.disabled = (self.page + 1) * 10 >= len(player.queue)
+        await inter.response.edit_message(embed=make_queue_embed(player, self.page), view=self)
 
     @button(label="Next ➡", style=discord.ButtonStyle.secondary, custom_id="next_page")
     async def next_page(self, inter: discord.Interaction, btn: Button):
+        player = players.get(inter.guild_id)
+        if player is None:
+            return await inter.response.send_message("📭 Queue is empty.", ephemeral=True)
         self.page += 1
-        self.next_page.disabled = (self.page + 1) * 10 >= len(music_queue)
+        self.next_page.disabled = (self.page + 1) * 10 >= len(player.queue)
         self.prev_page.disabled = self.page == 0
-        await inter.response.edit_message(embed=make_queue_embed(self.page), view=self)
+        await inter.response.edit_message(embed=make_queue_embed(player, self.page), view=self)
 
     @button(label="Export", style=discord.ButtonStyle.secondary, custom_id="export_queue")
     async def export_queue(self, inter: discord.Interaction, _btn: Button):
-        playlist_text = _build_queue_export_m3u8()
+        player = players.get(inter.guild_id)
+        if player is None:
+            return await inter.response.send_message("📭 Queue is empty.", ephemeral=True)
+        playlist_text = _build_queue_export_m3u8(player)
         payload = io.BytesIO(playlist_text.encode("utf-8"))
         payload.seek(0)
         await inter.response.send_message(
@@ -990,14 +1765,7 @@ class QueueView(View):
         )
 
 async def _extract_soundcloud_info(url: str) -> dict:
-    def _run():
-        soundcloud_opts = _build_ydl_opts()
-        soundcloud_opts["geo_bypass"] = True
-        soundcloud_opts["geo_bypass_country"] = "US"
-        with YoutubeDL(soundcloud_opts) as ydl:
-            return ydl.extract_info(url, download=False)
-
-    raw = await asyncio.to_thread(_run)
+    raw = await _extract_info(url, profile="soundcloud")
     if "entries" in raw:
         entries = raw.get("entries") or []
         if not entries:
@@ -1007,6 +1775,7 @@ async def _extract_soundcloud_info(url: str) -> dict:
     fmts = raw.get("formats") or []
     fmt_url = raw.get("url")
     chosen_headers = raw.get("http_headers") or {}
+    chosen_fmt = raw
 
     if fmts:
         candidates = [f for f in fmts if f.get("acodec") not in (None, "none")]
@@ -1014,6 +1783,8 @@ async def _extract_soundcloud_info(url: str) -> dict:
             candidates = fmts
         best = _pick_soundcloud_format(candidates)
         fmt_url = best.get("url") or fmt_url
+        if best.get("url"):
+            chosen_fmt = best
         if not chosen_headers:
             chosen_headers = best.get("http_headers") or chosen_headers
 
@@ -1029,11 +1800,15 @@ async def _extract_soundcloud_info(url: str) -> dict:
         "duration": raw.get("duration") or 0,
         "uploader": raw.get("uploader") or raw.get("uploader_id") or "Unknown",
         "http_headers": chosen_headers,
+        "expires_at": _stream_url_expires_at(fmt_url, extracted=True),
+        "acodec": chosen_fmt.get("acodec"),
+        "abr": chosen_fmt.get("abr"),
     }
 
     return info
 
 async def _handle_add_legacy(inter: discord.Interaction, query: str, front: bool):
+    player = get_player(inter.guild_id)
     try:
         raw_query = query.strip()
         if raw_query.lower().startswith("query:"):
@@ -1051,34 +1826,18 @@ async def _handle_add_legacy(inter: discord.Interaction, query: str, front: bool
 
         elif is_yt:
             key = raw_query
-            if USE_CACHE and key in key_map:
-                entry = key_map[key]
+            if USE_CACHE and key in cache_store:
+                entry = cache_store.get(key)
             else:
                 search_str = raw_query
-                raw = await asyncio.to_thread(lambda: stream_ydl.extract_info(search_str, download=False))
+                raw = await _extract_info(search_str)
                 if "entries" in raw:
                     entries = raw.get("entries") or []
                     if not entries:
                         raise RuntimeError("No entries returned for this URL")
                     raw = entries[0]
                 info = {k: raw.get(k) for k in ("url", "webpage_url", "title", "duration", "uploader")}
-                entry = next((e for e in cache_entries if e["webpage_url"] == info["webpage_url"]), None)
-                if entry:
-                    entry.update(info)
-                else:
-                    entry = {"keys": [], **info}
-                    cache_entries.append(entry)
-                if USE_CACHE:
-                    if key not in entry["keys"]:
-                        entry["keys"].append(key)
-                    canon = canonical_url(info["webpage_url"])
-                    if canon and canon not in entry["keys"]:
-                        entry["keys"].append(canon)
-                    key_map.clear()
-                    for e in cache_entries:
-                        for k2 in e["keys"]:
-                            key_map[k2] = e
-                    save_cache()
+                entry = _store_cache_entry(info, key)
 
         elif is_http:
             content_type = None
@@ -1093,68 +1852,7 @@ async def _handle_add_legacy(inter: discord.Interaction, query: str, front: bool
 
             if content_type:
                 try:
-                    async with sess.get(raw_query) as resp:
-                        resp.raise_for_status()
-                        path = urlparse(raw_query).path or ""
-                        ext = os.path.splitext(path)[1]
-
-                        if not ext:
-                            ct_map = {
-                                "audio/mpeg": ".mp3",
-                                "audio/mp3": ".mp3",
-                                "audio/ogg": ".ogg",
-                                "audio/opus": ".opus",
-                                "audio/wav": ".wav",
-                                "audio/x-wav": ".wav",
-                                "audio/flac": ".flac",
-                                "video/mp4": ".mp4",
-                                "video/webm": ".webm",
-                                "video/x-matroska": ".mkv",
-                            }
-                            ext = ct_map.get(content_type, "")
-
-                        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext if ext else None)
-                        tmp_path = tmp.name
-                        try:
-                            async for chunk in resp.content.iter_chunked(1024 * 64):
-                                if chunk:
-                                    tmp.write(chunk)
-                        finally:
-                            tmp.close()
-
-                    title = os.path.basename(path) or "Unknown title"
-                    if "." in title:
-                        title = ".".join(title.split(".")[:-1]) or title
-
-                    uploader = "Remote File"
-                    duration = 0
-
-                    try:
-                        audio = MutagenFile(tmp_path, easy=True)
-                        if audio is not None:
-                            if audio.tags:
-                                if "title" in audio.tags and audio.tags["title"]:
-                                    title = str(audio.tags["title"][0])
-                                if "artist" in audio.tags and audio.tags["artist"]:
-                                    uploader = str(audio.tags["artist"][0])
-                            if hasattr(audio, "info") and getattr(audio.info, "length", None) is not None:
-                                duration = int(audio.info.length)
-                    except Exception:
-                        traceback.print_exc()
-                    finally:
-                        try:
-                            os.remove(tmp_path)
-                        except Exception:
-                            traceback.print_exc()
-
-                    entry = {
-                        "url": raw_query,
-                        "webpage_url": raw_query,
-                        "title": title,
-                        "duration": duration,
-                        "uploader": uploader
-                    }
-
+                    entry = await _extract_direct_media_info(raw_query, content_type)
                 except Exception:
                     traceback.print_exc()
                     err_embed = discord.Embed(
@@ -1167,7 +1865,7 @@ async def _handle_add_legacy(inter: discord.Interaction, query: str, front: bool
 
             else:
                 try:
-                    raw = await asyncio.to_thread(lambda: stream_ydl.extract_info(raw_query, download=False))
+                    raw = await _extract_info(raw_query)
                     if "entries" in raw:
                         entries = raw.get("entries") or []
                         if not entries:
@@ -1192,34 +1890,18 @@ async def _handle_add_legacy(inter: discord.Interaction, query: str, front: bool
 
         else:
             key = raw_query.lower()
-            if USE_CACHE and key in key_map:
-                entry = key_map[key]
+            if USE_CACHE and key in cache_store:
+                entry = cache_store.get(key)
             else:
                 search_str = f"ytsearch1:{raw_query}"
-                raw = await asyncio.to_thread(lambda: stream_ydl.extract_info(search_str, download=False))
+                raw = await _extract_info(search_str)
                 if "entries" in raw:
                     entries = raw.get("entries") or []
                     if not entries:
                         raise RuntimeError("No entries returned for this search")
                     raw = entries[0]
                 info = {k: raw.get(k) for k in ("url", "webpage_url", "title", "duration", "uploader")}
-                entry = next((e for e in cache_entries if e["webpage_url"] == info["webpage_url"]), None)
-                if entry:
-                    entry.update(info)
-                else:
-                    entry = {"keys": [], **info}
-                    cache_entries.append(entry)
-                if USE_CACHE:
-                    if key not in entry["keys"]:
-                        entry["keys"].append(key)
-                    canon = canonical_url(info["webpage_url"])
-                    if canon and canon not in entry["keys"]:
-                        entry["keys"].append(canon)
-                    key_map.clear()
-                    for e in cache_entries:
-                        for k2 in e["keys"]:
-                            key_map[k2] = e
-                    save_cache()
+                entry = _store_cache_entry(info, key)
 
         if not entry or not entry.get("url"):
             err_embed = discord.Embed(
@@ -1230,26 +1912,20 @@ async def _handle_add_legacy(inter: discord.Interaction, query: str, front: bool
             await inter.followup.send(embed=err_embed, ephemeral=True)
             return
 
-        item = {
-            "url": entry["url"],
-            "webpage_url": entry["webpage_url"],
-            "title": entry["title"],
-            "duration": entry["duration"],
-            "uploader": entry["uploader"],
-            "requester": inter.user
-        }
+        item = _make_queue_item(entry, inter.user)
 
         if front:
-            music_queue.insert(0, item)
+            player.queue.appendleft(item)
+            _discard_prewarmed(player, stale_only=True)
             pos = 1
         else:
-            music_queue.append(item)
-            pos = len(music_queue)
+            player.queue.append(item)
+            pos = len(player.queue)
 
-        if pos == 1 and voice_client and not voice_client.is_playing() and not voice_client.is_paused():
-            await _play_next()
+        if pos == 1 and player.voice_client and not player.voice_client.is_playing() and not player.voice_client.is_paused():
+            await _play_next(player)
         else:
-            asyncio.create_task(_prefetch_next(2))
+            asyncio.create_task(_prefetch_next(player, 2))
 
         await inter.followup.send(
             embed=discord.Embed(
@@ -1263,69 +1939,62 @@ async def _handle_add_legacy(inter: discord.Interaction, query: str, front: bool
         traceback.print_exc()
         await inter.followup.send(f"🚫 Error: {e}", ephemeral=True)
 
-async def _handle_file_add(inter: discord.Interaction, attachment: discord.Attachment, front: bool):
+async def _handle_file_add(inter: discord.Interaction, attachments: list[discord.Attachment], front: bool):
+    player = get_player(inter.guild_id)
     try:
-        if attachment is None:
+        attachments = [a for a in attachments if a is not None]
+        if not attachments:
             await inter.followup.send("🚫 No file provided.", ephemeral=True)
             return
 
-        suffix = os.path.splitext(attachment.filename or "")[1]
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix if suffix else None)
-        tmp_path = tmp.name
-        tmp.close()
-        await attachment.save(tmp_path)
-
-        title = attachment.filename or "Unknown title"
-        uploader = "Local File"
-        duration = 0
-
-        try:
-            audio = MutagenFile(tmp_path, easy=True)
-            if audio is not None:
-                if audio.tags:
-                    if "title" in audio.tags and audio.tags["title"]:
-                        title = str(audio.tags["title"][0])
-                    if "artist" in audio.tags and audio.tags["artist"]:
-                        uploader = str(audio.tags["artist"][0])
-                if hasattr(audio, "info") and getattr(audio.info, "length", None) is not None:
-                    duration = int(audio.info.length)
-        except Exception:
-            traceback.print_exc()
-
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            traceback.print_exc()
-
-        item = {
-            "url": attachment.url,
-            "webpage_url": attachment.url,
-            "title": title,
-            "duration": duration,
-            "uploader": uploader,
-            "requester": inter.user
-        }
-
+        with span("attachment.probe"):
+            results = await media_probe_service.probe_attachments(get_session(), attachments)
+
+        added = []
+        for attachment, tags in zip(attachments, results):
+            if isinstance(tags, BaseException):
+                traceback.print_exception(type(tags), tags, tags.__traceback__)
+                tags = {}
+            item = _make_queue_item({
+                "url": attachment.url,
+                "webpage_url": attachment.url,
+                "title": tags.get("title") or attachment.filename or "Unknown title",
+                "duration": tags.get("duration") or 0,
+                "uploader": tags.get("artist") or "Local File",
+            }, inter.user)
+            # Files sent to /next keep their upload order ahead of the rest of the queue.
+            if front:
+                player.queue.insert(len(added), item)
+                pos = len(added) + 1
+            else:
+                player.queue.append(item)
+                pos = len(player.queue)
+            added.append((pos, item))
         if front:
-            music_queue.insert(0, item)
-            pos = 1
-        else:
-            music_queue.append(item)
-            pos = len(music_queue)
+            _discard_prewarmed(player, stale_only=True)
 
-        if pos == 1 and voice_client and not voice_client.is_playing() and not voice_client.is_paused():
-            await _play_next()
+        if added[0][0] == 1 and player.voice_client and not player.voice_client.is_playing() and not player.voice_client.is_paused():
+            await _play_next(player)
         else:
-            asyncio.create_task(_prefetch_next(2))
+            asyncio.create_task(_prefetch_next(player, 2))
 
-        await inter.followup.send(
-            embed=discord.Embed(
+        if len(added) == 1:
+            pos, item = added[0]
+            embed = discord.Embed(
                 title=f"Added to Queue #{pos}",
                 description=f"[{item['title']}]({item['webpage_url']}) " f"`{format_duration(item['duration'])}`",
                 color=discord.Color.blue()
-            ),
-            ephemeral=False
-        )
+            )
+        else:
+            embed = discord.Embed(
+                title=f"Added {len(added)} Files to Queue",
+                description="\n".join(
+                    f"`#{pos}` [{item['title']}]({item['webpage_url']}) `{format_duration(item['duration'])}`"
+                    for pos, item in added
+                ),
+                color=discord.Color.blue()
+            )
+        await inter.followup.send(embed=embed, ephemeral=False)
     except Exception as e:
         traceback.print_exc()
         await inter.followup.send(f"🚫 Error: {e}", ephemeral=True)
@@ -1446,32 +2115,245 @@ class PlaylistErrorsView(View):
         for chunk in chunks[1:]:
             await inter.followup.send(chunk, ephemeral=True)
 
-async def _handle_add(inter: discord.Interaction, query: str, front: bool):
+def _flat_playlist_entry(raw: dict) -> dict | None:
+    title = raw.get("title")
+    if title in {"[Private video]", "[Deleted video]"}:
+        return None
+    url = raw.get("url") or (f"https://www.youtube.com/watch?v={raw['id']}" if raw.get("id") else None)
+    if not url:
+        return None
+    return _make_lazy_entry(url, {
+        "title": title,
+        "duration": raw.get("duration"),
+        "uploader": raw.get("uploader") or raw.get("channel"),
+    })
+
+async def _youtube_playlist_pages(url: str):
+    # Flat extraction a page of playlist_items at a time: ids, titles and durations only, no stream URLs.
+    start = 1
+    while start <= PLAYLIST_MAX_TRACKS:
+        end = min(start + PLAYLIST_PAGE_SIZE - 1, PLAYLIST_MAX_TRACKS)
+        with span("resolve.youtube_playlist"):
+            raw = await _extract_info(url, profile="playlist", params={"playlist_items": f"{start}-{end}"})
+        entries = raw.get("entries") or []
+        yield raw.get("title"), [_flat_playlist_entry(e) for e in entries if e]
+        if len(entries) <= end - start:
+            return
+        start = end + 1
+
+async def _handle_youtube_playlist_add(inter: discord.Interaction, url: str, front: bool):
+    player = get_player(inter.guild_id)
+    items: list[dict] = []
+    title = None
+    unavailable = duplicates = 0
     try:
-        entry = await _resolve_track_entry(query)
+        async for page_title, entries in _youtube_playlist_pages(url):
+            title = title or page_title
+            page = []
+            for entry in entries:
+                if entry is None:
+                    unavailable += 1
+                elif PLAYLIST_SKIP_DUPLICATES and player.queue.has_url(entry["webpage_url"]):
+                    duplicates += 1
+                else:
+                    page.append(_make_queue_item(entry, inter.user))
+            if not page:
+                continue
+            if front:
+                # Right after the last of this playlist's tracks still queued (some may have played or been removed).
+                ours = {id(i) for i in items}
+                pos = max((p + 1 for p, queued in enumerate(player.queue) if id(queued) in ours), default=0)
+                for offset, item in enumerate(page):
+                    player.queue.insert(pos + offset, item)
+                _discard_prewarmed(player, stale_only=True)
+            else:
+                player.queue.extend(page)
+            items.extend(page)
+
+            # Playback starts with the first page; later pages keep loading behind it.
+            if player.voice_client and not player.voice_client.is_playing() and not player.voice_client.is_paused():
+                await _play_next(player)
+            else:
+                asyncio.create_task(_prefetch_next(player, 2))
+    except Exception as e:
+        traceback.print_exc()
+        if not items:
+            await inter.followup.send(embed=_make_track_error_embed(TrackResolveError("Could not read this YouTube playlist.")), ephemeral=True)
+            return
+        print(f"YouTube playlist import stopped early: {e}")
+
+    embed = discord.Embed(
+        title=f"Added {len(items)} track{'s' if len(items) != 1 else ''} to queue",
+        description=f"Imported from [{title or 'YouTube playlist'}]({url})",
+        color=discord.Color.blue() if items else discord.Color.orange()
+    )
+    if unavailable:
+        embed.add_field(name="Unavailable", value=str(unavailable), inline=True)
+    if duplicates:
+        embed.add_field(name="Duplicates Skipped", value=str(duplicates), inline=True)
+    await inter.followup.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
+async def _handle_add(inter: discord.Interaction, query: str, front: bool, requested_at: float | None = None):
+    playlist_url = youtube_playlist_url(_normalize_query(query))
+    if playlist_url is not None:
+        return await _handle_youtube_playlist_add(inter, playlist_url, front)
+
+    player = get_player(inter.guild_id)
+    try:
+        with span("play.resolve"):
+            entry = await _resolve_track_entry(query)
         item = _make_queue_item(entry, inter.user)
-        pos = _enqueue_item(item, front)
+        pos = _enqueue_item(player, item, front)
 
-        if pos == 1 and voice_client and not voice_client.is_playing() and not voice_client.is_paused():
-            await _play_next()
+        if pos == 1 and player.voice_client and not player.voice_client.is_playing() and not player.voice_client.is_paused():
+            item["requested_at"] = requested_at
+            await _play_next(player)
         else:
-            asyncio.create_task(_prefetch_next(2))
+            asyncio.create_task(_prefetch_next(player, 2))
 
-        await inter.followup.send(
-            embed=discord.Embed(
-                title=f"Added to Queue #{pos}",
-                description=f"[{item['title']}]({item['webpage_url']}) `{format_duration(item['duration'])}`",
-                color=discord.Color.blue()
-            ),
-            ephemeral=False
-        )
+        with span("discord.followup"):
+            await inter.followup.send(
+                embed=discord.Embed(
+                    title=f"Added to Queue #{pos}",
+                    description=f"[{item['title']}]({item['webpage_url']}) `{format_duration(item['duration'])}`",
+                    color=discord.Color.blue()
+                ),
+                ephemeral=False
+            )
     except TrackResolveError as e:
         await inter.followup.send(embed=_make_track_error_embed(e), ephemeral=True)
     except Exception as e:
         traceback.print_exc()
         await inter.followup.send(f"Error: {e}", ephemeral=True)
 
+async def _resolve_playlist_line(parsed: dict, limit: asyncio.Semaphore) -> tuple[dict | None, dict | None]:
+    async with limit:
+        try:
+            entry = await _resolve_track_entry(parsed["url"])
+            return _apply_playlist_metadata(entry, parsed.get("metadata")), None
+        except TrackResolveError as exc:
+            return None, {"line": parsed["line"], "error": str(exc)}
+        except Exception as exc:
+            traceback.print_exc()
+            return None, {"line": parsed["line"], "error": f"Unexpected error: {exc}"}
+
+def _make_playlist_progress_embed(filename: str, url: str, resolved: int, failed: int, remaining: int) -> discord.Embed:
+    return (
+        discord.Embed(
+            title="Processing Playlist",
+            description=f"Processing [{filename}]({url})",
+            color=discord.Color.blue()
+        )
+        .add_field(name="Resolved", value=str(resolved), inline=True)
+        .add_field(name="Failed", value=str(failed), inline=True)
+        .add_field(name="Remaining", value=str(remaining), inline=True)
+    )
+
+async def _lazy_playlist_entries(parsed_entries: list[dict], errors: list[dict]) -> list[dict]:
+    entries: list[dict] = []
+    for parsed in parsed_entries:
+        playlist_url = youtube_playlist_url(parsed["url"])
+        if playlist_url is None:
+            entries.append(_make_lazy_entry(parsed["url"], parsed.get("metadata")))
+            continue
+        try:
+            async for _title, page in _youtube_playlist_pages(playlist_url):
+                entries.extend(e for e in page if e is not None)
+        except Exception as exc:
+            traceback.print_exc()
+            errors.append({"line": parsed["line"], "error": f"Could not read YouTube playlist: {exc}"})
+    return entries
+
+async def _expand_playlist_lines(parsed_entries: list[dict], errors: list[dict]) -> list[dict]:
+    # Up-front imports resolve every video of a YouTube playlist line like any other line, each reported under that line.
+    if not any(youtube_playlist_url(p["url"]) for p in parsed_entries):
+        return parsed_entries
+    expanded: list[dict] = []
+    for parsed in parsed_entries:
+        if youtube_playlist_url(parsed["url"]) is None:
+            expanded.append(parsed)
+            continue
+        for entry in await _lazy_playlist_entries([parsed], errors):
+            title = entry["title"] if entry["title"] != entry["webpage_url"] else None
+            expanded.append({"line": parsed["line"], "url": entry["webpage_url"], "metadata": {"title": title, "duration": entry["duration"]}})
+    return expanded
+
+async def _stream_playlist_entries(
+    player: GuildPlayer,
+    inter: discord.Interaction,
+    progress_msg: discord.WebhookMessage,
+    filename: str,
+    url: str,
+    parsed_entries: list[dict],
+    errors: list[dict],
+    duplicates: list[dict],
+    limit: asyncio.Semaphore,
+    shuffle_queue: bool,
+) -> list[dict]:
+    async def resolve_indexed(index: int, parsed: dict):
+        return index, *(await _resolve_playlist_line(parsed, limit))
+
+    if shuffle_queue:
+        player.queue.shuffle()
+        _discard_prewarmed(player, stale_only=True)
+
+    slots: list[tuple[dict | None, dict | None] | None] = [None] * len(parsed_entries)
+    next_index = 0
+    items: list[dict] = []
+    last_progress = time.monotonic()
+    tasks = [asyncio.create_task(resolve_indexed(i, p)) for i, p in enumerate(parsed_entries)]
+
+    try:
+        for done in asyncio.as_completed(tasks):
+            index, entry, error = await done
+            slots[index] = (entry, error)
+
+            # Tracks enter the queue in file order, so a slow line holds back the ones after it.
+            added = False
+            while next_index < len(slots) and slots[next_index] is not None:
+                entry, error = slots[next_index]
+                slots[next_index] = None
+                next_index += 1
+                if error is not None:
+                    errors.append(error)
+                if entry is None:
+                    continue
+                if PLAYLIST_SKIP_DUPLICATES and player.queue.has_url(entry.get("webpage_url")):
+                    duplicates.append(entry)
+                    continue
+                item = _make_queue_item(entry, inter.user)
+                if shuffle_queue:
+                    player.queue.insert(random.randint(0, len(player.queue)), item)
+                    _discard_prewarmed(player, stale_only=True)
+                else:
+                    player.queue.append(item)
+                items.append(item)
+                added = True
+
+            if added and player.voice_client and not player.voice_client.is_playing() and not player.voice_client.is_paused():
+                await _play_next(player)
+
+            now = time.monotonic()
+            if now - last_progress >= PLAYLIST_PROGRESS_INTERVAL:
+                last_progress = now
+                try:
+                    await progress_msg.edit(embed=_make_playlist_progress_embed(
+                        filename, url, len(items), len(errors), len(parsed_entries) - next_index
+                    ))
+                except discord.HTTPException as e:
+                    print(f"Failed to update playlist progress: {e}")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    try:
+        await progress_msg.edit(embed=_make_playlist_progress_embed(filename, url, len(items), len(errors), 0))
+    except discord.HTTPException as e:
+        print(f"Failed to update playlist progress: {e}")
+    return items
+
 async def _handle_playlist_add(inter: discord.Interaction, attachment: discord.Attachment, shuffle_queue: bool):
+    player = get_player(inter.guild_id)
     progress_msg = None
     try:
         if attachment is None:
@@ -1498,24 +2380,42 @@ async def _handle_playlist_add(inter: discord.Interaction, attachment: discord.A
         text = raw.decode("utf-8-sig", errors="ignore")
         parsed_entries, errors = _parse_playlist_entries(text, filename)
 
-        resolved_entries = []
-        for parsed in parsed_entries:
-            try:
-                entry = await _resolve_track_entry(parsed["url"])
-                resolved_entries.append(_apply_playlist_metadata(entry, parsed.get("metadata")))
-            except TrackResolveError as exc:
-                errors.append({"line": parsed["line"], "error": str(exc)})
-            except Exception as exc:
-                traceback.print_exc()
-                errors.append({"line": parsed["line"], "error": f"Unexpected error: {exc}"})
-
-        items = [_make_queue_item(entry, inter.user) for entry in resolved_entries]
-        if items:
-            music_queue.extend(items)
-            if shuffle_queue:
-                random.shuffle(music_queue)
-
-        should_start = bool(items) and voice_client and not voice_client.is_playing() and not voice_client.is_paused()
+        duplicates: list[dict] = []
+        limit = asyncio.Semaphore(max(1, PLAYLIST_RESOLVE_CONCURRENCY))
+        if not PLAYLIST_LAZY:
+            parsed_entries = await _expand_playlist_lines(parsed_entries, errors)
+        if PLAYLIST_STREAMING and not PLAYLIST_LAZY:
+            items = await _stream_playlist_entries(
+                player, inter, progress_msg, filename, attachment.url, parsed_entries, errors, duplicates, limit, shuffle_queue
+            )
+        else:
+            if PLAYLIST_LAZY:
+                results = [(entry, None) for entry in await _lazy_playlist_entries(parsed_entries, errors)]
+            else:
+                results = await asyncio.gather(*(_resolve_playlist_line(p, limit) for p in parsed_entries))
+            resolved_entries = []
+            seen: set[str] = set()
+            for entry, error in results:
+                if error is not None:
+                    errors.append(error)
+                if entry is None:
+                    continue
+                url = entry.get("webpage_url")
+                if PLAYLIST_SKIP_DUPLICATES and (url in seen or player.queue.has_url(url)):
+                    duplicates.append(entry)
+                    continue
+                if url:
+                    seen.add(url)
+                resolved_entries.append(entry)
+
+            items = [_make_queue_item(entry, inter.user) for entry in resolved_entries]
+            if items:
+                player.queue.extend(items)
+                if shuffle_queue:
+                    player.queue.shuffle()
+                    _discard_prewarmed(player, stale_only=True)
+
+        should_start = bool(items) and player.queue and player.voice_client and not player.voice_client.is_playing() and not player.voice_client.is_paused()
 
         result_embed = discord.Embed(
             title=f"Added {len(items)} track{'s' if len(items) != 1 else ''} to queue",
@@ -1524,6 +2424,8 @@ async def _handle_playlist_add(inter: discord.Interaction, attachment: discord.A
         )
         if errors:
             result_embed.add_field(name="Errors", value=str(len(errors)), inline=True)
+        if duplicates:
+            result_embed.add_field(name="Duplicates Skipped", value=str(len(duplicates)), inline=True)
         if shuffle_queue and items:
             result_embed.add_field(name="Queue", value="Shuffled", inline=True)
 
@@ -1534,9 +2436,9 @@ async def _handle_playlist_add(inter: discord.Interaction, attachment: discord.A
             allowed_mentions=discord.AllowedMentions.none()
         )
         if should_start:
-            await _play_next()
+            await _play_next(player)
         elif items:
-            asyncio.create_task(_prefetch_next(2))
+            asyncio.create_task(_prefetch_next(player, 2))
     except Exception as e:
         traceback.print_exc()
         error_embed = discord.Embed(
@@ -1551,20 +2453,20 @@ async def _handle_playlist_add(inter: discord.Interaction, attachment: discord.A
 
 @bot.tree.command(name="nowplaying", description="Refresh the Now Playing message")
 async def nowplaying_cmd(inter: discord.Interaction):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
 
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
 
-    if not (voice_client.is_playing() or voice_client.is_paused()) or not music_history:
+    if not (player.voice_client.is_playing() or player.voice_client.is_paused()) or not player.history:
         return await inter.followup.send("🚫 Nothing is currently playing.", ephemeral=True)
 
-    item = music_history[0]
+    item = player.history[0]
 
-    global now_playing_msg
-    if now_playing_msg:
+    if player.now_playing_msg:
         try:
-            await now_playing_msg.delete()
+            await player.now_playing_msg.delete()
         except discord.HTTPException as e:
             print(e)
 
@@ -1574,13 +2476,13 @@ async def nowplaying_cmd(inter: discord.Interaction):
             description=f"[{item['title']}]({item['webpage_url']}) ",
             color=discord.Color.blue(),
         )
-        .set_author(name="Now Playing", icon_url=item["requester"].display_avatar.url)
-        .add_field(name="Requested By", value=item["requester"].mention, inline=True)
+        .set_author(name="Now Playing", icon_url=item["requester_avatar"])
+        .add_field(name="Requested By", value=f"<@{item['requester_id']}>", inline=True)
         .add_field(name="Duration", value=f"`{format_duration(item['duration'])}`", inline=True)
         .add_field(name="Author", value=f"`{item['uploader']}`", inline=True)
     )
 
-    now_playing_msg = await inter.channel.send(
+    player.now_playing_msg = await inter.channel.send(
         embed=embed,
         view=NowPlayingView(),
         allowed_mentions=discord.AllowedMentions.none(),
@@ -1595,20 +2497,36 @@ async def join(inter: discord.Interaction):
         await inter.followup.send("✅ Joined your voice channel.", ephemeral=False)
 
 @bot.tree.command(name="play", description="Add a song to the queue")
-@app_commands.describe(query="YouTube URL or search terms, or SoundCloud/other URL")
+@app_commands.describe(query="YouTube URL, playlist or search terms, or SoundCloud/other URL")
 async def play(inter: discord.Interaction, query: str):
+    requested_at = time.perf_counter()
+    with span("discord.defer"):
+        await inter.response.defer(thinking=True, ephemeral=False)
+    with span("play.ensure_voice"):
+        if not await ensure_voice(inter):
+            return
+    asyncio.create_task(_handle_add(inter, query, False, requested_at))
+
+@bot.tree.command(name="playfile", description="Add audio/video files to the queue")
+@app_commands.describe(
+    file="Audio or video file attachment",
+    file2="Another file, queued after the first",
+    file3="Another file, queued after the first",
+    file4="Another file, queued after the first",
+    file5="Another file, queued after the first",
+)
+async def playfile(
+    inter: discord.Interaction,
+    file: discord.Attachment,
+    file2: discord.Attachment | None = None,
+    file3: discord.Attachment | None = None,
+    file4: discord.Attachment | None = None,
+    file5: discord.Attachment | None = None,
+):
     await inter.response.defer(thinking=True, ephemeral=False)
     if not await ensure_voice(inter):
         return
-    asyncio.create_task(_handle_add(inter, query, False))
-
-@bot.tree.command(name="playfile", description="Add an audio/video file to the queue")
-@app_commands.describe(file="Audio or video file attachment")
-async def playfile(inter: discord.Interaction, file: discord.Attachment):
-    await inter.response.defer(thinking=True, ephemeral=False)
-    if not await ensure_voice(inter):
-        return
-    asyncio.create_task(_handle_file_add(inter, file, False))
+    asyncio.create_task(_handle_file_add(inter, [file, file2, file3, file4, file5], False))
 
 @bot.tree.command(name="playlist", description="Import a .txt or .m3u8 playlist into the queue")
 @app_commands.describe(file="Upload a .txt or .m3u8 playlist file", shuffle="Shuffle the queue before playback starts")
@@ -1619,23 +2537,27 @@ async def playlist(inter: discord.Interaction, file: discord.Attachment, shuffle
     asyncio.create_task(_handle_playlist_add(inter, file, shuffle))
 
 @bot.tree.command(name="next", description="Add a song next in queue")
-@app_commands.describe(query="YouTube URL or search terms, or SoundCloud/other URL")
+@app_commands.describe(query="YouTube URL, playlist or search terms, or SoundCloud/other URL")
 async def play_next_cmd(inter: discord.Interaction, query: str):
-    await inter.response.defer(thinking=True, ephemeral=False)
-    if not await ensure_voice(inter):
-        return
-    asyncio.create_task(_handle_add(inter, query, True))
+    requested_at = time.perf_counter()
+    with span("discord.defer"):
+        await inter.response.defer(thinking=True, ephemeral=False)
+    with span("play.ensure_voice"):
+        if not await ensure_voice(inter):
+            return
+    asyncio.create_task(_handle_add(inter, query, True, requested_at))
 
 @bot.tree.command(name="skip", description="Skip the current song")
 async def skip(inter: discord.Interaction):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
-    if not (voice_client.is_playing() or voice_client.is_paused()):
+    if not (player.voice_client.is_playing() or player.voice_client.is_paused()):
         return await inter.followup.send("⏭ Nothing is playing.", ephemeral=True)
 
-    current = music_history[0] if music_history else None
-    voice_client.stop()
+    current = player.history[0] if player.history else None
+    player.voice_client.stop()
 
     if current:
         return await inter.followup.send(
@@ -1650,15 +2572,17 @@ async def skip(inter: discord.Interaction):
 
 @bot.tree.command(name="previous", description="Play the previous song")
 async def previous(inter: discord.Interaction):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
-    if not music_history:
+    if not player.history:
         return await inter.followup.send("🚫 No previous track.", ephemeral=True)
 
-    prev = music_history.pop(0)
-    music_queue.insert(0, prev)
-    voice_client.stop()
+    prev = player.history.popleft()
+    player.queue.appendleft(prev)
+    _discard_prewarmed(player, stale_only=True)
+    player.voice_client.stop()
 
     await inter.followup.send(
         embed=discord.Embed(
@@ -1671,53 +2595,59 @@ async def previous(inter: discord.Interaction):
 
 @bot.tree.command(name="pauseplay", description="Toggle pause/play")
 async def pauseplay(inter: discord.Interaction):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
 
-    if voice_client.is_playing():
-        voice_client.pause()
-        _arm_idle_timer()
+    if player.voice_client.is_playing():
+        player.voice_client.pause()
+        _arm_idle_timer(player)
         return await inter.followup.send("⏸ Paused.", ephemeral=False)
 
-    if voice_client.is_paused():
-        voice_client.resume()
+    if player.voice_client.is_paused():
+        player.voice_client.resume()
         return await inter.followup.send("▶ Resumed.", ephemeral=False)
 
-    if music_queue:
-        await _play_next()
+    if player.queue:
+        await _play_next(player)
         return await inter.followup.send("▶ Started playing.", ephemeral=False)
 
     await inter.followup.send("🚫 Nothing in queue.")
         
 @bot.tree.command(name="queue", description="Display the current queue")
 async def queue_cmd(inter: discord.Interaction):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
-    if not music_queue:
+    if not player.queue:
         return await inter.followup.send("📭 Queue is empty.", ephemeral=True)
-    await inter.followup.send(embed=make_queue_embed(), view=QueueView(), ephemeral=False)
+    await inter.followup.send(embed=make_queue_embed(player), view=QueueView(player), ephemeral=False)
 
 @bot.tree.command(name="shuffle", description="Shuffle the queue")
 async def shuffle_cmd(inter: discord.Interaction):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
-    if not music_queue:
+    if not player.queue:
         return await inter.followup.send("📭 Queue is empty.", ephemeral=True)
-    random.shuffle(music_queue)
+    player.queue.shuffle()
+    _discard_prewarmed(player, stale_only=True)
     await inter.followup.send("🔀 Queue shuffled.", ephemeral=False)
 
 @bot.tree.command(name="remove", description="Remove a song by its position")
 @app_commands.describe(position="Position (1-based)")
 async def remove_cmd(inter: discord.Interaction, position: int):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
-    if position < 1 or position > len(music_queue):
+    if position < 1 or position > len(player.queue):
         return await inter.followup.send("🚫 Invalid position.", ephemeral=True)
-    removed = music_queue.pop(position - 1)
+    removed = player.queue.pop(position - 1)
+    _discard_prewarmed(player, stale_only=True)
     embed = discord.Embed(
         title="Removed",
         description=f"[{removed['title']}]({removed['webpage_url']})",
@@ -1725,12 +2655,31 @@ async def remove_cmd(inter: discord.Interaction, position: int):
     )
     await inter.followup.send(embed=embed, ephemeral=False)
 
+@bot.tree.command(name="move", description="Move a song to another position in the queue")
+@app_commands.describe(position="Current position (1-based)", to="New position (1-based)")
+async def move_cmd(inter: discord.Interaction, position: int, to: int):
+    player = players.get(inter.guild_id)
+    await inter.response.defer(thinking=True, ephemeral=False)
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
+        return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
+    if not 1 <= position <= len(player.queue) or not 1 <= to <= len(player.queue):
+        return await inter.followup.send("🚫 Invalid position.", ephemeral=True)
+    moved = player.queue.move(position - 1, to - 1)
+    _discard_prewarmed(player, stale_only=True)
+    embed = discord.Embed(
+        title=f"Moved to #{to}",
+        description=f"[{moved['title']}]({moved['webpage_url']})",
+        color=discord.Color.blue()
+    )
+    await inter.followup.send(embed=embed, ephemeral=False)
+
 @bot.tree.command(name="stop", description="Stop playback and clear the queue")
 async def stop_cmd(inter: discord.Interaction):
+    player = players.get(inter.guild_id)
     await inter.response.defer(thinking=True, ephemeral=False)
-    if not voice_client or not voice_client.is_connected():
+    if player is None or not player.voice_client or not player.voice_client.is_connected():
         return await inter.followup.send("🚫 I'm not in a voice channel.", ephemeral=True)
-    await clear_all()
+    await clear_all(player)
     await inter.followup.send("🛑 Stopped and cleared queue.", ephemeral=False)
 
 async def check_permission(inter: discord.Interaction, OWNER_ONLY: bool):
@@ -1765,37 +2714,52 @@ async def addkey(inter: discord.Interaction, query: str, video_url: str):
     canon = canonical_url(video_url)
     if not canon:
         return await inter.followup.send("🚫 Invalid YouTube URL.", ephemeral=True)
-    raw = await asyncio.to_thread(lambda: stream_ydl.extract_info(canon, download=False))
+    raw = await _extract_info(canon)
     if "entries" in raw:
         entries = raw.get("entries") or []
         if not entries:
             return await inter.followup.send("🚫 No entries returned for this URL.", ephemeral=True)
         raw = entries[0]
-    info = {k: raw.get(k) for k in ("url", "webpage_url", "title", "duration", "uploader")}
-    entry = next((e for e in cache_entries if e["webpage_url"] == info["webpage_url"]), None)
-    if entry:
-        entry.update(info)
-    else:
-        entry = {"keys": [], **info}
-        cache_entries.append(entry)
+    info = {k: raw.get(k) for k in ("url", "webpage_url", "title", "duration", "uploader", "acodec", "abr")}
     lc_q = query.strip().lower()
-    for k in (lc_q, canon):
-        if k not in entry["keys"]:
-            entry["keys"].append(k)
-    key_map.clear()
-    for e in cache_entries:
-        for kk in e["keys"]:
-            key_map[kk] = e
-    save_cache()
+    entry = cache_store.upsert(info, lc_q, canon)
+    save_cache(entry)
     await inter.followup.send(f"✅ Cached `{lc_q}` as `{canon}`", ephemeral=OWNER_ONLY)
 
+@bot.tree.command(name="stats", description="Show playback and cache statistics (admin only)")
+async def stats_cmd(inter: discord.Interaction):
+    if not await check_permission(inter, OWNER_ONLY=True):
+        return
+
+    embed = discord.Embed(title="Stats", color=discord.Color.blue())
+    embed.add_field(name="Cache Entries", value=str(len(cache_store)), inline=True)
+    embed.add_field(
+        name="Voice Sessions",
+        value=str(sum(1 for p in players.values() if p.voice_client and p.voice_client.is_connected())),
+        inline=True,
+    )
+    embed.add_field(name="HEAD Probes", value=str(stream_url_stats["probes"]), inline=True)
+    embed.add_field(name="Probes Saved", value=str(stream_url_stats["probes_saved"]), inline=True)
+    embed.add_field(name="URL Refreshes", value=str(stream_url_stats["refreshes"]), inline=True)
+    embed.add_field(name="Expiry Refreshes", value=str(stream_url_stats["expiry_refreshes"]), inline=True)
+    embed.add_field(name="Background Refreshes", value=str(stream_url_stats["background_refreshes"]), inline=True)
+    if audio_cache:
+        files, size = await asyncio.to_thread(audio_cache.usage)
+        embed.add_field(name="Audio Cache", value=f"{files} files, {size / 1024 / 1024:.0f} MB", inline=True)
+        embed.add_field(name="Local Plays", value=str(audio_cache.stats["hits"]), inline=True)
+    embeds = [embed]
+    latency = format_summaries()
+    if latency:
+        embeds.append(discord.Embed(title="Latency", description=f"```\n{latency[:4000]}\n```", color=discord.Color.blue()))
+    await inter.response.send_message(embeds=embeds, ephemeral=OWNER_ONLY)
+
 @bot.tree.command(name="reloadcache", description="Reload cache from disk")
 async def reloadcache(inter: discord.Interaction):
     if not await check_permission(inter, OWNER_ONLY=True):
         return
     
     await inter.response.defer(thinking=True, ephemeral=False)
-    load_cache()
+    await reload_cache()
     await inter.followup.send("✅ Cache reloaded from disk.", ephemeral=OWNER_ONLY)
 
 @bot.tree.command(name="exportcache", description="Export cache as JSON (admin only)")
@@ -1803,7 +2767,9 @@ async def exportcache(inter: discord.Interaction):
     if not await check_permission(inter, OWNER_ONLY=True):
         return
     
-    await inter.response.send_message("📁 Here is the cache file:", file=discord.File(CACHE_FILE), ephemeral=True)
+    payload = io.BytesIO(json.dumps(copy_entries(cache_store), ensure_ascii=False, indent=2).encode("utf-8"))
+    payload.seek(0)
+    await inter.response.send_message("📁 Here is the cache file:", file=discord.File(payload, filename="cache.json"), ephemeral=True)
 
 @bot.tree.command(name="importcache", description="Import cache from JSON file (admin only)")
 @app_commands.describe(file="Upload the JSON cache export")
@@ -1827,31 +2793,20 @@ async def importcache(inter: discord.Interaction, file: discord.Attachment):
         return await inter.followup.send("🚫 JSON must be a list.", ephemeral=True)
 
     REQUIRED = {"keys", "url", "webpage_url", "title", "duration", "uploader"}
+    OPTIONAL = {"expires_at", "hits", "last_used", "plays", "acodec", "abr"}
     invalid = {}
+    merged = []
 
     for i, entry in enumerate(data):
-        if not isinstance(entry, dict) or set(entry.keys()) != REQUIRED:
+        if not isinstance(entry, dict) or not REQUIRED <= set(entry.keys()) or set(entry.keys()) - REQUIRED - OPTIONAL:
             invalid[i] = "Fields mismatch"
             continue
 
-        info = {f: entry[f] for f in ("url", "webpage_url", "title", "duration", "uploader")}
-        merged = next((e for e in cache_entries if e["webpage_url"] == info["webpage_url"]), None)
-        if merged:
-            merged.update(info)
-        else:
-            merged = {"keys": [], **info}
-            cache_entries.append(merged)
-
-        for k in entry["keys"]:
-            if k not in merged["keys"]:
-                merged["keys"].append(k)
-
-    key_map.clear()
-    for e in cache_entries:
-        for kk in e["keys"]:
-            key_map[kk] = e
+        info = {f: entry[f] for f in ("url", "webpage_url", "title", "duration", "uploader", *OPTIONAL) if f in entry}
+        merged.append(cache_store.upsert(info, *entry["keys"]))
 
-    save_cache()
+    if merged:
+        save_cache(*merged)
 
     msg = "✅ Cache updated!"
     if invalid:
@@ -1862,8 +2817,12 @@ async def importcache(inter: discord.Interaction, file: discord.Attachment):
     
 @bot.event
 async def on_ready():
-    await bot.tree.sync()
-    print(f"Logged in as {bot.user}")
+    if _primary_process():
+        await bot.tree.sync()
+    if SHARD_IDS:
+        print(f"Logged in as {bot.user} (shards {SHARD_IDS} of {bot.shard_count})")
+    else:
+        print(f"Logged in as {bot.user}")
 
 @bot.event
 async def on_disconnect():
@@ -1871,26 +2830,84 @@ async def on_disconnect():
 
 @bot.event
 async def on_voice_state_update(member, before, after):
-    global music_queue, music_history, voice_client, now_playing_msg, text_channel, disconnect_task
+    player = players.get(member.guild.id)
+    if player is None:
+        return
 
     if member == bot.user and before.channel and not after.channel:
-        await _cancel_disconnect_task()
-        music_queue.clear()
-        music_history.clear()
-        voice_client = None
-        now_playing_msg = None
-        text_channel = None
+        await _cancel_disconnect_task(player)
+        player.queue.clear()
+        player.history.clear()
+        player.voice_client = None
+        player.now_playing_msg = None
+        player.text_channel = None
+        _drop_player(player)
         return
 
-    if voice_client and before.channel == voice_client.channel and after.channel != voice_client.channel:
-        channel = voice_client.channel
+    if player.voice_client and before.channel == player.voice_client.channel and after.channel != player.voice_client.channel:
+        channel = player.voice_client.channel
         if channel:
             non_bot_members = [m for m in channel.members if not m.bot]
-            if not non_bot_members and voice_client.is_paused():
-                _arm_idle_timer()
+            if not non_bot_members and player.voice_client.is_paused():
+                _arm_idle_timer(player)
+
+describe("cache_lookups_total", "counter", "Track cache lookups by key type and result")
+describe("cache_flushes_total", "counter", "Cache writes to the backend")
+describe("cache_flush_errors_total", "counter", "Cache writes that raised")
+describe("cache_bytes_written_total", "counter", "Bytes written by the cache backend")
+describe("cache_entries", "gauge", "Entries in the track cache")
+describe("cache_keys", "gauge", "Lookup keys in the track cache")
+describe("ytdlp_extractions_total", "counter", "yt-dlp extractions by profile and result")
+describe("extractor_events_total", "counter", "Extractor worker pool events")
+describe("extractor_pending", "gauge", "Extractions waiting for a worker")
+describe("head_probes_total", "counter", "Stream URL HEAD probes by result")
+describe("play_recoveries_total", "counter", "Stream URL refresh and search recovery attempts in _play_next")
+describe("lazy_resolves_total", "counter", "Lazily queued playlist tracks extracted near the front of the queue")
+describe("stream_url_events_total", "counter", "Stream URL freshness decisions")
+describe("audio_sources_total", "counter", "Audio sources started by playback path")
+describe("queue_length", "gauge", "Tracks queued across all guilds")
+describe("voice_clients", "gauge", "Connected voice clients")
+describe("ffmpeg_processes", "gauge", "Running ffmpeg playback and prewarm processes")
+describe("audio_cache_events_total", "counter", "Local audio cache events")
+describe("media_probe_events_total", "counter", "Media tag probes of attachments and direct URLs")
+
+@register_collector
+def _collect_metrics():
+    yield "cache_entries", {}, len(cache_store)
+    yield "cache_keys", {}, len(cache_store.by_key)
+    yield "cache_bytes_written_total", {"backend": cache_backend.name}, cache_backend.bytes_written
+    yield "queue_length", {}, sum(len(p.queue) for p in players.values())
+    yield "voice_clients", {}, sum(1 for p in players.values() if p.voice_client and p.voice_client.is_connected())
+    yield "ffmpeg_processes", {}, _ffmpeg_process_count()
+    for event, value in stream_url_stats.items():
+        yield "stream_url_events_total", {"event": event}, value
+    if extraction_service is not None:
+        yield "extractor_pending", {}, extraction_service.pending
+        for event, value in extraction_service.stats.items():
+            yield "extractor_events_total", {"event": event}, value
+    if audio_cache:
+        for event, value in audio_cache.stats.items():
+            yield "audio_cache_events_total", {"event": event}, value
+    for event, value in media_probe_service.stats.items():
+        yield "media_probe_events_total", {"event": event}, value
 
 async def _run_bot():
+    global _cache_refresher_task, _metrics_runner
     async with bot:
+        start_cache_writer()
+        if METRICS_PORT:
+            port = METRICS_PORT + (min(SHARD_IDS) if SHARD_IDS else 0)
+            try:
+                _metrics_runner = await start_http_server(METRICS_HOST, port)
+            except OSError:
+                traceback.print_exc()
+        if USE_CACHE and (_popular_refresh_enabled() or audio_cache) and _primary_process():
+            _cache_refresher_task = asyncio.create_task(_cache_refresher())
+        if extraction_service is not None:
+            try:
+                await extraction_service.start()
+            except ExtractorUnavailable:
+                print("Extractor workers unavailable, extracting in threads instead.")
         try:
             await bot.start(TOKEN)
         finally:
@@ -1898,6 +2915,9 @@ async def _run_bot():
 
 def main():
     discord.utils.setup_logging(root=False)
+    if hasattr(signal, "SIGBREAK"):
+        # launcher.py stops shard processes on Windows with Ctrl+Break; shut down like on Ctrl+C instead of dying.
+        signal.signal(signal.SIGBREAK, signal.default_int_handler)
     try:
         asyncio.run(_run_bot())
     except KeyboardInterrupt:
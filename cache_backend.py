@@ -0,0 +1,464 @@
+import argparse, json, math, os, re, sqlite3, threading, time, traceback, unicodedata
+from contextlib import suppress
+from records import Record
+
+NOISE_PHRASES = (
+    "official music video", "official lyric video", "official video", "official audio",
+    "music video", "lyric video", "lyrics video", "with lyrics",
+)
+NOISE_WORDS = {"lyrics", "lyric", "official", "hd", "hq", "4k", "mv", "visualizer"}
+TOKEN_ALIASES = {"ft": "feat", "featuring": "feat"}
+URL_KEY_PREFIXES = ("www.", "youtube.com/", "m.youtube.com/", "music.youtube.com/", "youtu.be/", "soundcloud.com/")
+_non_word_re = re.compile(r"[\W_]+")
+
+def is_search_key(key: str) -> bool:
+    return "://" not in key and not key.startswith(URL_KEY_PREFIXES)
+
+def search_tokens(key: str) -> list[str]:
+    folded = key.casefold()
+    if not folded.isascii():
+        folded = "".join(c for c in unicodedata.normalize("NFKD", folded) if not unicodedata.combining(c))
+    text = f" {_non_word_re.sub(' ', folded)} "
+    for phrase in NOISE_PHRASES:
+        text = text.replace(f" {phrase} ", " ")
+    return sorted({TOKEN_ALIASES.get(t, t) for t in text.split() if t not in NOISE_WORDS})
+
+def normalize_search_key(key: str) -> str:
+    return " ".join(search_tokens(key))
+
+class CacheStore:
+    def __init__(self, record=dict):
+        self.record = record
+        self.by_url: dict = {}
+        self.by_key: dict[str, dict] = {}
+        # Search keys folded to sorted, punctuation and noise free tokens, so respellings of a query share one entry.
+        self.by_norm: dict[str, dict] = {}
+        self.norm_postings: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_url)
+
+    def __iter__(self):
+        return iter(self.by_url.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.by_key
+
+    @property
+    def entries(self) -> list[dict]:
+        return list(self.by_url.values())
+
+    @staticmethod
+    def _url_of(entry: dict):
+        return entry.get("webpage_url") or id(entry)
+
+    def clear(self):
+        self.by_url.clear()
+        self.by_key.clear()
+        self.by_norm.clear()
+        self.norm_postings.clear()
+
+    def load(self, entries: list[dict]):
+        self.clear()
+        for entry in entries:
+            self.upsert(entry, *entry.get("keys", []))
+
+    def get(self, key: str) -> dict | None:
+        return self.by_key.get(key)
+
+    def find_url(self, webpage_url: str | None) -> dict | None:
+        if not webpage_url:
+            return None
+        return self.by_url.get(webpage_url)
+
+    def add_keys(self, entry: dict, *keys: str):
+        entry_keys = entry.setdefault("keys", [])
+        for key in keys:
+            if not key:
+                continue
+            owner = self.by_key.get(key)
+            if owner is not entry:
+                if owner is not None:
+                    with suppress(ValueError):
+                        owner["keys"].remove(key)
+                self.by_key[key] = entry
+            if key not in entry_keys:
+                entry_keys.append(key)
+            if is_search_key(key):
+                self._index_norm(normalize_search_key(key), entry)
+
+    def _index_norm(self, norm: str, entry: dict):
+        if not norm:
+            return
+        if norm not in self.by_norm:
+            for token in norm.split():
+                self.norm_postings.setdefault(token, set()).add(norm)
+        self.by_norm[norm] = entry
+
+    def _unindex_norm(self, norm: str):
+        if self.by_norm.pop(norm, None) is None:
+            return
+        for token in norm.split():
+            postings = self.norm_postings.get(token)
+            if postings is not None:
+                postings.discard(norm)
+                if not postings:
+                    del self.norm_postings[token]
+
+    def match(self, key: str, threshold: float = 1.0) -> tuple[dict, float] | None:
+        tokens = search_tokens(key)
+        if not tokens:
+            return None
+        entry = self.by_norm.get(" ".join(tokens))
+        if entry is not None:
+            return entry, 1.0
+        if threshold >= 1:
+            return None
+
+        # Any key with a token Jaccard score >= threshold shares one of the query's rarest few tokens.
+        query = set(tokens)
+        rarest = sorted(tokens, key=lambda t: len(self.norm_postings.get(t, ())))
+        best, best_score, seen = None, 0.0, set()
+        for token in rarest[:len(tokens) - math.ceil(threshold * len(tokens) - 1e-9) + 1]:
+            for norm in self.norm_postings.get(token, ()):
+                if norm in seen:
+                    continue
+                seen.add(norm)
+                other = set(norm.split())
+                score = len(query & other) / len(query | other)
+                if score > best_score:
+                    best, best_score = norm, score
+        if best is None or best_score < threshold:
+            return None
+        return self.by_norm[best], best_score
+
+    def upsert(self, info: dict, *keys: str) -> dict:
+        url = self._url_of(info)
+        entry = self.by_url.get(url)
+        if entry is None:
+            entry = self.record({"keys": [], **{k: v for k, v in info.items() if k != "keys"}})
+            self.by_url[self._url_of(entry)] = entry
+        elif entry is not info:
+            entry.update({k: v for k, v in info.items() if k != "keys"})
+        self.add_keys(entry, *keys)
+        return entry
+
+    def remove(self, entry: dict):
+        self.by_url.pop(self._url_of(entry), None)
+        for key in entry.get("keys", []):
+            if self.by_key.get(key) is entry:
+                del self.by_key[key]
+            if is_search_key(key):
+                norm = normalize_search_key(key)
+                if self.by_norm.get(norm) is entry:
+                    self._unindex_norm(norm)
+
+def copy_entries(entries) -> list[dict]:
+    return [{**(e.to_dict() if isinstance(e, Record) else e), "keys": list(e.get("keys", []))} for e in entries]
+
+class CacheBackend:
+    name = "base"
+    bytes_written = 0
+
+    def load(self) -> list[dict]:
+        raise NotImplementedError
+
+    def write(self, entries: list[dict]):
+        raise NotImplementedError
+
+    def write_all(self, entries: list[dict]):
+        raise NotImplementedError
+
+    def lookup(self, key: str) -> dict | None:
+        return None
+
+    def add_counters(self, counters: list[tuple[str, int, int, float]]) -> dict[str, tuple[int, int, float]]:
+        raise NotImplementedError
+
+    def needs_fold(self) -> bool:
+        return False
+
+    def compaction_due(self) -> bool:
+        return False
+
+    def start_compaction(self):
+        return None
+
+    def close(self):
+        pass
+
+class JsonCacheBackend(CacheBackend):
+    name = "json"
+
+    def __init__(self, path: str, journal: bool = True, compact_bytes: int = 4 * 1024 * 1024, compact_interval: float = 600):
+        self.path = path
+        self.journal = journal
+        self.journal_path = path + ".journal"
+        self.compact_bytes = compact_bytes
+        self.compact_interval = compact_interval
+        self._journal_started: float | None = None
+
+    def _read_snapshot(self) -> list[dict]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return [{"keys": [k], **v} for k, v in data.items()]
+        raise ValueError("Unsupported JSON format, expected list or dict at top level.")
+
+    @staticmethod
+    def _replay_journal(path: str, store: CacheStore) -> int:
+        replayed = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves a torn last line; everything before it is intact.
+                    continue
+                if isinstance(entry, dict):
+                    store.upsert(entry, *entry.get("keys", []))
+                    replayed += 1
+        return replayed
+
+    def _journal_paths(self) -> tuple[str, str]:
+        return self.journal_path + ".old", self.journal_path
+
+    def load(self) -> list[dict]:
+        entries = self._read_snapshot() if os.path.exists(self.path) else []
+        journals = [p for p in self._journal_paths() if os.path.exists(p)]
+        if not journals:
+            return entries
+
+        store = CacheStore()
+        store.load(entries)
+        for path in journals:
+            self._replay_journal(path, store)
+        return store.entries
+
+    def needs_fold(self) -> bool:
+        return any(os.path.exists(p) for p in self._journal_paths())
+
+    def _write_snapshot(self, entries: list[dict]):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            self.bytes_written += os.path.getsize(self.path)
+        except Exception:
+            try:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            except Exception:
+                traceback.print_exc()
+            raise
+
+    def write(self, entries: list[dict]):
+        if not self.journal:
+            raise RuntimeError("Journal disabled; use write_all")
+        lines = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n" for e in entries).encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            f.write(lines)
+        self.bytes_written += len(lines)
+        if self._journal_started is None:
+            self._journal_started = time.monotonic()
+
+    def write_all(self, entries: list[dict]):
+        self._write_snapshot(entries)
+        for path in self._journal_paths():
+            with suppress(FileNotFoundError):
+                os.remove(path)
+        self._journal_started = None
+
+    def compaction_due(self) -> bool:
+        if self._journal_started is None:
+            return False
+        try:
+            size = os.path.getsize(self.journal_path)
+        except OSError:
+            size = 0
+        return size >= self.compact_bytes or time.monotonic() - self._journal_started >= self.compact_interval
+
+    def start_compaction(self):
+        # Appends after this point go to a fresh journal; the rotated one is dropped once the snapshot lands.
+        old_path = self.journal_path + ".old"
+        rotated = False
+        if not os.path.exists(old_path):
+            with suppress(FileNotFoundError):
+                os.replace(self.journal_path, old_path)
+                rotated = True
+        self._journal_started = None if rotated else time.monotonic()
+
+        def _compact(entries: list[dict]):
+            self._write_snapshot(entries)
+            if rotated:
+                with suppress(FileNotFoundError):
+                    os.remove(old_path)
+        return _compact
+
+class SqliteCacheBackend(CacheBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str, batch_size: int = 500, shared: bool = False):
+        self.path = path
+        self.batch_size = batch_size
+        # Shared databases keep the stored hits/plays/last_used on upserts; they only change through add_counters().
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                webpage_url TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS keys (
+                key TEXT PRIMARY KEY,
+                webpage_url TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS keys_by_url ON keys(webpage_url);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _row_data(entry: dict) -> str:
+        return json.dumps({k: v for k, v in entry.items() if k != "keys"}, ensure_ascii=False, separators=(",", ":"))
+
+    def load(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT webpage_url, data FROM entries ORDER BY rowid").fetchall()
+            key_rows = self._conn.execute("SELECT key, webpage_url FROM keys ORDER BY rowid").fetchall()
+
+        by_url: dict[str, dict] = {}
+        for url, data in rows:
+            entry = json.loads(data)
+            entry["webpage_url"] = url
+            by_url[url] = {"keys": [], **entry}
+        for key, url in key_rows:
+            entry = by_url.get(url)
+            if entry is not None:
+                entry["keys"].append(key)
+        return list(by_url.values())
+
+    def lookup(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT e.webpage_url, e.data FROM keys k JOIN entries e ON e.webpage_url = k.webpage_url WHERE k.key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            keys = [k for (k,) in self._conn.execute("SELECT key FROM keys WHERE webpage_url = ? ORDER BY rowid", (row[0],))]
+        entry = json.loads(row[1])
+        entry["webpage_url"] = row[0]
+        return {"keys": keys, **entry}
+
+    def _write_batch(self, entries: list[dict]):
+        now = time.time()
+        rows = [(e["webpage_url"], self._row_data(e), now) for e in entries if e.get("webpage_url")]
+        data = "excluded.data"
+        if self.shared:
+            data = (
+                "json_set(excluded.data, "
+                "'$.hits', coalesce(json_extract(entries.data, '$.hits'), 0), "
+                "'$.plays', coalesce(json_extract(entries.data, '$.plays'), 0), "
+                "'$.last_used', max(coalesce(json_extract(entries.data, '$.last_used'), 0), coalesce(json_extract(excluded.data, '$.last_used'), 0)))"
+            )
+        self._conn.executemany(
+            "INSERT INTO entries (webpage_url, data, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT(webpage_url) DO UPDATE SET data = {data}, updated_at = excluded.updated_at",
+            rows,
+        )
+        self.bytes_written += sum(len(data) for _, data, _ in rows)
+        self._conn.executemany(
+            "INSERT INTO keys (key, webpage_url) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET webpage_url = excluded.webpage_url",
+            [(k, e["webpage_url"]) for e in entries if e.get("webpage_url") for k in e.get("keys", [])],
+        )
+
+    def write(self, entries: list[dict]):
+        with self._lock:
+            for start in range(0, len(entries), self.batch_size):
+                with self._conn:
+                    self._write_batch(entries[start:start + self.batch_size])
+
+    def add_counters(self, counters: list[tuple[str, int, int, float]]) -> dict[str, tuple[int, int, float]]:
+        # Increments happen in SQL so concurrent shard processes add up instead of overwriting each other.
+        totals = {}
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE entries SET data = json_set(data, "
+                "'$.hits', coalesce(json_extract(data, '$.hits'), 0) + ?, "
+                "'$.plays', coalesce(json_extract(data, '$.plays'), 0) + ?, "
+                "'$.last_used', max(coalesce(json_extract(data, '$.last_used'), 0), ?)) "
+                "WHERE webpage_url = ?",
+                [(hits, plays, last_used, url) for url, hits, plays, last_used in counters],
+            )
+            for url, *_ in counters:
+                row = self._conn.execute(
+                    "SELECT json_extract(data, '$.hits'), json_extract(data, '$.plays'), json_extract(data, '$.last_used') "
+                    "FROM entries WHERE webpage_url = ?",
+                    (url,),
+                ).fetchone()
+                if row is not None:
+                    totals[url] = row
+        return totals
+
+    def write_all(self, entries: list[dict]):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM keys")
+            self._conn.execute("DELETE FROM entries")
+            for start in range(0, len(entries), self.batch_size):
+                self._write_batch(entries[start:start + self.batch_size])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_cache_backend(path: str, kind: str | None = None, create: bool = False, **kwargs) -> CacheBackend:
+    # Without create a missing file raises, so a mistyped path doesn't read as an empty cache.
+    if kind is None:
+        kind = "sqlite" if os.path.splitext(path)[1].lower() in {".db", ".sqlite", ".sqlite3"} else "json"
+    if kind == "sqlite":
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError(f"Cache file not found: {path}")
+        return SqliteCacheBackend(path, **kwargs)
+    if kind == "json":
+        backend = JsonCacheBackend(path, **kwargs)
+        if not create and not os.path.exists(path) and not backend.needs_fold():
+            raise FileNotFoundError(f"Cache file not found: {path}")
+        return backend
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+def migrate_json_to_sqlite(json_path: str, db_path: str) -> int:
+    entries = open_cache_backend(json_path, "json").load()
+    store = CacheStore()
+    store.load(entries)
+    target = SqliteCacheBackend(db_path)
+    try:
+        target.write_all(store.entries)
+    finally:
+        target.close()
+    return len(store)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache backend utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Copy a cache.json (plus its journal) into a SQLite cache")
+    migrate.add_argument("source", nargs="?", default="cache.json")
+    migrate.add_argument("target", nargs="?", default="cache.db")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate_json_to_sqlite(args.source, args.target)
+        print(f"Migrated {count} entries from {args.source} to {args.target}")
+
+if __name__ == "__main__":
+    main()
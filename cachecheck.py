@@ -1,9 +1,13 @@
+import argparse
+import json
 import os
 import re
-import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from yt_dlp import YoutubeDL
+from cache_backend import open_cache_backend
 
 class QuietLogger:
     def debug(self, msg):
@@ -49,35 +53,93 @@ def load_cache_file(path: str) -> list[dict]:
         print(f"Cache file not found: {path}")
         return []
 
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    entries: list[dict] = []
-    if isinstance(data, list):
-        entries = data
-    elif isinstance(data, dict):
-        for k, v in data.items():
-            entry = {"keys": [k]}
-            entry.update(v)
-            entries.append(entry)
-    else:
-        print("Unsupported JSON format, expected list or dict at top level.")
+    try:
+        return open_cache_backend(path).load()
+    except ValueError as e:
+        print(e)
         return []
 
-    return entries
-
 
-def save_cache_file(path: str, entries: list[dict]):
+def checked_path(path: str) -> str:
     base, ext = os.path.splitext(path)
-    out_path = base + "_checked" + (ext or ".json")
+    return base + "_checked" + (ext or ".json")
+
+
+def save_cache_file(path: str, entries: list[dict], quiet: bool = False):
+    out_path = checked_path(path)
     try:
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
-        print(f"Saved checked cache to: {out_path}")
+        backend = open_cache_backend(out_path, create=True)
+        try:
+            backend.write_all(entries)
+        finally:
+            backend.close()
+        if not quiet:
+            print(f"Saved checked cache to: {out_path}")
     except Exception as e:
         print(f"Failed to save checked cache: {e}")
 
 
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Checkpoint:
+    # One JSON line per finished check, so an interrupted run picks up where it stopped.
+    def __init__(self, path: str):
+        self.path = path
+        self.done: dict[tuple[str, str], dict] = {}
+        self._file = None
+
+    def load(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.done[(record["phase"], record["url"])] = record
+        return len(self.done)
+
+    def get(self, phase: str, url: str) -> dict | None:
+        return self.done.get((phase, url))
+
+    def add(self, record: dict):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.done[(record["phase"], record["url"])] = record
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
 def make_ydl() -> YoutubeDL:
     cookiefile = "cookies.txt"
     ydl_opts = {
@@ -103,78 +165,6 @@ def make_ydl() -> YoutubeDL:
     return YoutubeDL(ydl_opts)
 
 
-def verify_entry_video(ydl: YoutubeDL, entry: dict, delay: float = 0.7) -> tuple[bool, bool]:
-    updated = False
-    invalid = False
-    url = entry.get("webpage_url") or entry.get("url")
-
-    if not url:
-        print("Entry missing webpage_url/url, marking invalid.")
-        return False, True
-
-    try:
-        raw = ydl.extract_info(url, download=False)
-        if "entries" in raw:
-            raw = raw["entries"][0]
-
-        changed = False
-        for k in ("url", "webpage_url", "title", "duration", "uploader"):
-            old = entry.get(k)
-            new = raw.get(k)
-            if new is not None and new != old:
-                entry[k] = new
-                changed = True
-
-        if changed:
-            updated = True
-
-    except Exception as e:
-        print(f"Error verifying {url}: {e}")
-        invalid = True
-
-    time.sleep(delay)
-    return updated, invalid
-
-
-def verify_search_keys(ydl: YoutubeDL, entry: dict, delay: float = 0.9) -> tuple[int, int]:
-    mismatches = 0
-    checked = 0
-
-    keys = entry.get("keys") or []
-    target_url = entry.get("webpage_url")
-
-    if not target_url:
-        return 0, 0
-
-    for key in keys:
-        if not isinstance(key, str):
-            continue
-        if is_url(key):
-            continue
-
-        query = f"ytsearch1:{key}"
-        try:
-            raw = ydl.extract_info(query, download=False)
-            if "entries" not in raw or not raw["entries"]:
-                print(f"No results for search key: {key}")
-                mismatches += 1
-            else:
-                top = raw["entries"][0]
-                result_url = top.get("webpage_url") or top.get("url")
-                if result_url != target_url:
-                    print(f"Mismatch for key '{key}': expected {target_url}, got {result_url}")
-                    mismatches += 1
-
-            checked += 1
-        except Exception as e:
-            print(f"Error searching for key '{key}': {e}")
-            mismatches += 1
-
-        time.sleep(delay)
-
-    return checked, mismatches
-
-
 def print_initial_stats(entries: list[dict]):
     total_entries = len(entries)
     total_keys = 0
@@ -223,110 +213,219 @@ def print_initial_stats(entries: list[dict]):
     print()
 
 
-cache_path = input("Path to cache file (default: cache.json): ").strip()
-if not cache_path:
-    cache_path = "cache.json"
+_local = threading.local()
 
-entries = load_cache_file(cache_path)
-if not entries:
-    print("No entries loaded, exiting.")
-else:
-    print_initial_stats(entries)
 
-    check_search = input("Check non-URL search keys as well? (y/n): ").strip().lower().startswith("y")
+def thread_ydl() -> YoutubeDL:
+    # YoutubeDL instances are not thread safe, so every pool thread gets its own.
+    ydl = getattr(_local, "ydl", None)
+    if ydl is None:
+        ydl = _local.ydl = make_ydl()
+    return ydl
 
-    ydl = make_ydl()
 
-    total = len(entries)
-    meta_updated = 0
-    meta_same = 0
-    invalid_entries: list[dict] = []
-
-    total_search_checked = 0
-    total_search_mismatches = 0
-
-    print(f"Loaded {total} entries from cache. Verifying video URLs...")
-
-    for idx, entry in enumerate(entries):
-        print(f"[{idx + 1}/{total}] Checking {entry.get('title')!r}")
-        updated, invalid = verify_entry_video(ydl, entry)
-        if invalid:
-            invalid_entries.append(entry)
-        elif updated:
-            meta_updated += 1
+def verify_entry_video(entry: dict, limiter: TokenBucket) -> dict:
+    url = entry.get("webpage_url") or entry.get("url")
+    record = {"phase": "video", "url": url, "invalid": False, "fields": {}}
+
+    if not url:
+        print("Entry missing webpage_url/url, marking invalid.")
+        record["invalid"] = True
+        return record
+
+    try:
+        limiter.acquire()
+        raw = thread_ydl().extract_info(url, download=False)
+        if "entries" in raw:
+            raw = raw["entries"][0]
+
+        for k in ("url", "webpage_url", "title", "duration", "uploader"):
+            new = raw.get(k)
+            if new is not None and new != entry.get(k):
+                record["fields"][k] = new
+
+    except Exception as e:
+        print(f"Error verifying {url}: {e}")
+        record["invalid"] = True
+
+    return record
+
+
+def verify_search_keys(entry: dict, limiter: TokenBucket) -> dict:
+    target_url = entry.get("webpage_url")
+    record = {"phase": "search", "url": target_url, "checked": 0, "mismatches": 0}
+
+    for key in entry.get("keys") or []:
+        if not isinstance(key, str):
+            continue
+        if is_url(key):
+            continue
+
+        query = f"ytsearch1:{key}"
+        try:
+            limiter.acquire()
+            raw = thread_ydl().extract_info(query, download=False)
+            if "entries" not in raw or not raw["entries"]:
+                print(f"No results for search key: {key}")
+                record["mismatches"] += 1
+            else:
+                top = raw["entries"][0]
+                result_url = top.get("webpage_url") or top.get("url")
+                if result_url != target_url:
+                    print(f"Mismatch for key '{key}': expected {target_url}, got {result_url}")
+                    record["mismatches"] += 1
+
+            record["checked"] += 1
+        except Exception as e:
+            print(f"Error searching for key '{key}': {e}")
+            record["mismatches"] += 1
+
+    return record
+
+
+def has_search_keys(entry: dict) -> bool:
+    return any(isinstance(k, str) and not is_url(k) for k in entry.get("keys") or [])
+
+
+def run_phase(phase: str, entries: list[dict], check, args, limiter: TokenBucket, checkpoint: Checkpoint, on_result):
+    # Entries finished in an earlier run are replayed from the checkpoint instead of being fetched again.
+    todo = []
+    for entry in entries:
+        url = entry.get("webpage_url") or entry.get("url")
+        record = checkpoint.get(phase, url) if url else None
+        if record is not None:
+            on_result(entry, record, resumed=True)
         else:
-            meta_same += 1
+            todo.append(entry)
 
-        print(
-            f"  -> validated {idx + 1}/{total} "
-            f"(updated: {meta_updated}, unchanged: {meta_same}, invalid: {len(invalid_entries)})"
-        )
+    if len(todo) < len(entries):
+        print(f"Resumed {len(entries) - len(todo)} {phase} checks from {checkpoint.path}")
 
-    print("\nURL validation summary:")
-    print(f"  Total entries: {total}")
-    print(f"  Metadata updated: {meta_updated}")
-    print(f"  Metadata unchanged: {meta_same}")
-    print(f"  Invalid entries so far: {len(invalid_entries)}")
-
-    if check_search:
-        print("\nDetermining entries with non-URL search keys...")
-        search_entries_total = 0
-        for e in entries:
-            if e in invalid_entries:
-                continue
-            keys = e.get("keys") or []
-            if any(isinstance(k, str) and not is_url(k) for k in keys):
-                search_entries_total += 1
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(check, entry, limiter): entry for entry in todo}
+        try:
+            for fut in as_completed(futures):
+                entry = futures[fut]
+                record = fut.result()
+                if record["url"]:
+                    checkpoint.add(record)
+                on_result(entry, record, resumed=False)
+        except KeyboardInterrupt:
+            for f in futures:
+                f.cancel()
+            raise
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Re-extract every cache entry and report or drop the broken ones")
+    parser.add_argument("cache", nargs="?", default="cache.json", help="cache.json or cache.db (default: cache.json)")
+    parser.add_argument("--search", action="store_true", help="Also check that search keys still find the cached video")
+    parser.add_argument("--delete-invalid", action="store_true", help="Leave invalid entries out of the checked copy")
+    parser.add_argument("--workers", type=int, default=4, help="Extractions running at the same time")
+    parser.add_argument("--rate", type=float, default=2.0, help="Max extractions per second across all workers")
+    parser.add_argument("--burst", type=int, default=2, help="Extractions allowed back to back before --rate applies")
+    parser.add_argument("--checkpoint", help="Progress file used to resume (default: <cache>.check)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint and start over")
+    parser.add_argument("--save-every", type=int, default=500, help="Rewrite the checked copy after this many results (0: only at the end)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    entries = load_cache_file(args.cache)
+    if not entries:
+        print("No entries loaded, exiting.")
+        return
 
-        print(f"Entries with non-URL keys to validate: {search_entries_total}")
-        search_entries_done = 0
+    print_initial_stats(entries)
 
-        if search_entries_total > 0:
-            print("Now verifying search keys -> video mapping...")
-            for entry in entries:
-                if entry in invalid_entries:
-                    continue
-                keys = entry.get("keys") or []
-                if not any(isinstance(k, str) and not is_url(k) for k in keys):
-                    continue
+    checkpoint = Checkpoint(args.checkpoint or args.cache + ".check")
+    if args.fresh:
+        checkpoint.remove()
+    checkpoint.load()
+    limiter = TokenBucket(args.rate, args.burst)
 
-                search_entries_done += 1
-                print(
-                    f"[search {search_entries_done}/{search_entries_total}] "
-                    f"Checking keys for {entry.get('title')!r}"
-                )
-                checked, mismatches = verify_search_keys(ydl, entry)
-                total_search_checked += checked
-                if mismatches > 0 and entry not in invalid_entries:
-                    invalid_entries.append(entry)
-                total_search_mismatches += mismatches
-
-                print(
-                    f"  -> search validated {search_entries_done}/{search_entries_total} "
-                    f"(keys checked: {total_search_checked}, mismatches/errors: {total_search_mismatches})"
-                )
-
-        print("\nSearch-key validation summary:")
-        print(f"  Entries with non-URL keys: {search_entries_total}")
-        print(f"  Search keys checked: {total_search_checked}")
-        print(f"  Search mismatches/errors: {total_search_mismatches}")
-        print(f"  Invalid entries after search phase: {len(invalid_entries)}")
+    total = len(entries)
+    invalid_ids: set[int] = set()
+    counts = {"updated": 0, "same": 0, "done": 0, "search_done": 0, "search_checked": 0, "search_mismatches": 0}
+
+    def save_progress():
+        if args.save_every and (counts["done"] + counts["search_done"]) % args.save_every == 0:
+            save_cache_file(args.cache, entries, quiet=True)
+
+    def on_video(entry: dict, record: dict, resumed: bool):
+        counts["done"] += 1
+        if record["invalid"]:
+            invalid_ids.add(id(entry))
+        elif record["fields"]:
+            entry.update(record["fields"])
+            counts["updated"] += 1
+        else:
+            counts["same"] += 1
+        if not resumed:
+            print(
+                f"[{counts['done']}/{total}] {entry.get('title')!r} "
+                f"(updated: {counts['updated']}, unchanged: {counts['same']}, invalid: {len(invalid_ids)})"
+            )
+            save_progress()
+
+    print(f"Loaded {total} entries from cache. Verifying video URLs with {args.workers} workers at {args.rate}/s...")
+    try:
+        run_phase("video", entries, verify_entry_video, args, limiter, checkpoint, on_video)
+
+        print("\nURL validation summary:")
+        print(f"  Total entries: {total}")
+        print(f"  Metadata updated: {counts['updated']}")
+        print(f"  Metadata unchanged: {counts['same']}")
+        print(f"  Invalid entries so far: {len(invalid_ids)}")
+
+        if args.search:
+            search_entries = [e for e in entries if id(e) not in invalid_ids and e.get("webpage_url") and has_search_keys(e)]
+            search_total = len(search_entries)
+            print(f"\nEntries with non-URL keys to validate: {search_total}")
+
+            def on_search(entry: dict, record: dict, resumed: bool):
+                counts["search_done"] += 1
+                counts["search_checked"] += record["checked"]
+                counts["search_mismatches"] += record["mismatches"]
+                if record["mismatches"]:
+                    invalid_ids.add(id(entry))
+                if not resumed:
+                    print(
+                        f"[search {counts['search_done']}/{search_total}] {entry.get('title')!r} "
+                        f"(keys checked: {counts['search_checked']}, mismatches/errors: {counts['search_mismatches']})"
+                    )
+                    save_progress()
+
+            run_phase("search", search_entries, verify_search_keys, args, limiter, checkpoint, on_search)
+
+            print("\nSearch-key validation summary:")
+            print(f"  Entries with non-URL keys: {search_total}")
+            print(f"  Search keys checked: {counts['search_checked']}")
+            print(f"  Search mismatches/errors: {counts['search_mismatches']}")
+            print(f"  Invalid entries after search phase: {len(invalid_ids)}")
+    except KeyboardInterrupt:
+        checkpoint.close()
+        save_cache_file(args.cache, entries)
+        print(f"\nInterrupted; run the same command again to resume from {checkpoint.path}")
+        return
 
     print("\nFinal summary:")
     print(f"  Total entries: {total}")
-    print(f"  Metadata updated: {meta_updated}")
-    print(f"  Metadata unchanged: {meta_same}")
-    print(f"  Invalid entries (errors or search mismatches): {len(invalid_entries)}")
-    if check_search:
-        print(f"  Search keys checked: {total_search_checked}")
-        print(f"  Search mismatches/errors: {total_search_mismatches}")
-
-    to_delete = "n"
-    if invalid_entries:
-        to_delete = input("Delete invalid entries before saving copy? (y/n): ").strip().lower()
-
-    if to_delete.startswith("y"):
-        entries = [e for e in entries if e not in invalid_entries]
-        print(f"Removed {len(invalid_entries)} invalid entries, {len(entries)} remain.")
-
-    save_cache_file(cache_path, entries)
+    print(f"  Metadata updated: {counts['updated']}")
+    print(f"  Metadata unchanged: {counts['same']}")
+    print(f"  Invalid entries (errors or search mismatches): {len(invalid_ids)}")
+    if args.search:
+        print(f"  Search keys checked: {counts['search_checked']}")
+        print(f"  Search mismatches/errors: {counts['search_mismatches']}")
+
+    if args.delete_invalid and invalid_ids:
+        entries = [e for e in entries if id(e) not in invalid_ids]
+        print(f"Removed {len(invalid_ids)} invalid entries, {len(entries)} remain.")
+
+    save_cache_file(args.cache, entries)
+    checkpoint.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,15 @@
-import json
+import sys
 
-FILENAME = "cache.json"
+from cache_backend import CacheStore, is_search_key, open_cache_backend
+
+FILENAME = sys.argv[1] if len(sys.argv) > 1 else "cache.json" # cache.json or a SQLite cache (.db)
 
 try:
-    with open(FILENAME, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = open_cache_backend(FILENAME).load()
 except Exception as e:
     print(f"Failed to read {FILENAME}: {e}")
     raise
 
-if not isinstance(data, list):
-    print("JSON root must be a list of entries.")
-    raise SystemExit(1)
-
 items = [x for x in data if isinstance(x, dict)]
 items_count = len(items)
 total_keys = sum(len(x.get("keys", [])) for x in items)
@@ -25,3 +22,32 @@ for x in items:
 print(f"keys_stored: {total_keys}")
 print(f"items_count: {items_count}")
 print(f"total_duration_seconds: {total_duration}")
+
+# Replays every stored search key, in file order, against a store that starts empty to see
+# how many yt-dlp searches the normalized index would have answered from the cache instead.
+THRESHOLD = float(sys.argv[2]) if len(sys.argv) > 2 else 0.85 # Same meaning as SEARCH_MATCH_THRESHOLD in bot.py
+replay = CacheStore()
+search_keys = exact_hits = normalized_hits = wrong_hits = 0
+for x in items:
+    for key in x.get("keys", []):
+        if not isinstance(key, str) or not is_search_key(key):
+            continue
+        search_keys += 1
+        if key in replay:
+            exact_hits += 1
+            continue
+        found = replay.match(key, THRESHOLD)
+        if found is not None:
+            normalized_hits += 1
+            if found[0].get("webpage_url") != x.get("webpage_url"):
+                wrong_hits += 1
+        replay.upsert(x, key)
+
+if search_keys:
+    print(f"search_keys: {search_keys}")
+    print(f"search_hit_rate_exact: {exact_hits / search_keys:.1%}")
+    # Matches that landed on a different track than the one stored for that key would play the wrong song, they don't count as hits.
+    print(f"search_hit_rate_normalized: {(exact_hits + normalized_hits - wrong_hits) / search_keys:.1%} (threshold {THRESHOLD})")
+    print(f"search_hit_rate_normalized_with_wrong_tracks: {(exact_hits + normalized_hits) / search_keys:.1%}")
+    print(f"searches_saved: {normalized_hits - wrong_hits}")
+    print(f"normalized_hits_on_other_track: {wrong_hits}")
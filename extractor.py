@@ -0,0 +1,235 @@
+import asyncio, json, os, sys, traceback
+from contextlib import suppress
+
+WORKER_STREAM_LIMIT = 32 * 1024 * 1024 # Largest single response line accepted from a worker
+DROPPED_INFO_KEYS = {
+    "thumbnails", "automatic_captions", "subtitles", "heatmap", "chapters",
+    "requested_formats", "requested_downloads", "requested_subtitles", "description",
+}
+KEPT_FORMAT_KEYS = {"format_id", "url", "ext", "acodec", "vcodec", "abr", "tbr", "asr", "protocol", "http_headers"}
+
+class ExtractorError(RuntimeError):
+    pass
+
+class ExtractorTimeout(ExtractorError):
+    pass
+
+class ExtractorUnavailable(ExtractorError):
+    pass
+
+class _WorkerBroken(ExtractorError):
+    pass
+
+def _trim_info(info):
+    if isinstance(info, list):
+        return [_trim_info(i) for i in info]
+    if not isinstance(info, dict):
+        return info
+    trimmed = {k: v for k, v in info.items() if k not in DROPPED_INFO_KEYS}
+    if isinstance(trimmed.get("formats"), list):
+        trimmed["formats"] = [{k: f.get(k) for k in KEPT_FORMAT_KEYS if k in f} for f in trimmed["formats"]]
+    if isinstance(trimmed.get("entries"), list):
+        trimmed["entries"] = [_trim_info(e) for e in trimmed["entries"]]
+    return trimmed
+
+def extract_info(ydl, query: str, params: dict | None = None) -> dict:
+    # params (e.g. playlist_items) apply to this call only; instances are shared between calls.
+    if not params:
+        return ydl.extract_info(query, download=False)
+    saved = {k: ydl.params.get(k) for k in params}
+    ydl.params.update(params)
+    try:
+        return ydl.extract_info(query, download=False)
+    finally:
+        ydl.params.update(saved)
+
+def _worker_main():
+    # forcejson makes yt-dlp print to stdout, so the protocol gets its own copy of the fd and stdout goes to stderr.
+    proto_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    sys.stdin.reconfigure(encoding="utf-8")
+
+    from yt_dlp import YoutubeDL
+
+    init = json.loads(sys.stdin.readline())
+    instances = {name: YoutubeDL(opts) for name, opts in init["profiles"].items()}
+    proto_out.write(json.dumps({"ready": True}) + "\n")
+    proto_out.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            ydl = instances[job["profile"]]
+            raw = extract_info(ydl, job["query"], job.get("params"))
+            resp = {"id": job["id"], "ok": True, "info": _trim_info(ydl.sanitize_info(raw))}
+        except Exception as e:
+            resp = {"id": job["id"], "ok": False, "error": f"{type(e).__name__}: {e}"}
+        proto_out.write(json.dumps(resp, ensure_ascii=False) + "\n")
+        proto_out.flush()
+
+class _Worker:
+    def __init__(self, profiles: dict[str, dict]):
+        self.profiles = profiles
+        self.proc: asyncio.subprocess.Process | None = None
+        self.jobs = 0
+        self._next_id = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--worker",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=WORKER_STREAM_LIMIT,
+        )
+        self.jobs = 0
+        self.proc.stdin.write((json.dumps({"profiles": self.profiles}) + "\n").encode("utf-8"))
+        await self.proc.stdin.drain()
+        ready = await self.proc.stdout.readline()
+        if not ready:
+            await self.kill()
+            raise ExtractorUnavailable("Extractor worker exited during startup")
+
+    async def run(self, profile: str, query: str, params: dict | None = None) -> dict:
+        self._next_id += 1
+        job_id = self._next_id
+        self.jobs += 1
+        self.proc.stdin.write((json.dumps({"id": job_id, "profile": profile, "query": query, "params": params}) + "\n").encode("utf-8"))
+        await self.proc.stdin.drain()
+        line = await self.proc.stdout.readline()
+        if not line:
+            raise _WorkerBroken("Extractor worker exited mid-job")
+        resp = json.loads(line)
+        if resp.get("id") != job_id:
+            raise _WorkerBroken("Extractor worker answered out of order")
+        if not resp.get("ok"):
+            raise ExtractorError(resp.get("error") or "Extraction failed")
+        return resp["info"]
+
+    async def kill(self):
+        proc = self.proc
+        self.proc = None
+        if proc is None or proc.returncode is not None:
+            return
+        with suppress(ProcessLookupError):
+            proc.kill()
+        with suppress(Exception):
+            await proc.wait()
+
+    async def stop(self):
+        proc = self.proc
+        if proc is None or proc.returncode is not None:
+            self.proc = None
+            return
+        with suppress(Exception):
+            proc.stdin.close()
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=5)
+            self.proc = None
+        except asyncio.TimeoutError:
+            await self.kill()
+
+class ExtractionService:
+    def __init__(self, profiles: dict[str, dict], processes: int = 2, timeout: float = 60, max_jobs_per_worker: int = 250):
+        self.profiles = profiles
+        self.processes = max(1, processes)
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.jobs: asyncio.Queue | None = None
+        self.workers: list[_Worker] = []
+        self.runners: list[asyncio.Task] = []
+        self.unavailable = False
+        self._starting: asyncio.Future | None = None
+        self.stats = {"jobs": 0, "errors": 0, "timeouts": 0, "recycled": 0}
+
+    @property
+    def started(self) -> bool:
+        return bool(self.runners)
+
+    @property
+    def pending(self) -> int:
+        return self.jobs.qsize() if self.jobs is not None else 0
+
+    async def start(self):
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        await asyncio.shield(self._starting)
+
+    async def _start(self):
+        self.jobs = asyncio.Queue()
+        self.workers = [_Worker(self.profiles) for _ in range(self.processes)]
+        results = await asyncio.gather(*(w.start() for w in self.workers), return_exceptions=True)
+        failures = [r for r in results if isinstance(r, BaseException)]
+        if len(failures) == len(results):
+            self.unavailable = True
+            for exc in failures:
+                traceback.print_exception(type(exc), exc, exc.__traceback__)
+            raise ExtractorUnavailable("No extractor worker could be started")
+        self.runners = [asyncio.create_task(self._runner(w)) for w in self.workers]
+
+    async def _runner(self, worker: _Worker):
+        while True:
+            profile, query, params, fut = await self.jobs.get()
+            if fut.done():
+                continue
+            try:
+                if not worker.alive:
+                    await worker.start()
+                info = await asyncio.wait_for(worker.run(profile, query, params), timeout=self.timeout)
+                self.stats["jobs"] += 1
+                if not fut.done():
+                    fut.set_result(info)
+            except asyncio.TimeoutError:
+                # The job may still be running in the worker, so the process is replaced rather than reused.
+                self.stats["timeouts"] += 1
+                await worker.kill()
+                if not fut.done():
+                    fut.set_exception(ExtractorTimeout(f"Extraction timed out after {self.timeout}s"))
+            except asyncio.CancelledError:
+                if not fut.done():
+                    fut.set_exception(ExtractorUnavailable("Extraction service stopped"))
+                raise
+            except Exception as exc:
+                self.stats["errors"] += 1
+                if isinstance(exc, _WorkerBroken) or not isinstance(exc, ExtractorError):
+                    await worker.kill()
+                if not fut.done():
+                    fut.set_exception(exc)
+
+            if worker.alive and worker.jobs >= self.max_jobs_per_worker:
+                self.stats["recycled"] += 1
+                await worker.stop()
+
+    async def extract(self, profile: str, query: str, params: dict | None = None) -> dict:
+        if self.unavailable:
+            raise ExtractorUnavailable("Extraction service unavailable")
+        if not self.started:
+            await self.start()
+        fut = asyncio.get_running_loop().create_future()
+        self.jobs.put_nowait((profile, query, params, fut))
+        return await fut
+
+    async def close(self):
+        self.unavailable = True
+        runners, self.runners = self.runners, []
+        for task in runners:
+            task.cancel()
+        for task in runners:
+            with suppress(asyncio.CancelledError):
+                await task
+        if self.jobs is not None:
+            while not self.jobs.empty():
+                _, _, _, fut = self.jobs.get_nowait()
+                if not fut.done():
+                    fut.set_exception(ExtractorUnavailable("Extraction service stopped"))
+        await asyncio.gather(*(w.stop() for w in self.workers), return_exceptions=True)
+        self.workers = []
+
+if __name__ == "__main__" and "--worker" in sys.argv[1:]:
+    _worker_main()
@@ -0,0 +1,108 @@
+import argparse, asyncio, os, signal, subprocess, sys, time, traceback
+from contextlib import suppress
+from cache_backend import migrate_json_to_sqlite
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+RESTART_BACKOFF_START = 2 # Seconds before a crashed shard process is restarted
+RESTART_BACKOFF_MAX = 120 # The delay doubles on every consecutive crash up to this
+STABLE_UPTIME = 300 # A process that stayed up this long resets its restart delay
+STOP_TIMEOUT = 20 # Seconds shard processes get to clean up before they are killed
+
+def shard_groups(shard_count: int, processes: int) -> list[list[int]]:
+    processes = max(1, min(processes, shard_count))
+    return [list(range(i, shard_count, processes)) for i in range(processes)]
+
+def update_ytdlp():
+    # Done once here so the shard processes don't all run pip at the same time.
+    print("[launcher] Checking yt-dlp for updates...")
+    try:
+        subprocess.run([sys.executable, "-m", "pip", "install", "-U", "-q", "yt-dlp"], check=False)
+    except Exception:
+        traceback.print_exc()
+
+async def _spawn(env: dict) -> asyncio.subprocess.Process:
+    if os.name == "nt":
+        return await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT, env=env, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+        )
+    # Own session, so a console Ctrl+C reaches only the launcher and each shard gets exactly one SIGINT.
+    return await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=env, start_new_session=True)
+
+async def _stop(proc: asyncio.subprocess.Process):
+    if proc.returncode is not None:
+        return
+    with suppress(ProcessLookupError):
+        if os.name == "nt":
+            # The shard runs in its own process group, so this reaches only it; bot.py turns it into a clean shutdown.
+            proc.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            proc.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=STOP_TIMEOUT)
+    except asyncio.TimeoutError:
+        with suppress(ProcessLookupError):
+            proc.kill()
+        await proc.wait()
+
+async def supervise(index: int, shard_ids: list[int], shard_count: int, cache_db: str):
+    env = {
+        **os.environ,
+        "BOT_SHARD_IDS": ",".join(map(str, shard_ids)),
+        "BOT_SHARD_COUNT": str(shard_count),
+        "BOT_CACHE_DB": os.path.abspath(cache_db),
+        "BOT_SKIP_YTDLP_UPDATE": "1",
+    }
+    backoff = RESTART_BACKOFF_START
+    while True:
+        print(f"[launcher] Starting process {index} for shards {shard_ids}")
+        started = time.monotonic()
+        proc = await _spawn(env)
+        try:
+            code = await proc.wait()
+        finally:
+            await _stop(proc)
+
+        if time.monotonic() - started >= STABLE_UPTIME:
+            backoff = RESTART_BACKOFF_START
+        print(f"[launcher] Process {index} (shards {shard_ids}) exited with code {code}, restarting in {backoff}s")
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+async def run(shard_count: int, processes: int, cache_db: str):
+    main_task = asyncio.current_task()
+    with suppress(NotImplementedError, AttributeError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+
+    groups = shard_groups(shard_count, processes)
+    tasks = [asyncio.create_task(supervise(i, ids, shard_count, cache_db)) for i, ids in enumerate(groups)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run bot.py as several shard processes and restart them when they crash")
+    parser.add_argument("--shards", type=int, default=2, help="Total number of Discord shards")
+    parser.add_argument("--processes", type=int, default=2, help="Processes to spread the shards across")
+    parser.add_argument("--cache-json", default="cache.json", help="Migrated into --cache-db on first start")
+    parser.add_argument("--cache-db", default="cache.db", help="SQLite cache shared by every shard process")
+    parser.add_argument("--no-update", action="store_true", help="Skip the yt-dlp update check")
+    args = parser.parse_args()
+
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if not os.path.exists(args.cache_db) and os.path.exists(args.cache_json):
+        count = migrate_json_to_sqlite(args.cache_json, args.cache_db)
+        print(f"[launcher] Migrated {count} cache entries from {args.cache_json} to {args.cache_db}")
+    if not args.no_update:
+        update_ytdlp()
+
+    try:
+        asyncio.run(run(args.shards, args.processes, args.cache_db))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import asyncio, hashlib, json, os, subprocess, threading, traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from mutagen import File as MutagenFile
+
+HEAD_BYTES = 64 * 1024 # First range fetched: ID3v2 / Ogg / FLAC headers and the start of MP4 atoms
+TAIL_BYTES = 128 * 1024 # Last range fetched: ID3v1 / APE tags, the last Ogg page, a trailing MP4 moov
+READ_AHEAD = 64 * 1024 # Smallest range fetched when the parser reads outside what is already loaded
+MAX_PROBE_BYTES = 8 * 1024 * 1024 # Parsers needing more than this give up (files keep their fallback title)
+PREFIX_BYTES = 2 * 1024 * 1024 # Bytes read from servers that ignore Range before parsing what arrived
+PROBE_TIMEOUT = 15 # Seconds per range request
+CACHE_SIZE = 512 # Probe results kept per URL (while the ETag / Last-Modified stays the same), attachment id and content hash
+
+class ProbeLimitExceeded(IOError):
+    pass
+
+def read_tags(filething) -> dict:
+    # filething is a path or a seekable binary file object; runs in a worker thread.
+    tags = {"title": None, "artist": None, "duration": None}
+    try:
+        audio = MutagenFile(filething, easy=True)
+    except Exception:
+        # Mutagen re-raises IOErrors from the file object as its own errors, so the budget is checked on the file.
+        if not getattr(filething, "limit_hit", False):
+            traceback.print_exc()
+        return tags
+    if audio is None:
+        return tags
+    if audio.tags:
+        if "title" in audio.tags and audio.tags["title"]:
+            tags["title"] = str(audio.tags["title"][0])
+        if "artist" in audio.tags and audio.tags["artist"]:
+            tags["artist"] = str(audio.tags["artist"][0])
+    if hasattr(audio, "info") and getattr(audio.info, "length", None) is not None:
+        tags["duration"] = int(audio.info.length)
+    return tags
+
+def ffprobe_tags(target: str, timeout: float = PROBE_TIMEOUT, probesize: int | None = None) -> dict:
+    # For containers Mutagen doesn't read (Matroska / WebM, most video); target is a path or URL.
+    tags = {"title": None, "artist": None, "duration": None}
+    limits = ["-probesize", str(probesize), "-analyzeduration", str(int(timeout * 1_000_000))] if probesize else []
+    try:
+        proc = subprocess.run(
+            ["ffprobe", "-v", "error", *limits, "-show_entries", "format=duration:format_tags", "-of", "json", target],
+            capture_output=True, timeout=timeout, check=False,
+        )
+        fmt = json.loads(proc.stdout or b"{}").get("format") or {}
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return tags
+    fmt_tags = {k.lower(): v for k, v in (fmt.get("tags") or {}).items()}
+    tags["title"] = fmt_tags.get("title") or None
+    tags["artist"] = fmt_tags.get("artist") or None
+    try:
+        tags["duration"] = int(float(fmt["duration"]))
+    except (KeyError, TypeError, ValueError):
+        pass
+    return tags
+
+class SparseFile:
+    # Read-only file object over the byte ranges of a remote file; missing ranges come from fetch(start, end).
+    def __init__(self, name: str, size: int, fetch=None):
+        self.name = name
+        self.size = size
+        self.fetch = fetch
+        self.chunks: dict[int, bytes] = {}
+        self.pos = 0
+        self.limit_hit = False
+
+    def add(self, start: int, data: bytes):
+        if data and len(data) > len(self.chunks.get(start, b"")):
+            self.chunks[start] = data
+
+    def _chunk_at(self, offset: int) -> tuple[int, bytes] | None:
+        for start, data in self.chunks.items():
+            if start <= offset < start + len(data):
+                return start, data
+        return None
+
+    def _next_start(self, offset: int, end: int) -> int:
+        return min((s for s in self.chunks if offset < s < end), default=end)
+
+    def read(self, n: int = -1) -> bytes:
+        end = self.size if n is None or n < 0 else min(self.size, self.pos + n)
+        out = bytearray()
+        while self.pos < end:
+            found = self._chunk_at(self.pos)
+            if found is None:
+                if self.fetch is None:
+                    # Only a prefix was read; the rest looks like a truncated file to the parser.
+                    break
+                fetch_end = min(self.size, max(self.pos + READ_AHEAD, self._next_start(self.pos, end)))
+                try:
+                    data = self.fetch(self.pos, fetch_end)
+                except ProbeLimitExceeded:
+                    self.limit_hit = True
+                    raise
+                if not data:
+                    break
+                self.add(self.pos, data)
+                continue
+            start, data = found
+            piece = data[self.pos - start:end - start]
+            out += piece
+            self.pos += len(piece)
+        return bytes(out)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self.pos = offset
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+class MediaProbeService:
+    # Tag / duration parsing runs on a bounded thread pool so large files never block the event loop.
+    def __init__(self, workers: int = 2, cache_size: int = CACHE_SIZE, use_ffprobe: bool = True):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="media-probe")
+        self.use_ffprobe = use_ffprobe
+        self.cache: OrderedDict[str, tuple[tuple | None, dict]] = OrderedDict()
+        self.cache_size = cache_size
+        self.stats = {"probes": 0, "cache_hits": 0, "bytes": 0, "prefix_fallbacks": 0, "ffprobe_fallbacks": 0}
+        self._stats_lock = threading.Lock()
+
+    def _cached(self, key: str, validators: tuple | None = None) -> dict | None:
+        cached = self.cache.get(key)
+        if cached is None or cached[0] != validators:
+            return None
+        self.cache.move_to_end(key)
+        self.stats["cache_hits"] += 1
+        return dict(cached[1])
+
+    def _remember(self, key: str, validators: tuple | None, tags: dict):
+        self.cache[key] = (validators, dict(tags))
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _parse(self, filething, target: str) -> dict:
+        # Runs in the worker threads.
+        tags = read_tags(filething)
+        if not self.use_ffprobe or tags["duration"] is not None:
+            return tags
+        remote = isinstance(filething, SparseFile)
+        if remote and filething.limit_hit:
+            # ffprobe on the URL would read past the byte budget Mutagen just ran into.
+            return tags
+        with self._stats_lock:
+            self.stats["ffprobe_fallbacks"] += 1
+        probed = ffprobe_tags(target, probesize=MAX_PROBE_BYTES if remote else None)
+        return {k: tags[k] or probed[k] for k in tags}
+
+    async def probe_file(self, path: str) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._parse, path, path)
+
+    async def _fetch_range(self, session: aiohttp.ClientSession, url: str, start: int, end: int) -> bytes:
+        headers = {"Range": f"bytes={start}-{end - 1}"}
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as resp:
+            resp.raise_for_status()
+            if resp.status != 206:
+                raise ProbeLimitExceeded("Server stopped honouring range requests")
+            data = await resp.read()
+        self.stats["bytes"] += len(data)
+        return data
+
+    async def probe(self, session: aiohttp.ClientSession, url: str, name: str, content_key: bool = False) -> dict:
+        cached = self.cache.get(url)
+        headers = {"Range": f"bytes=0-{HEAD_BYTES - 1}"}
+        if cached is not None and cached[0]:
+            etag, last_modified = cached[0]
+            if etag:
+                headers["If-None-Match"] = etag
+            elif last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as resp:
+            if resp.status == 304 and cached is not None:
+                self.cache.move_to_end(url)
+                self.stats["cache_hits"] += 1
+                return dict(cached[1])
+            resp.raise_for_status()
+            validators = (resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+            hit = self._cached(url, validators)
+            if hit is not None:
+                return hit
+
+            size = None
+            if resp.status == 206:
+                total = resp.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+                size = int(total) if total.isdigit() else None
+            if size is None:
+                # No usable Range support: parse a bounded prefix of the body and stop reading.
+                self.stats["prefix_fallbacks"] += 1
+                head = b""
+                while len(head) < PREFIX_BYTES:
+                    more = await resp.content.read(PREFIX_BYTES - len(head))
+                    if not more:
+                        break
+                    head += more
+                size = max(len(head), resp.content_length or 0) if resp.status == 200 else len(head)
+                ranged = False
+            else:
+                head = await resp.read()
+                ranged = True
+        self.stats["probes"] += 1
+        self.stats["bytes"] += len(head)
+
+        remote = SparseFile(name, size)
+        remote.add(0, head)
+        if ranged:
+            extra = []
+            if size > HEAD_BYTES:
+                tail_start = max(HEAD_BYTES, size - TAIL_BYTES)
+                extra.append((tail_start, size))
+            if head[:3] == b"ID3" and len(head) >= 10:
+                # The whole ID3v2 tag plus the first audio frames (Xing / VBRI header) is needed for tags and length.
+                tag_end = 10 + ((head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | (head[9] & 0x7F))
+                ranges_end = min(size, tag_end + READ_AHEAD, MAX_PROBE_BYTES)
+                if ranges_end > HEAD_BYTES:
+                    extra.append((HEAD_BYTES, ranges_end))
+            results = await asyncio.gather(*(self._fetch_range(session, url, s, e) for s, e in extra))
+            for (start, _), data in zip(extra, results):
+                remote.add(start, data)
+
+        hash_key = None
+        if content_key:
+            # Size plus the head and tail bytes identify a re-upload of the same file without reading all of it.
+            digest = hashlib.sha1(str(size).encode())
+            for start in sorted(remote.chunks):
+                digest.update(remote.chunks[start])
+            hash_key = "sha1:" + digest.hexdigest()
+            hit = self._cached(hash_key)
+            if hit is not None:
+                return hit
+
+        loop = asyncio.get_running_loop()
+        if ranged:
+            budget = {"left": MAX_PROBE_BYTES - sum(len(d) for d in remote.chunks.values())}
+
+            def fetch(start: int, end: int) -> bytes:
+                if end - start > budget["left"]:
+                    raise ProbeLimitExceeded(f"Probing {url} needs more than {MAX_PROBE_BYTES} bytes")
+                budget["left"] -= end - start
+                return asyncio.run_coroutine_threadsafe(self._fetch_range(session, url, start, end), loop).result()
+
+            remote.fetch = fetch
+
+        tags = await loop.run_in_executor(self.executor, self._parse, remote, url)
+        if any(validators):
+            self._remember(url, validators, tags)
+        if hash_key:
+            self._remember(hash_key, None, tags)
+        return tags
+
+    async def probe_attachment(self, session: aiohttp.ClientSession, attachment) -> dict:
+        # attachment is a discord.Attachment (anything with id, url and filename).
+        key = f"attachment:{attachment.id}"
+        hit = self._cached(key)
+        if hit is not None:
+            return hit
+        tags = await self.probe(session, attachment.url, attachment.filename or "attachment", content_key=True)
+        self._remember(key, None, tags)
+        return tags
+
+    async def probe_attachments(self, session: aiohttp.ClientSession, attachments: list) -> list:
+        return await asyncio.gather(*(self.probe_attachment(session, a) for a in attachments), return_exceptions=True)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
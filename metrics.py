@@ -0,0 +1,149 @@
+import json, threading, time, traceback
+from collections import deque
+from contextlib import contextmanager
+
+from aiohttp import web
+
+HISTOGRAM_WINDOW = 2048 # Most recent samples kept per stage for the percentiles
+
+class Histogram:
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": self.count, "sum": self.total}
+
+        def pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, max(0, round(p * len(ordered)) - 1))]
+
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": ordered[-1],
+        }
+
+class Span:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+
+histograms: dict[str, Histogram] = {}
+counters: dict[tuple[str, tuple], float] = {}
+descriptions: dict[str, tuple[str, str]] = {}
+collectors: list = []
+_lock = threading.Lock()
+
+def observe(name: str, seconds: float):
+    # Called from the voice player threads as well as the event loop.
+    with _lock:
+        hist = histograms.get(name)
+        if hist is None:
+            hist = histograms[name] = Histogram()
+        hist.observe(seconds)
+
+@contextmanager
+def span(name: str):
+    s = Span(name)
+    try:
+        yield s
+    finally:
+        observe(s.name, time.perf_counter() - s.started)
+
+def describe(name: str, kind: str, help_text: str):
+    descriptions[name] = (kind, help_text)
+
+def inc(name: str, value: float = 1, **labels: str):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        counters[key] = counters.get(key, 0) + value
+
+def register_collector(fn):
+    # fn() returns (name, labels, value) samples read at scrape time, for gauges and counters kept elsewhere.
+    collectors.append(fn)
+    return fn
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _sample(name: str, labels, value) -> str:
+    labels = dict(labels)
+    if not labels:
+        return f"{name} {float(value)}"
+    rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return f"{name}{{{rendered}}} {float(value)}"
+
+def render_prometheus(prefix: str = "musicbot_") -> str:
+    families: dict[str, list[str]] = {}
+    with _lock:
+        counter_items = list(counters.items())
+    for (name, labels), value in counter_items:
+        families.setdefault(prefix + name, []).append(_sample(prefix + name, labels, value))
+    for fn in collectors:
+        try:
+            for name, labels, value in fn():
+                families.setdefault(prefix + name, []).append(_sample(prefix + name, labels, value))
+        except Exception:
+            traceback.print_exc()
+
+    lines = []
+    for full_name, samples in families.items():
+        kind, help_text = descriptions.get(full_name[len(prefix):], ("untyped", ""))
+        if help_text:
+            lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        lines.extend(samples)
+
+    stage = prefix + "stage_seconds"
+    lines.append(f"# HELP {stage} Latency of each /play pipeline stage over the recent sample window")
+    lines.append(f"# TYPE {stage} summary")
+    for name, s in summaries().items():
+        for q in ("p50", "p95", "p99"):
+            if q in s:
+                lines.append(_sample(stage, {"stage": name, "quantile": f"0.{q[1:]}"}, s[q]))
+        lines.append(_sample(stage + "_sum", {"stage": name}, s["sum"]))
+        lines.append(_sample(stage + "_count", {"stage": name}, s["count"]))
+    return "\n".join(lines) + "\n"
+
+def summaries() -> dict[str, dict]:
+    with _lock:
+        return {name: hist.summary() for name, hist in sorted(histograms.items())}
+
+def format_summaries(names: list[str] | None = None) -> str:
+    lines = []
+    for name, s in summaries().items():
+        if (names is not None and name not in names) or "p50" not in s:
+            continue
+        lines.append(f"{name:<26} {s['p50'] * 1000:>7.0f} {s['p95'] * 1000:>7.0f} {s['p99'] * 1000:>7.0f} {s['count']:>6}")
+    if not lines:
+        return ""
+    return f"{'stage':<26} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'n':>6}\n" + "\n".join(lines)
+
+async def _latency_handler(_request: web.Request) -> web.Response:
+    return web.Response(text=json.dumps(summaries(), indent=2), content_type="application/json")
+
+async def _metrics_handler(_request: web.Request) -> web.Response:
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+def make_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/latency", _latency_handler)
+    app.router.add_get("/metrics", _metrics_handler)
+    return app
+
+async def start_http_server(host: str, port: int, app: web.Application | None = None) -> web.AppRunner:
+    runner = web.AppRunner(app or make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,90 @@
+import sys
+from collections.abc import MutableMapping
+
+class Record(MutableMapping):
+    # Dict-style access over __slots__: no per-instance dict or key strings, and unset fields read as missing keys.
+    # Keys outside FIELDS (from newer cache files and the like) go to a small overflow dict.
+    __slots__ = ("_extra",)
+    FIELDS: tuple[str, ...] = ()
+    INTERNED: frozenset[str] = frozenset()
+
+    def __init__(self, data=(), **kwargs):
+        self._extra = None
+        self.update(data, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            if key in self.INTERNED and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._field_set:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in self.FIELDS:
+            if hasattr(self, name):
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in self.FIELDS if hasattr(self, name)}
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+class CacheEntry(Record):
+    FIELDS = (
+        "keys", "url", "webpage_url", "title", "duration", "uploader",
+        "expires_at", "acodec", "abr", "hits", "last_used", "plays",
+    )
+    INTERNED = frozenset({"uploader", "acodec"})
+    __slots__ = FIELDS
+
+class QueueItem(Record):
+    FIELDS = (
+        "url", "webpage_url", "title", "duration", "uploader",
+        "expires_at", "acodec", "abr", "requester_id", "requester_avatar",
+    )
+    INTERNED = frozenset({"uploader", "acodec", "requester_avatar"})
+    __slots__ = FIELDS
@@ -0,0 +1,168 @@
+import random
+
+BLOCK_SIZE = 512 # Items per block; blocks are split at twice this
+
+class TrackQueue:
+    # A list of blocks with a Fenwick tree over the block lengths: finding, inserting or removing the item at
+    # any position is O(log n) plus one short in-block shift, and both ends stay cheap however long the queue is.
+    def __init__(self, items=()):
+        self._blocks: list[list[dict]] = []
+        self._tree: list[int] = [0]
+        self._len = 0
+        self._urls: dict[str, int] = {}
+        self.extend(items)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __bool__(self) -> bool:
+        return self._len > 0
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return list(self)[index]
+            return self._slice(start, stop)
+        bi, off = self._locate(self._normalize(index))
+        return self._blocks[bi][off]
+
+    def _normalize(self, index: int) -> int:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("queue index out of range")
+        return index
+
+    def _rebuild(self):
+        n = len(self._blocks)
+        tree = [0] * (n + 1)
+        for i, block in enumerate(self._blocks, start=1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _update(self, bi: int, delta: int):
+        i = bi + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        pos, rem = 0, index
+        step = 1 << (len(self._blocks).bit_length() - 1) if self._blocks else 0
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= rem:
+                pos = nxt
+                rem -= self._tree[nxt]
+            step >>= 1
+        return pos, rem
+
+    def _slice(self, start: int, stop: int) -> list[dict]:
+        if start >= stop:
+            return []
+        bi, off = self._locate(start)
+        out: list[dict] = []
+        while len(out) < stop - start and bi < len(self._blocks):
+            out.extend(self._blocks[bi][off:off + stop - start - len(out)])
+            bi, off = bi + 1, 0
+        return out
+
+    @staticmethod
+    def _url_of(item: dict) -> str | None:
+        return item.get("webpage_url") or item.get("url")
+
+    def _count(self, item: dict, delta: int):
+        url = self._url_of(item)
+        if not url:
+            return
+        count = self._urls.get(url, 0) + delta
+        if count > 0:
+            self._urls[url] = count
+        else:
+            self._urls.pop(url, None)
+
+    def has_url(self, url: str | None) -> bool:
+        return bool(url) and url in self._urls
+
+    def insert(self, index: int, item: dict):
+        if index < 0:
+            index = max(0, self._len + index)
+        index = min(index, self._len)
+        self._count(item, 1)
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([item])
+            self._rebuild()
+            return
+        if index == self._len - 1:
+            bi, off = len(self._blocks) - 1, len(self._blocks[-1])
+        else:
+            bi, off = self._locate(index)
+        block = self._blocks[bi]
+        block.insert(off, item)
+        if len(block) > 2 * BLOCK_SIZE:
+            self._blocks[bi:bi + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self._rebuild()
+        else:
+            self._update(bi, 1)
+
+    def append(self, item: dict):
+        self.insert(self._len, item)
+
+    def appendleft(self, item: dict):
+        self.insert(0, item)
+
+    def extend(self, items):
+        items = list(items)
+        if not items:
+            return
+        for item in items:
+            self._count(item, 1)
+        self._len += len(items)
+        if self._blocks and len(self._blocks[-1]) < BLOCK_SIZE:
+            room = BLOCK_SIZE - len(self._blocks[-1])
+            self._blocks[-1].extend(items[:room])
+            items = items[room:]
+        self._blocks.extend(items[i:i + BLOCK_SIZE] for i in range(0, len(items), BLOCK_SIZE))
+        self._rebuild()
+
+    def pop(self, index: int = -1) -> dict:
+        bi, off = self._locate(self._normalize(index))
+        block = self._blocks[bi]
+        item = block.pop(off)
+        self._len -= 1
+        self._count(item, -1)
+        if block:
+            self._update(bi, -1)
+        else:
+            del self._blocks[bi]
+            self._rebuild()
+        return item
+
+    def popleft(self) -> dict:
+        return self.pop(0)
+
+    def move(self, src: int, dst: int) -> dict:
+        item = self.pop(src)
+        self.insert(dst, item)
+        return item
+
+    def shuffle(self):
+        items = list(self)
+        random.shuffle(items)
+        self._blocks = [items[i:i + BLOCK_SIZE] for i in range(0, len(items), BLOCK_SIZE)]
+        self._rebuild()
+
+    def clear(self):
+        self._blocks = []
+        self._tree = [0]
+        self._len = 0
+        self._urls.clear()